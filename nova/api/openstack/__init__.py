@@ -20,7 +20,6 @@
 WSGI middleware for OpenStack API controllers.
 """
 
-import routes
 import webob.dec
 import webob.exc
 
@@ -77,7 +76,7 @@ class APIRouter(base_wsgi.Router):
 
     def __init__(self, ext_mgr=None):
         self.server_members = {}
-        mapper = routes.Mapper()
+        mapper = base_wsgi.IndexedMapper()
         self._setup_routes(mapper)
         super(APIRouter, self).__init__(mapper)
 
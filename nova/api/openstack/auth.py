@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
 import hashlib
 import time
 
@@ -32,11 +33,68 @@ from nova.api.openstack import faults
 
 LOG = logging.getLogger('nova.api.openstack')
 FLAGS = flags.FLAGS
+flags.DEFINE_integer('osapi_token_cache_size', 1000,
+                     'Number of validated auth tokens the OpenStack API '
+                     'keeps in memory, 0 disables the cache; does not '
+                     'apply with osapi_token_cache_memcached')
+flags.DEFINE_integer('osapi_token_cache_ttl', 300,
+                     'Seconds a validated auth token is trusted before it '
+                     'is looked up again')
+flags.DEFINE_boolean('osapi_token_cache_memcached', False,
+                     'Keep validated auth tokens in memcached_servers so '
+                     'that all API workers share them')
+
+# Tokens older than this are destroyed when they are presented
+TOKEN_LIFETIME = datetime.timedelta(days=2)
+
+
+class TokenCache(object):
+    """In-process LRU cache of validated auth tokens."""
+
+    def __init__(self, max_size, ttl):
+        self.cache = utils.LRUCache(max_size, ttl)
+
+    def get(self, token_hash):
+        return self.cache.get(token_hash)
+
+    def set(self, token_hash, auth_info, ttl):
+        self.cache.set(token_hash, auth_info, ttl)
+
+    def delete(self, token_hash):
+        self.cache.delete(token_hash)
+
+
+class MemcachedTokenCache(object):
+    """Cache of validated auth tokens shared through memcached.
+
+    max_size is ignored: memcached evicts tokens by its own memory limit.
+    """
+
+    def __init__(self, max_size, ttl):
+        if FLAGS.memcached_servers:
+            import memcache
+        else:
+            from nova import fakememcache as memcache
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
+
+    def _key(self, token_hash):
+        return 'osapi-token-%s' % token_hash
+
+    def get(self, token_hash):
+        return self.mc.get(self._key(token_hash))
+
+    def set(self, token_hash, auth_info, ttl):
+        self.mc.set(self._key(token_hash), auth_info, time=int(ttl))
+
+    def delete(self, token_hash):
+        self.mc.delete(self._key(token_hash))
 
 
 class AuthMiddleware(wsgi.Middleware):
     """Authorize the openstack API request or return an HTTP Forbidden."""
 
+    _token_cache = None
+
     def __init__(self, application, db_driver=None):
         if not db_driver:
             db_driver = FLAGS.db_driver
@@ -48,26 +106,26 @@ class AuthMiddleware(wsgi.Middleware):
     def __call__(self, req):
         if not self.has_authentication(req):
             return self.authenticate(req)
-        user = self.get_user_by_authentication(req)
-        if not user:
-            token = req.headers["X-Auth-Token"]
-            msg = _("%(user)s could not be found with token '%(token)s'")
+        token = req.headers["X-Auth-Token"]
+        auth_info = self.get_auth_info(token)
+        if not auth_info:
+            msg = _("User could not be found with token '%(token)s'")
             LOG.warn(msg % locals())
             return faults.Fault(webob.exc.HTTPUnauthorized())
 
+        user = auth_info['user']
         try:
             account = req.headers["X-Auth-Project-Id"]
         except KeyError:
             # FIXME(usrleon): It needed only for compatibility
             # while osapi clients don't use this header
-            accounts = self.auth.get_projects(user=user)
-            if accounts:
-                account = accounts[0]
+            if auth_info['project_ids']:
+                account = auth_info['project_ids'][0]
             else:
                 return faults.Fault(webob.exc.HTTPUnauthorized())
 
-        if not self.auth.is_admin(user) and \
-           not self.auth.is_project_member(user, account):
+        if not auth_info['is_admin'] and \
+           account not in auth_info['project_ids']:
             msg = _("%(user)s must be an admin or a member of %(account)s")
             LOG.warn(msg % locals())
             return faults.Fault(webob.exc.HTTPUnauthorized())
@@ -75,12 +133,71 @@ class AuthMiddleware(wsgi.Middleware):
         req.environ['nova.context'] = context.RequestContext(user, account)
         return self.application
 
+    @property
+    def token_cache(self):
+        if self._token_cache is None:
+            if FLAGS.osapi_token_cache_memcached:
+                cache_class = MemcachedTokenCache
+            else:
+                cache_class = TokenCache
+            self._token_cache = cache_class(FLAGS.osapi_token_cache_size,
+                                            FLAGS.osapi_token_cache_ttl)
+        return self._token_cache
+
     def has_authentication(self, req):
         return 'X-Auth-Token' in req.headers
 
     def get_user_by_authentication(self, req):
         return self.authorize_token(req.headers["X-Auth-Token"])
 
+    def get_auth_info(self, token_hash):
+        """Returns the user and project access granted by a token.
+
+        The result is a dict with the user, whether the user is an admin
+        and the ids of the projects the user is a member of, or None if the
+        token is unknown or has expired.  Results are cached until the
+        token expires, osapi_token_cache_ttl passes or the auth manager
+        reports a change to users, roles or projects.
+        """
+        generation = self.auth.get_generation()
+        auth_info = self.token_cache.get(token_hash)
+        if auth_info and auth_info['generation'] == generation:
+            return auth_info
+
+        ctxt = context.get_admin_context()
+        try:
+            token = self.db.auth_token_get(ctxt, token_hash)
+        except exception.NotFound:
+            token = None
+        if not token:
+            return None
+
+        expires_at = token['created_at'] + TOKEN_LIFETIME
+        if utils.utcnow() >= expires_at:
+            self.destroy_token(token_hash)
+            return None
+
+        user = self.auth.get_user(token['user_id'])
+        if not user:
+            return None
+
+        projects = self.auth.get_projects(user=user)
+        auth_info = {'user': user,
+                     'is_admin': bool(self.auth.is_admin(user)),
+                     'project_ids': [project.id for project in projects],
+                     'generation': generation}
+        remaining = expires_at - utils.utcnow()
+        ttl = min(FLAGS.osapi_token_cache_ttl,
+                  remaining.days * 86400 + remaining.seconds)
+        if ttl > 0:
+            self.token_cache.set(token_hash, auth_info, ttl)
+        return auth_info
+
+    def destroy_token(self, token_hash):
+        """Removes a token from the datastore and the token cache."""
+        self.token_cache.delete(token_hash)
+        self.db.auth_token_destroy(context.get_admin_context(), token_hash)
+
     def authenticate(self, req):
         # Unless the request is explicitly made against /<version>/ don't
         # honor it
@@ -123,17 +240,9 @@ class AuthMiddleware(wsgi.Middleware):
         This method will also remove the token if the timestamp is older than
         2 days ago.
         """
-        ctxt = context.get_admin_context()
-        try:
-            token = self.db.auth_token_get(ctxt, token_hash)
-        except exception.NotFound:
-            return None
-        if token:
-            delta = utils.utcnow() - token['created_at']
-            if delta.days >= 2:
-                self.db.auth_token_destroy(ctxt, token['token_hash'])
-            else:
-                return self.auth.get_user(token['user_id'])
+        auth_info = self.get_auth_info(token_hash)
+        if auth_info:
+            return auth_info['user']
         return None
 
     def _authorize_user(self, username, key, req):
@@ -76,6 +76,13 @@ def limited(items, request, max_limit=FLAGS.osapi_max_limit):
                     will cause exc.HTTPBadRequest() exceptions to be raised.
     @kwarg max_limit: The maximum number of items to return from 'items'
     """
+    offset, limit = get_offset_and_limit(request, max_limit)
+    range_end = offset + limit
+    return items[offset:range_end]
+
+
+def get_offset_and_limit(request, max_limit=FLAGS.osapi_max_limit):
+    """Return the validated (offset, limit) tuple used by `limited`."""
     try:
         offset = int(request.GET.get('offset', 0))
     except ValueError:
@@ -97,18 +104,19 @@ def limited(items, request, max_limit=FLAGS.osapi_max_limit):
         raise webob.exc.HTTPBadRequest(explanation=msg)
 
     limit = min(max_limit, limit or max_limit)
-    range_end = offset + limit
-    return items[offset:range_end]
+    return offset, limit
 
 
-def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
-    """Return a slice of items according to the requested marker and limit."""
+def get_marker_and_limit(request, max_limit=FLAGS.osapi_max_limit):
+    """Return the (marker, limit) tuple used by `limited_by_marker`."""
     params = get_pagination_params(request)
+    limit = min(max_limit, params.get('limit', max_limit))
+    return params.get('marker'), limit
 
-    limit = params.get('limit', max_limit)
-    marker = params.get('marker')
 
-    limit = min(max_limit, limit)
+def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
+    """Return a slice of items according to the requested marker and limit."""
+    marker, limit = get_marker_and_limit(request, max_limit)
     start_index = 0
     if marker:
         start_index = -1
@@ -117,6 +117,27 @@ class ExtensionDescriptor(object):
         return request_exts
 
 
+class RouteApplication(object):
+    """Calls the controller of a route with the action of that route.
+
+    Lets the controllers of extended requests and actions call the
+    controller of the resource they extend directly, instead of routing
+    the request again.
+
+    """
+
+    def __init__(self, controller, action):
+        self.controller = controller
+        self.action = action
+
+    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        url, args = req.environ['wsgiorg.routing_args']
+        args = dict(args, controller=self.controller, action=self.action)
+        req.environ['wsgiorg.routing_args'] = (url, args)
+        return self.controller
+
+
 class ActionExtensionController(object):
     def __init__(self, application):
         self.application = application
@@ -213,12 +234,29 @@ class ExtensionMiddleware(base_wsgi.Middleware):
             return cls(app, **local_config)
         return _factory
 
+    def _route_app(self, application, routepath, method):
+        """Return the application handling routepath for method.
+
+        When application is a router with a route for routepath, that is
+        the controller of the route, else application itself.
+
+        """
+        if isinstance(application, base_wsgi.Router):
+            for route in application.map.matchlist:
+                if (route.routepath == routepath and
+                    base_wsgi.IndexedMapper.allows(route, method)):
+                    return RouteApplication(route.defaults['controller'],
+                                            route.defaults['action'])
+        return application
+
     def _action_ext_resources(self, application, ext_mgr, mapper):
         """Return a dict of ActionExtensionResource-s by collection."""
         action_resources = {}
         for action in ext_mgr.get_actions():
             if not action.collection in action_resources.keys():
-                resource = ActionExtensionResource(application)
+                resource = ActionExtensionResource(self._route_app(
+                        application, "/%s/:(id)/action" % action.collection,
+                        'POST'))
                 mapper.connect("/%s/:(id)/action.:(format)" %
                                 action.collection,
                                 action='action',
@@ -237,7 +275,8 @@ class ExtensionMiddleware(base_wsgi.Middleware):
         request_ext_resources = {}
         for req_ext in ext_mgr.get_request_extensions():
             if not req_ext.key in request_ext_resources.keys():
-                resource = RequestExtensionResource(application)
+                resource = RequestExtensionResource(self._route_app(
+                        application, req_ext.url_route, req_ext.method))
                 mapper.connect(req_ext.url_route + '.:(format)',
                                 action='process',
                                 controller=resource,
@@ -257,7 +296,7 @@ class ExtensionMiddleware(base_wsgi.Middleware):
             ext_mgr = ExtensionManager(FLAGS.osapi_extensions_path)
         self.ext_mgr = ext_mgr
 
-        mapper = routes.Mapper()
+        mapper = base_wsgi.IndexedMapper()
 
         serializer = wsgi.ResponseSerializer(
             {'application/xml': ExtensionsXMLSerializer()})
@@ -288,6 +327,11 @@ class ExtensionMiddleware(base_wsgi.Middleware):
             controller = req_controllers[request_ext.key]
             controller.add_handler(request_ext.handler)
 
+        # The routes of a router follow the extended ones, so that each
+        # request is matched once, and dispatched to its controller here
+        if isinstance(application, base_wsgi.Router):
+            mapper.merge(application.map)
+
         self._router = routes.middleware.RoutesMiddleware(self._dispatch,
                                                           mapper)
 
@@ -443,6 +487,7 @@ class RequestExtension(object):
     def __init__(self, method, url_route, handler):
         self.url_route = url_route
         self.handler = handler
+        self.method = method
         self.conditions = dict(method=[method])
         self.key = "%s-%s" % (method, url_route)
 
@@ -17,7 +17,6 @@
 Module dedicated functions/classes dealing with rate limiting requests.
 """
 
-import copy
 import httplib
 import json
 import math
@@ -27,10 +26,10 @@ import urllib
 import webob.exc
 from xml.dom import minidom
 
-from collections import defaultdict
-
 from webob.dec import wsgify
 
+from nova import flags
+from nova import log as logging
 from nova import quota
 from nova import utils
 from nova import wsgi as base_wsgi
@@ -40,6 +39,12 @@ from nova.api.openstack.views import limits as limits_views
 from nova.api.openstack import wsgi
 
 
+LOG = logging.getLogger('nova.api.openstack.limits')
+FLAGS = flags.FLAGS
+flags.DEFINE_boolean('osapi_rate_limit_memcached', False,
+                     'Keep the rate limit counters in memcached_servers so '
+                     'that the limits hold across all API workers')
+
 # Convenience constants for the limits dictionary passed to Limiter().
 PER_SECOND = 1
 PER_MINUTE = 60
@@ -58,7 +63,13 @@ class LimitsController(object):
         """
         context = req.environ['nova.context']
         abs_limits = quota.get_project_quotas(context, context.project_id)
-        rate_limits = req.environ.get("nova.limits", [])
+        rate_limits = req.environ.get("nova.limits")
+        if rate_limits is None:
+            limiter = req.environ.get("nova.limiter")
+            if limiter is not None:
+                rate_limits = limiter.get_limits(context.user_id)
+            else:
+                rate_limits = []
 
         builder = self._get_view_builder(req)
         return builder.build(rate_limits, abs_limits)
@@ -218,32 +229,55 @@ class Limit(object):
         if self.verb != verb or not re.match(self.regex, url):
             return
 
-        now = self._get_time()
+        state, delay = self.leak(self.get_state(), self._get_time())
+        (self.water_level, self.last_request,
+         self.next_request, self.remaining) = state
+        return delay
+
+    def new_state(self):
+        """Return the state of a limit no request was made to yet."""
+        return (0, None, None, self.value)
 
-        if self.last_request is None:
-            self.last_request = now
+    def get_state(self):
+        """Return the state kept in this limit."""
+        return (self.water_level, self.last_request,
+                self.next_request, self.remaining)
+
+    def leak(self, state, now):
+        """
+        Record a request made at `now` in a state of this limit.
+
+        @param state: Tuple of water level, time of the last request, time
+                      the next request can be made and remaining requests,
+                      or None if no request was made yet
+        @param now: Time of the request
+        @return: Tuple of the new state and the delay of the request, or
+                 None if it is not delayed
+        """
+        if state is None:
+            state = self.new_state()
+        water_level, last_request, next_request, remaining = state
 
-        leak_value = now - self.last_request
+        if last_request is None:
+            last_request = now
 
-        self.water_level -= leak_value
-        self.water_level = max(self.water_level, 0)
-        self.water_level += self.request_value
+        leak_value = now - last_request
 
-        difference = self.water_level - self.capacity
+        water_level -= leak_value
+        water_level = max(water_level, 0)
+        water_level += self.request_value
 
-        self.last_request = now
+        difference = water_level - self.capacity
 
         if difference > 0:
-            self.water_level -= self.request_value
-            self.next_request = now + difference
-            return difference
+            water_level -= self.request_value
+            return (water_level, now, now + difference, remaining), difference
 
         cap = self.capacity
-        water = self.water_level
         val = self.value
 
-        self.remaining = math.floor(((cap - water) / cap) * val)
-        self.next_request = now
+        remaining = math.floor(((cap - water_level) / cap) * val)
+        return (water_level, now, now, remaining), None
 
     def _get_time(self):
         """Retrieve the current time. Broken out for testability."""
@@ -253,16 +287,24 @@ class Limit(object):
         """Display the string name of the unit."""
         return self.UNITS.get(self.unit, "UNKNOWN")
 
-    def display(self):
-        """Return a useful representation of this class."""
+    def display(self, state=None):
+        """
+        Return a useful representation of this class.
+
+        @param state: State of this limit to show, by default the state
+                      kept in this limit
+        """
+        if state is None:
+            state = self.get_state()
+        water_level, last_request, next_request, remaining = state
         return {
             "verb": self.verb,
             "URI": self.uri,
             "regex": self.regex,
             "value": self.value,
-            "remaining": int(self.remaining),
+            "remaining": int(remaining),
             "unit": self.display_unit(),
-            "resetTime": int(self.next_request or self._get_time()),
+            "resetTime": int(next_request or self._get_time()),
         }
 
 # "Limit" format is a dictionary with the HTTP verb, human-readable URI,
@@ -279,8 +321,8 @@ DEFAULT_LIMITS = [
 
 class RateLimitingMiddleware(base_wsgi.Middleware):
     """
-    Rate-limits requests passing through this middleware. All limit information
-    is stored in memory for this implementation.
+    Rate-limits requests passing through this middleware. Limit information
+    is stored in memory, or in memcached if osapi_rate_limit_memcached is set.
     """
 
     def __init__(self, application, limits=None, limiter=None, **kwargs):
@@ -334,14 +376,84 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
             retry = time.time() + delay
             return faults.OverLimitFault(msg, error, retry)
 
-        req.environ["nova.limits"] = self._limiter.get_limits(username)
+        # The limits are only shown by the limits resource, which asks
+        # the limiter for them
+        req.environ["nova.limiter"] = self._limiter
 
         return self.application
 
 
+class LimitStore(object):
+    """
+    Store of the state of each limit of each user, in memory.
+    """
+
+    def __init__(self):
+        self.states = {}
+
+    def get(self, key):
+        """
+        Return the state stored at `key`, or None.
+        """
+        return self.states.get(key)
+
+    def update(self, key, update, ttl):
+        """
+        Atomically replace the state stored at `key`.
+
+        @param update: Function of the stored state, or None, returning
+                       the new state and a result
+        @param ttl: Seconds after which the state may be forgotten
+        @return: The result returned by `update`
+        """
+        state, result = update(self.states.get(key))
+        self.states[key] = state
+        return result
+
+
+class MemcachedLimitStore(LimitStore):
+    """
+    Store of the state of each limit of each user shared through memcached,
+    so that every API worker enforces the same limits.
+    """
+
+    # Times an update is retried when another worker updated the state
+    # between reading and writing it
+    max_retries = 10
+
+    def __init__(self):
+        if FLAGS.memcached_servers:
+            import memcache
+        else:
+            from nova import fakememcache as memcache
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0,
+                                  cache_cas=True)
+
+    def _key(self, key):
+        return 'osapi-ratelimit-%s' % urllib.quote(utils.utf8(key))
+
+    def get(self, key):
+        return self.mc.get(self._key(key))
+
+    def update(self, key, update, ttl):
+        key = self._key(key)
+        for attempt in xrange(self.max_retries):
+            stored = self.mc.gets(key)
+            state, result = update(stored)
+            if stored is None:
+                updated = self.mc.add(key, state, time=int(ttl))
+            else:
+                updated = self.mc.cas(key, state, time=int(ttl))
+            if updated:
+                return result
+        LOG.warn(_("Gave up updating rate limit %(key)s after "
+                   "%(attempt)d conflicting updates"), locals())
+        return result
+
+
 class Limiter(object):
     """
-    Rate-limit checking class which handles limits in memory.
+    Rate-limit checking class which handles limits in a `LimitStore`.
     """
 
     def __init__(self, limits, **kwargs):
@@ -350,8 +462,10 @@ class Limiter(object):
 
         @param limits: List of `Limit` objects
         """
-        self.limits = copy.deepcopy(limits)
-        self.levels = defaultdict(lambda: copy.deepcopy(limits))
+        # The limits are only read, and shared by every user without
+        # limits of their own; the state of each user is in the store.
+        self.limits = list(limits)
+        self.levels = {}
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
@@ -359,11 +473,38 @@ class Limiter(object):
                 username = key[5:]
                 self.levels[username] = self.parse_limits(value)
 
+        self._verbs = self._limits_by_verb(self.limits)
+        self._user_verbs = dict((username, self._limits_by_verb(limits))
+                                for username, limits in self.levels.items())
+
+        if FLAGS.osapi_rate_limit_memcached:
+            self.store = MemcachedLimitStore()
+        else:
+            self.store = LimitStore()
+
+    @staticmethod
+    def _limits_by_verb(limits):
+        """
+        Return the (index, limit, match) tuples of the limits of each verb,
+        with match the compiled regex of the limit.
+        """
+        verbs = {}
+        for index, limit in enumerate(limits):
+            match = re.compile(limit.regex).match
+            verbs.setdefault(limit.verb, []).append((index, limit, match))
+        return verbs
+
+    def _key(self, username, index):
+        return '%s:%d' % (username, index)
+
     def get_limits(self, username=None):
         """
         Return the limits for a given user.
         """
-        return [limit.display() for limit in self.levels[username]]
+        limits = self.levels.get(username, self.limits)
+        return [limit.display(self.store.get(self._key(username, index)) or
+                              limit.new_state())
+                for index, limit in enumerate(limits)]
 
     def check_for_delay(self, verb, url, username=None):
         """
@@ -373,8 +514,14 @@ class Limiter(object):
         """
         delays = []
 
-        for limit in self.levels[username]:
-            delay = limit(verb, url)
+        verbs = self._user_verbs.get(username, self._verbs)
+        for index, limit, match in verbs.get(verb, ()):
+            if not match(url):
+                continue
+            now = limit._get_time()
+            delay = self.store.update(self._key(username, index),
+                                      lambda state: limit.leak(state, now),
+                                      limit.unit)
             if delay:
                 delays.append((delay, limit.error_message))
 
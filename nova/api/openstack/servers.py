@@ -66,14 +66,52 @@ class Controller(object):
         return servers
 
     def _build_view(self, req, instance, is_detail=False):
+        builder = self._get_view_builder(req)
+        return builder.build(instance, is_detail=is_detail)
+
+    def _get_view_builder(self, req, lookup_cache=None):
         raise NotImplementedError()
 
+    def _get_lookup_cache(self):
+        return nova.api.openstack.views.servers.LookupCache(self.compute_api)
+
     def _limit_items(self, items, req):
         raise NotImplementedError()
 
+    def _get_paging_params(self, req):
+        """Return the paging arguments to pass to compute_api.get_all."""
+        raise NotImplementedError()
+
     def _action_rebuild(self, info, request, instance_id):
         raise NotImplementedError()
 
+    def _get_filters(self, req):
+        """Return the database filters given in the query string."""
+        query_str = req.str_GET
+        filters = {}
+
+        if 'name' in query_str:
+            filters['display_name'] = query_str['name']
+
+        if 'status' in query_str:
+            status = query_str['status'].upper()
+            states = nova.api.openstack.views.servers.power_states_for_status(
+                    status)
+            if not states:
+                msg = _('Invalid server status: %s') % query_str['status']
+                raise exc.HTTPBadRequest(explanation=msg)
+            filters['state'] = states
+
+        if 'changes-since' in query_str:
+            try:
+                filters['changes-since'] = utils.parse_isotime(
+                        query_str['changes-since'])
+            except ValueError:
+                msg = _('Invalid changes-since value')
+                raise exc.HTTPBadRequest(explanation=msg)
+
+        return filters
+
     def _items(self, req, is_detail):
         """Returns a list of servers for a given user.
 
@@ -84,14 +122,37 @@ class Controller(object):
         project_id = query_str.get('project_id')
         fixed_ip = query_str.get('fixed_ip')
         recurse_zones = utils.bool_from_str(query_str.get('recurse_zones'))
-        instance_list = self.compute_api.get_all(
-                req.environ['nova.context'],
-                reservation_id=reservation_id,
-                project_id=project_id,
-                fixed_ip=fixed_ip,
-                recurse_zones=recurse_zones)
-        limited_list = self._limit_items(instance_list, req)
-        servers = [self._build_view(req, inst, is_detail)['server']
+        filters = self._get_filters(req)
+
+        if reservation_id or fixed_ip or recurse_zones:
+            # These results are not paged by the database and may include
+            # servers from child zones, so they are sliced here instead.
+            instance_list = self.compute_api.get_all(
+                    req.environ['nova.context'],
+                    reservation_id=reservation_id,
+                    project_id=project_id,
+                    fixed_ip=fixed_ip,
+                    recurse_zones=recurse_zones,
+                    filters=filters)
+            limited_list = self._limit_items(instance_list, req)
+        else:
+            paging_params = self._get_paging_params(req)
+            try:
+                limited_list = self.compute_api.get_all(
+                        req.environ['nova.context'],
+                        project_id=project_id,
+                        filters=filters,
+                        detailed=is_detail,
+                        **paging_params)
+            except exception.MarkerNotFound:
+                msg = _('marker [%s] not found') % paging_params['marker']
+                raise exc.HTTPBadRequest(explanation=msg)
+
+        lookup_cache = self._get_lookup_cache()
+        if is_detail:
+            lookup_cache.prefetch_finished_migrations(limited_list)
+        builder = self._get_view_builder(req, lookup_cache)
+        servers = [builder.build(inst, is_detail)['server']
                 for inst in limited_list]
         return dict(servers=servers)
 
@@ -423,14 +484,18 @@ class ControllerV10(Controller):
     def _flavor_id_from_req_data(self, data):
         return data['server']['flavorId']
 
-    def _build_view(self, req, instance, is_detail=False):
+    def _get_view_builder(self, req, lookup_cache=None):
         addresses = nova.api.openstack.views.addresses.ViewBuilderV10()
-        builder = nova.api.openstack.views.servers.ViewBuilderV10(addresses)
-        return builder.build(instance, is_detail=is_detail)
+        return nova.api.openstack.views.servers.ViewBuilderV10(addresses,
+                lookup_cache or self._get_lookup_cache())
 
     def _limit_items(self, items, req):
         return common.limited(items, req)
 
+    def _get_paging_params(self, req):
+        offset, limit = common.get_offset_and_limit(req)
+        return dict(offset=offset, limit=limit)
+
     def _parse_update(self, context, server_id, inst_dict, update_dict):
         if 'adminPass' in inst_dict['server']:
             self.compute_api.set_admin_password(context, server_id,
@@ -497,17 +562,16 @@ class ControllerV11(Controller):
 
         return common.get_id_from_href(flavor_ref)
 
-    def _build_view(self, req, instance, is_detail=False):
+    def _get_view_builder(self, req, lookup_cache=None):
         base_url = req.application_url
         flavor_builder = nova.api.openstack.views.flavors.ViewBuilderV11(
             base_url)
         image_builder = nova.api.openstack.views.images.ViewBuilderV11(
             base_url)
         addresses_builder = nova.api.openstack.views.addresses.ViewBuilderV11()
-        builder = nova.api.openstack.views.servers.ViewBuilderV11(
-            addresses_builder, flavor_builder, image_builder, base_url)
-
-        return builder.build(instance, is_detail=is_detail)
+        return nova.api.openstack.views.servers.ViewBuilderV11(
+            addresses_builder, flavor_builder, image_builder, base_url,
+            lookup_cache or self._get_lookup_cache())
 
     def _action_change_password(self, input_dict, req, id):
         context = req.environ['nova.context']
@@ -525,6 +589,10 @@ class ControllerV11(Controller):
     def _limit_items(self, items, req):
         return common.limited_by_marker(items, req)
 
+    def _get_paging_params(self, req):
+        marker, limit = common.get_marker_and_limit(req)
+        return dict(marker=marker, limit=limit)
+
     def _validate_metadata(self, metadata):
         """Ensure that we can work with the metadata given."""
         try:
@@ -30,6 +30,70 @@ from nova.api.openstack.views import images as images_view
 from nova import utils
 
 
+# Maps instance power states to the server status reported by the API
+POWER_STATE_STATUS = {
+    None: 'BUILD',
+    power_state.NOSTATE: 'BUILD',
+    power_state.RUNNING: 'ACTIVE',
+    power_state.BLOCKED: 'ACTIVE',
+    power_state.SUSPENDED: 'SUSPENDED',
+    power_state.PAUSED: 'PAUSED',
+    power_state.SHUTDOWN: 'SHUTDOWN',
+    power_state.SHUTOFF: 'SHUTOFF',
+    power_state.CRASHED: 'ERROR',
+    power_state.FAILED: 'ERROR',
+    power_state.BUILDING: 'BUILD',
+}
+
+
+def power_states_for_status(status):
+    """Return the power states that are reported as the given status."""
+    return [state for state, state_status in POWER_STATE_STATUS.iteritems()
+            if state_status == status]
+
+
+class LookupCache(object):
+    """Request scoped cache for the lookups made while building servers.
+
+    Server listings call prefetch_finished_migrations() with every instance
+    they are about to render so that the status of each server does not
+    need a query of its own.  Sub-resource views shared by many servers,
+    such as flavors and images, are built once per key with memoize().
+
+    """
+
+    def __init__(self, compute_api=None):
+        self.compute_api = compute_api or nova.compute.API()
+        self.context = nova.context.get_admin_context()
+        self._checked_uuids = set()
+        self._finished_migrations = set()
+        self._views = {}
+
+    def prefetch_finished_migrations(self, instances):
+        uuids = [inst['uuid'] for inst in instances
+                 if not inst.get('_is_precooked', False)]
+        finished = self.compute_api.get_finished_migrations(self.context,
+                                                            uuids)
+        self._finished_migrations.update(finished)
+        self._checked_uuids.update(uuids)
+
+    def has_finished_migration(self, instance_uuid):
+        if instance_uuid not in self._checked_uuids:
+            if self.compute_api.has_finished_migration(self.context,
+                                                       instance_uuid):
+                self._finished_migrations.add(instance_uuid)
+            self._checked_uuids.add(instance_uuid)
+        return instance_uuid in self._finished_migrations
+
+    def memoize(self, kind, key, build):
+        """Return the view cached for (kind, key), calling build() once."""
+        try:
+            return self._views[(kind, key)]
+        except KeyError:
+            view = self._views[(kind, key)] = build()
+            return view
+
+
 class ViewBuilder(object):
     """Model a server response as a python dictionary.
 
@@ -38,8 +102,9 @@ class ViewBuilder(object):
 
     """
 
-    def __init__(self, addresses_builder):
+    def __init__(self, addresses_builder, lookup_cache=None):
         self.addresses_builder = addresses_builder
+        self.lookup_cache = lookup_cache or LookupCache()
 
     def build(self, inst, is_detail):
         """Return a dict that represenst a server."""
@@ -61,29 +126,12 @@ class ViewBuilder(object):
 
     def _build_detail(self, inst):
         """Returns a detailed model of a server."""
-        power_mapping = {
-            None: 'BUILD',
-            power_state.NOSTATE: 'BUILD',
-            power_state.RUNNING: 'ACTIVE',
-            power_state.BLOCKED: 'ACTIVE',
-            power_state.SUSPENDED: 'SUSPENDED',
-            power_state.PAUSED: 'PAUSED',
-            power_state.SHUTDOWN: 'SHUTDOWN',
-            power_state.SHUTOFF: 'SHUTOFF',
-            power_state.CRASHED: 'ERROR',
-            power_state.FAILED: 'ERROR',
-            power_state.BUILDING: 'BUILD',
-        }
-
         inst_dict = {
             'id': inst['id'],
             'name': inst['display_name'],
-            'status': power_mapping[inst.get('state')]}
-
-        ctxt = nova.context.get_admin_context()
-        compute_api = nova.compute.API()
+            'status': POWER_STATE_STATUS[inst.get('state')]}
 
-        if compute_api.has_finished_migration(ctxt, inst['uuid']):
+        if self.lookup_cache.has_finished_migration(inst['uuid']):
             inst_dict['status'] = 'RESIZE-CONFIRM'
 
         # Return the metadata as a dictionary
@@ -142,8 +190,8 @@ class ViewBuilderV10(ViewBuilder):
 class ViewBuilderV11(ViewBuilder):
     """Model an Openstack API V1.0 server response."""
     def __init__(self, addresses_builder, flavor_builder, image_builder,
-                 base_url):
-        ViewBuilder.__init__(self, addresses_builder)
+                 base_url, lookup_cache=None):
+        ViewBuilder.__init__(self, addresses_builder, lookup_cache)
         self.flavor_builder = flavor_builder
         self.image_builder = image_builder
         self.base_url = base_url
@@ -164,32 +212,40 @@ class ViewBuilderV11(ViewBuilder):
     def _build_image(self, response, inst):
         if 'image_ref' in dict(inst):
             image_href = inst['image_ref']
-            image_id = str(common.get_id_from_href(image_href))
-            _bookmark = self.image_builder.generate_bookmark(image_id)
-            response['image'] = {
-                "id": image_id,
-                "links": [
-                    {
-                        "rel": "bookmark",
-                        "href": _bookmark,
-                    },
-                ]
-            }
+            response['image'] = self.lookup_cache.memoize('image',
+                    image_href, lambda: self._build_image_view(image_href))
+
+    def _build_image_view(self, image_href):
+        image_id = str(common.get_id_from_href(image_href))
+        _bookmark = self.image_builder.generate_bookmark(image_id)
+        return {
+            "id": image_id,
+            "links": [
+                {
+                    "rel": "bookmark",
+                    "href": _bookmark,
+                },
+            ]
+        }
 
     def _build_flavor(self, response, inst):
         if "instance_type" in dict(inst):
             flavor_id = inst["instance_type"]['flavorid']
-            flavor_ref = self.flavor_builder.generate_href(flavor_id)
-            flavor_bookmark = self.flavor_builder.generate_bookmark(flavor_id)
-            response["flavor"] = {
-                "id": str(common.get_id_from_href(flavor_ref)),
-                "links": [
-                    {
-                        "rel": "bookmark",
-                        "href": flavor_bookmark,
-                    },
-                ]
-            }
+            response["flavor"] = self.lookup_cache.memoize('flavor',
+                    flavor_id, lambda: self._build_flavor_view(flavor_id))
+
+    def _build_flavor_view(self, flavor_id):
+        flavor_ref = self.flavor_builder.generate_href(flavor_id)
+        flavor_bookmark = self.flavor_builder.generate_bookmark(flavor_id)
+        return {
+            "id": str(common.get_id_from_href(flavor_ref)),
+            "links": [
+                {
+                    "rel": "bookmark",
+                    "href": flavor_bookmark,
+                },
+            ]
+        }
 
     def _build_addresses(self, response, inst):
         interfaces = inst.get('virtual_interfaces', [])
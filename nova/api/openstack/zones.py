@@ -190,6 +190,9 @@ def create_resource(version):
         "attributes": {
             "zone": ["id", "api_url", "name", "capabilities"],
         },
+        "dict_collections": {
+            "latency": {"item_name": "bucket", "item_key": "le"},
+        },
     }
 
     body_serializers = {
@@ -30,6 +30,8 @@ import sys
 from nova import exception
 from nova import flags
 from nova import log as logging
+from nova import utils
+from nova.auth import manager
 
 
 FLAGS = flags.FLAGS
@@ -52,6 +54,12 @@ flags.DEFINE_string('ldap_project_subtree', 'ou=Groups,dc=example,dc=com',
                     'OU for Projects')
 flags.DEFINE_string('role_project_subtree', 'ou=Groups,dc=example,dc=com',
                     'OU for Roles')
+flags.DEFINE_integer('ldap_pool_size', 5,
+                     'Number of idle LDAP connections kept for reuse')
+flags.DEFINE_integer('ldap_search_cache_size', 1000,
+                     'Number of LDAP search results cached between requests')
+flags.DEFINE_integer('ldap_search_cache_ttl', 30,
+                     'Seconds to cache LDAP search results, 0 disables')
 
 # NOTE(vish): mapping with these flags is necessary because we're going
 #             to tie in to an existing ldap schema
@@ -90,6 +98,13 @@ def _clean(attr):
     return attr
 
 
+def _copy_results(results):
+    """Copy search results so that callers may change them"""
+    return [(dn, dict((key, list(values))
+                      for key, values in attributes.iteritems()))
+            for dn, attributes in results]
+
+
 def sanitize(fn):
     """Decorator to sanitize all args"""
     @functools.wraps(fn)
@@ -130,16 +145,58 @@ class LDAPWrapper(object):
             self.conn = None
             raise
 
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.unbind_s()
+        except self.ldap.SERVER_DOWN:
+            pass
+        self.conn = None
+
     search_s = __wrap_reconnect(lambda conn: conn.search_s)
     add_s = __wrap_reconnect(lambda conn: conn.add_s)
     delete_s = __wrap_reconnect(lambda conn: conn.delete_s)
     modify_s = __wrap_reconnect(lambda conn: conn.modify_s)
 
 
+class LDAPConnectionPool(object):
+    """Hands out LDAPWrapper connections and keeps them bound for reuse.
+
+    At most max_idle connections are kept, extra ones are closed when they
+    are returned.
+    """
+
+    def __init__(self, ldap, url, user, password, max_idle):
+        self.ldap = ldap
+        self.url = url
+        self.user = user
+        self.password = password
+        self.max_idle = max_idle
+        self.idle = []
+
+    def get(self):
+        if self.idle:
+            return self.idle.pop()
+        return LDAPWrapper(self.ldap, self.url, self.user, self.password)
+
+    def put(self, conn):
+        if len(self.idle) < self.max_idle:
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+
 class LdapDriver(object):
     """Ldap Auth driver
 
     Defines enter and exit and therefore supports the with/as syntax.
+    Each with block borrows a connection from a shared pool.
+
+    Search results are cached between requests for ldap_search_cache_ttl
+    seconds.  The cache is cleared by every write made through the driver
+    and whenever the auth generation kept in memcache by AuthManager
+    changes, so writes from other processes are seen as well.
     """
 
     project_pattern = '(owner=*)'
@@ -147,6 +204,9 @@ class LdapDriver(object):
     project_attribute = 'owner'
     project_objectclass = 'groupOfNames'
     conn = None
+    pool = None
+    search_cache = None
+    generation = None
     mc = None
 
     def __init__(self):
@@ -158,20 +218,32 @@ class LdapDriver(object):
             LdapDriver.project_attribute = 'projectManager'
             LdapDriver.project_objectclass = 'novaProject'
         self.__cache = None
-        if LdapDriver.conn is None:
-            LdapDriver.conn = LDAPWrapper(self.ldap, FLAGS.ldap_url,
-                                          FLAGS.ldap_user_dn,
-                                          FLAGS.ldap_password)
+        if LdapDriver.pool is None:
+            LdapDriver.pool = LDAPConnectionPool(self.ldap, FLAGS.ldap_url,
+                                                 FLAGS.ldap_user_dn,
+                                                 FLAGS.ldap_password,
+                                                 FLAGS.ldap_pool_size)
+        if LdapDriver.search_cache is None:
+            LdapDriver.search_cache = utils.LRUCache(
+                    FLAGS.ldap_search_cache_size)
         if LdapDriver.mc is None:
             LdapDriver.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
 
     def __enter__(self):
         # TODO(yorik-sar): Should be per-request cache, not per-driver-request
         self.__cache = {}
+        self.conn = LdapDriver.pool.get()
+        # AuthManager bumps this key in memcache after any auth change
+        generation = self.mc.get(manager.AuthManager.generation_key)
+        if generation != LdapDriver.generation:
+            LdapDriver.search_cache.clear()
+            LdapDriver.generation = generation
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.__cache = None
+        LdapDriver.pool.put(self.conn)
+        self.conn = None
         return False
 
     def __local_cache(key_fmt):  # pylint: disable=E0213
@@ -234,8 +306,10 @@ class LdapDriver(object):
     @sanitize
     def get_users(self):
         """Retrieve list of users"""
+        # Listing every user is rare and large, so keep it out of the
+        # search cache
         attrs = self.__find_objects(FLAGS.ldap_user_subtree,
-                                    '(objectclass=novaUser)')
+                                    '(objectclass=novaUser)', cache=False)
         users = []
         for attr in attrs:
             user = self.__to_user(attr)
@@ -285,7 +359,7 @@ class LdapDriver(object):
                     attr.append((self.ldap.MOD_ADD,
                                  LdapDriver.isadmin_attribute,
                                  [str(is_admin).upper()]))
-                self.conn.modify_s(self.__uid_to_dn(name), attr)
+                self.__modify_s(self.__uid_to_dn(name), attr)
                 return self.get_user(name)
             else:
                 raise exception.LDAPUserNotFound(user_id=name)
@@ -303,7 +377,7 @@ class LdapDriver(object):
                 ('accessKey', [access_key]),
                 (LdapDriver.isadmin_attribute, [str(is_admin).upper()]),
             ]
-            self.conn.add_s(self.__uid_to_dn(name), attr)
+            self.__add_s(self.__uid_to_dn(name), attr)
             return self.__to_user(dict(attr))
 
     @sanitize
@@ -334,7 +408,7 @@ class LdapDriver(object):
             (LdapDriver.project_attribute, [manager_dn]),
             ('member', members)]
         dn = self.__project_to_dn(name, search=False)
-        self.conn.add_s(dn, attr)
+        self.__add_s(dn, attr)
         return self.__to_project(dict(attr))
 
     @sanitize
@@ -352,7 +426,7 @@ class LdapDriver(object):
         if description:
             attr.append((self.ldap.MOD_REPLACE, 'description', description))
         dn = self.__project_to_dn(project_id)
-        self.conn.modify_s(dn, attr)
+        self.__modify_s(dn, attr)
         if not self.is_in_project(manager_uid, project_id):
             self.add_to_project(manager_uid, project_id)
 
@@ -442,10 +516,10 @@ class LdapDriver(object):
                 attr.append((self.ldap.MOD_DELETE,
                              LdapDriver.isadmin_attribute,
                              user[LdapDriver.isadmin_attribute]))
-            self.conn.modify_s(self.__uid_to_dn(uid), attr)
+            self.__modify_s(self.__uid_to_dn(uid), attr)
         else:
             # Delete entry
-            self.conn.delete_s(self.__uid_to_dn(uid))
+            self.__delete_s(self.__uid_to_dn(uid))
 
     @sanitize
     def delete_project(self, project_id):
@@ -467,7 +541,7 @@ class LdapDriver(object):
         if admin is not None:
             attr.append((self.ldap.MOD_REPLACE, LdapDriver.isadmin_attribute,
                          str(admin).upper()))
-        self.conn.modify_s(self.__uid_to_dn(uid), attr)
+        self.__modify_s(self.__uid_to_dn(uid), attr)
 
     def __user_exists(self, uid):
         """Check if user exists"""
@@ -489,6 +563,41 @@ class LdapDriver(object):
                  (FLAGS.ldap_user_id_attribute, uid))
         return self.__find_object(dn, query)
 
+    def __search(self, dn, scope, query, cache=True):
+        """Search ldap, using the search cache if cache is True"""
+        ttl = FLAGS.ldap_search_cache_ttl
+        cache = cache and ttl > 0
+        key = (dn, scope, query)
+        if cache:
+            res = LdapDriver.search_cache.get(key)
+            if res is not None:
+                return _copy_results(res)
+        try:
+            res = self.conn.search_s(dn, scope, query)
+        except self.ldap.NO_SUCH_OBJECT:
+            res = []
+        if cache:
+            LdapDriver.search_cache.set(key, _copy_results(res), ttl=ttl)
+        return res
+
+    def __invalidate(self):
+        """Forget cached lookups after a write"""
+        LdapDriver.search_cache.clear()
+        if self.__cache is not None:
+            self.__cache = {}
+
+    def __add_s(self, dn, attr):
+        self.conn.add_s(dn, attr)
+        self.__invalidate()
+
+    def __modify_s(self, dn, attr):
+        self.conn.modify_s(dn, attr)
+        self.__invalidate()
+
+    def __delete_s(self, dn):
+        self.conn.delete_s(dn)
+        self.__invalidate()
+
     def __find_object(self, dn, query=None, scope=None):
         """Find an object by dn and query"""
         objects = self.__find_objects(dn, query, scope)
@@ -501,24 +610,18 @@ class LdapDriver(object):
         if scope is None:
             # One of the flags is 0!
             scope = self.ldap.SCOPE_SUBTREE
-        try:
-            res = self.conn.search_s(dn, scope, query)
-        except self.ldap.NO_SUCH_OBJECT:
-            return []
+        res = self.__search(dn, scope, query)
         # Just return the DNs
         return [dn for dn, _attributes in res]
 
-    def __find_objects(self, dn, query=None, scope=None):
+    def __find_objects(self, dn, query=None, scope=None, cache=True):
         """Find objects by query"""
         if scope is None:
             # One of the flags is 0!
             scope = self.ldap.SCOPE_SUBTREE
         if query is None:
             query = "(objectClass=*)"
-        try:
-            res = self.conn.search_s(dn, scope, query)
-        except self.ldap.NO_SUCH_OBJECT:
-            return []
+        res = self.__search(dn, scope, query, cache=cache)
         # Just return the attributes
         # FIXME(yorik-sar): Whole driver should be refactored to
         #                   prevent this hack
@@ -573,7 +676,7 @@ class LdapDriver(object):
             ('cn', [name]),
             ('description', [description]),
             ('member', members)]
-        self.conn.add_s(group_dn, attr)
+        self.__add_s(group_dn, attr)
 
     def __is_in_group(self, uid, group_dn):
         """Check if user is in group"""
@@ -595,7 +698,7 @@ class LdapDriver(object):
         if self.__is_in_group(uid, group_dn):
             raise exception.LDAPMembershipExists(uid=uid, group_dn=group_dn)
         attr = [(self.ldap.MOD_ADD, 'member', self.__uid_to_dn(uid))]
-        self.conn.modify_s(group_dn, attr)
+        self.__modify_s(group_dn, attr)
 
     def __remove_from_group(self, uid, group_dn):
         """Remove user from group"""
@@ -616,7 +719,7 @@ class LdapDriver(object):
         # FIXME(vish): what if deleted user is a project manager?
         attr = [(self.ldap.MOD_DELETE, 'member', self.__uid_to_dn(uid))]
         try:
-            self.conn.modify_s(group_dn, attr)
+            self.__modify_s(group_dn, attr)
         except self.ldap.OBJECT_CLASS_VIOLATION:
             LOG.debug(_("Attempted to remove the last member of a group. "
                         "Deleting the group at %s instead."), group_dn)
@@ -639,7 +742,7 @@ class LdapDriver(object):
         """Delete Group"""
         if not self.__group_exists(group_dn):
             raise exception.LDAPGroupNotFound(group_id=group_dn)
-        self.conn.delete_s(group_dn)
+        self.__delete_s(group_dn)
 
     def __delete_roles(self, project_dn):
         """Delete all roles for project"""
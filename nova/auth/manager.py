@@ -69,6 +69,13 @@ flags.DEFINE_string('credential_rc_file', '%src',
                     'replaced by name of the region (nova by default)')
 flags.DEFINE_string('auth_driver', 'nova.auth.dbdriver.DbDriver',
                     'Driver that auth manager uses')
+flags.DEFINE_integer('auth_credential_cache_size', 1000,
+                     'Number of access keys whose credentials are cached '
+                     'for request authentication, 0 disables the cache')
+flags.DEFINE_integer('auth_credential_cache_ttl', 60,
+                     'Seconds to cache the credentials for an access key; '
+                     'without memcached_servers, changes made through '
+                     'another api server are only seen once they expire')
 
 LOG = logging.getLogger('nova.auth.manager')
 
@@ -213,6 +220,7 @@ class AuthManager(object):
 
     _instance = None
     mc = None
+    generation_key = 'authgeneration'
 
     def __new__(cls, *args, **kwargs):
         """Returns the AuthManager singleton"""
@@ -231,16 +239,23 @@ class AuthManager(object):
             self.driver = utils.import_class(driver or FLAGS.auth_driver)
         if AuthManager.mc is None:
             AuthManager.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
+        if getattr(self, 'credential_cache', None) is None:
+            self.credential_cache = utils.LRUCache(
+                    FLAGS.auth_credential_cache_size,
+                    FLAGS.auth_credential_cache_ttl)
 
     def authenticate(self, access, signature, params, verb='GET',
                      server_string='127.0.0.1:8773', path='/',
-                     check_type='ec2', headers=None):
+                     check_type='ec2', headers=None, generation=None):
         """Authenticates AWS request using access key and signature
 
         If the project is not specified, attempts to authenticate to
         a project with the same name as the user. This way, older tools
         that have no project knowledge will still work.
 
+        The user, their signer and the projects they were authorized for
+        are cached by access key, see _get_credentials.
+
         @type access: str
         @param access: Access key for user in the form "access:project".
 
@@ -268,18 +283,20 @@ class AuthManager(object):
         @param headers: HTTP headers passed with the request (only needed for
                         s3 signature checks)
 
+        @type generation: int
+        @param generation: Auth generation if the caller already read it
+                           from memcache, see get_generation.
+
         @rtype: tuple (User, Project)
         @return: User and project that the request represents.
         """
         # TODO(vish): check for valid timestamp
         (access_key, _sep, project_id) = access.partition(':')
 
-        LOG.debug(_('Looking up user: %r'), access_key)
-        user = self.get_user_from_access_key(access_key)
-        LOG.debug('user: %r', user)
-        if user is None:
-            LOG.audit(_("Failed authorization for access key %s"), access_key)
-            raise exception.AccessKeyNotFound(access_key=access_key)
+        if generation is None:
+            generation = self.get_generation()
+        credentials = self._get_credentials(access_key, generation)
+        user = credentials['user']
 
         # NOTE(vish): if we stop using project name as id we need better
         #             logic to find a default project for user
@@ -287,25 +304,13 @@ class AuthManager(object):
             LOG.debug(_("Using project name = user name (%s)"), user.name)
             project_id = user.name
 
-        project = self.get_project(project_id)
+        project = credentials['projects'].get(project_id)
         if project is None:
-            pjid = project_id
-            uname = user.name
-            LOG.audit(_("failed authorization: no project named %(pjid)s"
-                    " (user=%(uname)s)") % locals())
-            raise exception.ProjectNotFound(project_id=project_id)
-        if not self.is_admin(user) and not self.is_project_member(user,
-                                                                  project):
-            uname = user.name
-            uid = user.id
-            pjname = project.name
-            pjid = project.id
-            LOG.audit(_("Failed authorization: user %(uname)s not admin"
-                    " and not member of project %(pjname)s") % locals())
-            raise exception.ProjectMembershipNotFound(project_id=pjid,
-                                                      user_id=uid)
+            project = self._authorize_project(credentials, project_id)
+            credentials['projects'][project_id] = project
+
+        sign = credentials['signer']
         if check_type == 's3':
-            sign = signer.Signer(user.secret.encode())
             expected_signature = sign.s3_authorization(headers, verb, path)
             LOG.debug(_('user.secret: %s'), user.secret)
             LOG.debug(_('expected_signature: %s'), expected_signature)
@@ -315,10 +320,8 @@ class AuthManager(object):
                 raise exception.InvalidSignature(signature=signature,
                                                  user=user)
         elif check_type == 'ec2':
-            # NOTE(vish): hmac can't handle unicode, so encode ensures that
-            #             secret isn't unicode
-            expected_signature = signer.Signer(user.secret.encode()).generate(
-                    params, verb, server_string, path)
+            expected_signature = sign.generate(params, verb, server_string,
+                                               path)
             LOG.debug(_('user.secret: %s'), user.secret)
             LOG.debug(_('expected_signature: %s'), expected_signature)
             LOG.debug(_('signature: %s'), signature)
@@ -326,9 +329,8 @@ class AuthManager(object):
                 (addr_str, port_str) = utils.parse_server_string(server_string)
                 # If the given server_string contains port num, try without it.
                 if port_str != '':
-                    host_only_signature = signer.Signer(
-                        user.secret.encode()).generate(params, verb,
-                                                       addr_str, path)
+                    host_only_signature = sign.generate(params, verb,
+                                                        addr_str, path)
                     LOG.debug(_('host_only_signature: %s'),
                               host_only_signature)
                     if signature == host_only_signature:
@@ -338,6 +340,66 @@ class AuthManager(object):
                                                  user=user)
         return (user, project)
 
+    def _get_credentials(self, access_key, generation):
+        """Returns the cached credentials for an access key.
+
+        Entries are dropped once the auth generation changes.  The
+        generation is kept in memcached, so with memcached_servers set the
+        changes made through any AuthManager are seen by every api server
+        at once.  Without it the generation is only known to this process,
+        and changes made through other api servers are only seen when the
+        entries expire after auth_credential_cache_ttl seconds.
+        """
+        credentials = self.credential_cache.get(access_key)
+        if credentials is not None and \
+           credentials['generation'] == generation:
+            return credentials
+
+        LOG.debug(_('Looking up user: %r'), access_key)
+        user = self.get_user_from_access_key(access_key)
+        LOG.debug('user: %r', user)
+        if user is None:
+            LOG.audit(_("Failed authorization for access key %s"), access_key)
+            raise exception.AccessKeyNotFound(access_key=access_key)
+        # NOTE(vish): hmac can't handle unicode, so encode ensures that
+        #             secret isn't unicode
+        credentials = {'user': user,
+                       'signer': signer.Signer(user.secret.encode()),
+                       'is_admin': self.is_admin(user),
+                       'projects': {},
+                       'generation': generation}
+        self.credential_cache.set(access_key, credentials)
+        return credentials
+
+    def _authorize_project(self, credentials, project_id):
+        """Looks up a project and checks the cached user may use it."""
+        user = credentials['user']
+        project = self.get_project(project_id)
+        if project is None:
+            pjid = project_id
+            uname = user.name
+            LOG.audit(_("failed authorization: no project named %(pjid)s"
+                    " (user=%(uname)s)") % locals())
+            raise exception.ProjectNotFound(project_id=project_id)
+        if not credentials['is_admin'] and \
+           not self.is_project_member(user, project):
+            uname = user.name
+            uid = user.id
+            pjname = project.name
+            pjid = project.id
+            LOG.audit(_("Failed authorization: user %(uname)s not admin"
+                    " and not member of project %(pjname)s") % locals())
+            raise exception.ProjectMembershipNotFound(project_id=pjid,
+                                                      user_id=uid)
+        return project
+
+    def _clear_credentials(self, user):
+        """Drops the cached credentials of a user."""
+        if not isinstance(user, User):
+            user = self.get_user(user)
+        if user is not None:
+            self.credential_cache.delete(user.access)
+
     def get_access_key(self, user, project):
         """Get an access key that includes user and project"""
         if not isinstance(user, User):
@@ -379,6 +441,18 @@ class AuthManager(object):
             if self.has_role(user, role):
                 return True
 
+    def get_generation(self):
+        """Returns a counter that changes with users, roles and projects.
+
+        Callers that cache authorization results keep the generation they
+        saw and discard their results once it changes.
+        """
+        return int(self.mc.get(self.generation_key) or 0)
+
+    def _bump_generation(self):
+        if self.mc.incr(self.generation_key) is None:
+            self.mc.set(self.generation_key, str(self.get_generation() + 1))
+
     def _build_mc_key(self, user, role, project=None):
         key_parts = ['rolecache', User.safe_id(user), str(role)]
         if project:
@@ -474,6 +548,7 @@ class AuthManager(object):
         with self.driver() as drv:
             self._clear_mc_key(uid, role, pid)
             drv.add_role(uid, role, pid)
+        self._bump_generation()
 
     def remove_role(self, user, role, project=None):
         """Removes role for user
@@ -503,6 +578,7 @@ class AuthManager(object):
         with self.driver() as drv:
             self._clear_mc_key(uid, role, pid)
             drv.remove_role(uid, role, pid)
+        self._bump_generation()
 
     @staticmethod
     def get_roles(project_roles=True):
@@ -566,6 +642,7 @@ class AuthManager(object):
                 LOG.audit(_("Created project %(name)s with"
                         " manager %(manager_user)s") % locals())
                 project = Project(**project_dict)
+                self._bump_generation()
                 return project
 
     def modify_project(self, project, manager_user=None, description=None):
@@ -588,6 +665,7 @@ class AuthManager(object):
             drv.modify_project(Project.safe_id(project),
                                manager_user,
                                description)
+        self._bump_generation()
 
     def add_to_project(self, user, project):
         """Add user to project"""
@@ -595,8 +673,11 @@ class AuthManager(object):
         pid = Project.safe_id(project)
         LOG.audit(_("Adding user %(uid)s to project %(pid)s") % locals())
         with self.driver() as drv:
-            return drv.add_to_project(User.safe_id(user),
-                                      Project.safe_id(project))
+            result = drv.add_to_project(User.safe_id(user),
+                                        Project.safe_id(project))
+        self._clear_credentials(user)
+        self._bump_generation()
+        return result
 
     def is_project_manager(self, user, project):
         """Checks if user is project manager"""
@@ -616,7 +697,10 @@ class AuthManager(object):
         pid = Project.safe_id(project)
         LOG.audit(_("Remove user %(uid)s from project %(pid)s") % locals())
         with self.driver() as drv:
-            return drv.remove_from_project(uid, pid)
+            result = drv.remove_from_project(uid, pid)
+        self._clear_credentials(user)
+        self._bump_generation()
+        return result
 
     @staticmethod
     def get_project_vpn_data(project):
@@ -647,6 +731,7 @@ class AuthManager(object):
         LOG.audit(_("Deleting project %s"), Project.safe_id(project))
         with self.driver() as drv:
             drv.delete_project(Project.safe_id(project))
+        self._bump_generation()
 
     def get_user(self, uid):
         """Retrieves a user by id"""
@@ -716,6 +801,7 @@ class AuthManager(object):
                                         uid)
         with self.driver() as drv:
             drv.delete_user(uid)
+        self._bump_generation()
 
     def modify_user(self, user, access_key=None, secret_key=None, admin=None):
         """Modify credentials for a user"""
@@ -727,8 +813,10 @@ class AuthManager(object):
         if admin is not None:
             LOG.audit(_("Admin status set to %(admin)r"
                     " for user %(uid)s") % locals())
+        self._clear_credentials(user)
         with self.driver() as drv:
             drv.modify_user(uid, access_key, secret_key, admin)
+        self._bump_generation()
 
     @staticmethod
     def get_key_pairs(context):
@@ -100,36 +100,38 @@ class Signer(object):
     def _calc_signature_0(self, params):
         """Generate AWS signature version 0 string."""
         s = params['Action'] + params['Timestamp']
-        self.hmac.update(s)
+        hmac_copy = self.hmac.copy()
+        hmac_copy.update(s)
         keys = params.keys()
         keys.sort(cmp=lambda x, y: cmp(x.lower(), y.lower()))
         pairs = []
         for key in keys:
             val = self._get_utf8_value(params[key])
             pairs.append(key + '=' + urllib.quote(val))
-        return base64.b64encode(self.hmac.digest())
+        return base64.b64encode(hmac_copy.digest())
 
     def _calc_signature_1(self, params):
         """Generate AWS signature version 1 string."""
+        hmac_copy = self.hmac.copy()
         keys = params.keys()
         keys.sort(cmp=lambda x, y: cmp(x.lower(), y.lower()))
         pairs = []
         for key in keys:
-            self.hmac.update(key)
+            hmac_copy.update(key)
             val = self._get_utf8_value(params[key])
-            self.hmac.update(val)
+            hmac_copy.update(val)
             pairs.append(key + '=' + urllib.quote(val))
-        return base64.b64encode(self.hmac.digest())
+        return base64.b64encode(hmac_copy.digest())
 
     def _calc_signature_2(self, params, verb, server_string, path):
         """Generate AWS signature version 2 string."""
         LOG.debug('using _calc_signature_2')
         string_to_sign = '%s\n%s\n%s\n' % (verb, server_string, path)
         if self.hmac_256:
-            current_hmac = self.hmac_256
+            current_hmac = self.hmac_256.copy()
             params['SignatureMethod'] = 'HmacSHA256'
         else:
-            current_hmac = self.hmac
+            current_hmac = self.hmac.copy()
             params['SignatureMethod'] = 'HmacSHA1'
         keys = params.keys()
         keys.sort()
@@ -152,7 +152,11 @@ class API(base.Base):
                injected_files=None, admin_password=None, zone_blob=None,
                reservation_id=None):
         """Verify all the input parameters regardless of the provisioning
-        strategy being performed."""
+        strategy being performed.
+
+        Reserves the quota of the instances; the caller releases the
+        reservations returned once the instances are created or handed to
+        the scheduler, or could not be."""
 
         if not instance_type:
             instance_type = instance_types.get_default_instance_type()
@@ -248,7 +252,14 @@ class API(base.Base):
             'vm_mode': vm_mode,
             'root_device_name': root_device_name}
 
-        return (num_instances, base_options, image)
+        reservations = quota.reserve_instances(context, num_instances,
+                                               instance_type)
+        if reservations is None:
+            raise quota.QuotaError(_("Instance quota exceeded. You cannot "
+                                     "run any more instances of this type."),
+                                   "InstanceLimitExceeded")
+
+        return (num_instances, base_options, image, reservations)
 
     def _update_image_block_device_mapping(self, elevated_context, instance_id,
                                            mappings):
@@ -401,7 +412,8 @@ class API(base.Base):
         """Provision the instances by passing the whole request to
         the Scheduler for execution. Returns a Reservation ID
         related to the creation of all of these instances."""
-        num_instances, base_options, image = self._check_create_parameters(
+        num_instances, base_options, image, reservations = \
+                self._check_create_parameters(
                                context, instance_type,
                                image_href, kernel_id, ramdisk_id,
                                min_count, max_count,
@@ -411,11 +423,17 @@ class API(base.Base):
                                injected_files, admin_password, zone_blob,
                                reservation_id)
 
-        self._ask_scheduler_to_create_instance(context, base_options,
-                                      instance_type, zone_blob,
-                                      availability_zone, injected_files,
-                                      admin_password,
-                                      num_instances=num_instances)
+        # NOTE: the scheduler may create the instances in a child zone,
+        # so the reservations are released once the request is handed to
+        # it rather than when the instances exist.
+        try:
+            self._ask_scheduler_to_create_instance(context, base_options,
+                                          instance_type, zone_blob,
+                                          availability_zone, injected_files,
+                                          admin_password,
+                                          num_instances=num_instances)
+        finally:
+            quota.release(context, reservations)
 
         return base_options['reservation_id']
 
@@ -439,7 +457,8 @@ class API(base.Base):
         Returns a list of instance dicts.
         """
 
-        num_instances, base_options, image = self._check_create_parameters(
+        num_instances, base_options, image, reservations = \
+                self._check_create_parameters(
                                context, instance_type,
                                image_href, kernel_id, ramdisk_id,
                                min_count, max_count,
@@ -452,18 +471,21 @@ class API(base.Base):
         block_device_mapping = block_device_mapping or []
         instances = []
         LOG.debug(_("Going to run %s instances..."), num_instances)
-        for num in range(num_instances):
-            instance = self.create_db_entry_for_new_instance(context, image,
-                                    base_options, security_group,
-                                    block_device_mapping, num=num)
-            instances.append(instance)
-            instance_id = instance['id']
-
-            self._ask_scheduler_to_create_instance(context, base_options,
-                                          instance_type, zone_blob,
-                                          availability_zone, injected_files,
-                                          admin_password,
-                                          instance_id=instance_id)
+        try:
+            for num in range(num_instances):
+                instance = self.create_db_entry_for_new_instance(context,
+                                        image, base_options, security_group,
+                                        block_device_mapping, num=num)
+                instances.append(instance)
+                instance_id = instance['id']
+
+                self._ask_scheduler_to_create_instance(context, base_options,
+                                              instance_type, zone_blob,
+                                              availability_zone,
+                                              injected_files, admin_password,
+                                              instance_id=instance_id)
+        finally:
+            quota.release(context, reservations)
 
         return [dict(x.iteritems()) for x in instances]
 
@@ -476,6 +498,12 @@ class API(base.Base):
         except exception.NotFound:
             return False
 
+    def get_finished_migrations(self, context, instance_uuids):
+        """Returns the uuids of the instances with a finished migration."""
+        migrations = db.migration_get_all_by_instances_and_status(context,
+                instance_uuids, 'finished')
+        return set(migration['instance_uuid'] for migration in migrations)
+
     def ensure_default_security_group(self, context):
         """Ensure that a context has a security group.
 
@@ -670,35 +698,49 @@ class API(base.Base):
         return self.get(context, instance_id)
 
     def get_all(self, context, project_id=None, reservation_id=None,
-                fixed_ip=None, recurse_zones=False):
+                fixed_ip=None, recurse_zones=False, filters=None,
+                marker=None, limit=None, offset=None, detailed=True):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retreive
         all instances in the system.
+
+        When looking up instances by reservation, project or user, the
+        extra 'filters' and the 'marker', 'limit' and 'offset' paging
+        arguments are applied by the database; see
+        :func:`nova.db.api.instance_get_all_by_filters`.  The instance of a
+        fixed ip can not be filtered further, so InvalidInput is raised if
+        'filters' are given along with 'fixed_ip'.
         """
 
+        filters = dict(filters or {})
         if reservation_id is not None:
             recurse_zones = True
-            instances = self.db.instance_get_all_by_reservation(
-                                    context, reservation_id)
+            filters['reservation_id'] = reservation_id
+            instances = self.db.instance_get_all_by_filters(context, filters,
+                    marker=marker, limit=limit, offset=offset,
+                    detailed=detailed)
         elif fixed_ip is not None:
+            if filters:
+                reason = _('fixed_ip can not be combined with other filters')
+                raise exception.InvalidInput(reason=reason)
             try:
                 instances = self.db.fixed_ip_get_instance(context, fixed_ip)
             except exception.FloatingIpNotFound, e:
                 if not recurse_zones:
                     raise
                 instances = None
-        elif project_id or not context.is_admin:
-            if not context.project:
-                instances = self.db.instance_get_all_by_user(
-                    context, context.user_id)
-            else:
-                if project_id is None:
-                    project_id = context.project_id
-                instances = self.db.instance_get_all_by_project(
-                    context, project_id)
         else:
-            instances = self.db.instance_get_all(context)
+            if project_id or not context.is_admin:
+                if not context.project:
+                    filters['user_id'] = context.user_id
+                else:
+                    if project_id is None:
+                        project_id = context.project_id
+                    filters['project_id'] = project_id
+            instances = self.db.instance_get_all_by_filters(context, filters,
+                    marker=marker, limit=limit, offset=offset,
+                    detailed=detailed)
 
         if instances is None:
             instances = []
@@ -1419,13 +1419,21 @@ class ComputeManager(manager.SchedulerDependentManager):
                 self.driver.get_host_stats(refresh=True))
 
     def _poll_instance_states(self, context):
+        """Reconciles the states in the DB with the states of the VMs.
+
+        The mismatched states are corrected in a single transaction.
+        Returns the counts of instances, mismatches and VMs not in the DB.
+        """
+        start = time.time()
         vm_instances = self.driver.list_instances_detail()
         vm_instances = dict((vm.name, vm) for vm in vm_instances)
 
-        # Keep a list of VMs not in the DB, cross them off as we find them
-        vms_not_found_in_db = list(vm_instances.keys())
-
-        db_instances = self.db.instance_get_all_by_host(context, self.host)
+        db_instances = self.db.instance_get_all_states_by_host(context,
+                                                               self.host)
+        vms_not_found_in_db = set(vm_instances) - \
+                              set(db_instance['name']
+                                  for db_instance in db_instances)
+        states = {}
 
         for db_instance in db_instances:
             name = db_instance['name']
@@ -1456,7 +1464,6 @@ class ComputeManager(manager.SchedulerDependentManager):
                         continue
             else:
                 vm_state = vm_instance.state
-                vms_not_found_in_db.remove(name)
 
             if (db_instance['state_description'] in ['migrating', 'stopping']):
                 # A situation which db record exists, but no instance"
@@ -1469,11 +1476,14 @@ class ComputeManager(manager.SchedulerDependentManager):
             if vm_state != db_state:
                 LOG.info(_("DB/VM state mismatch. Changing state from "
                            "'%(db_state)s' to '%(vm_state)s'") % locals())
-                self._update_state(context, db_instance['id'], vm_state)
+                states[db_instance['id']] = vm_state
 
             # NOTE(justinsb): We no longer auto-remove SHUTOFF instances
             # It's quite hard to get them back when we do.
 
+        if states:
+            self.db.instance_set_states(context, states)
+
         # Are there VMs not in the DB?
         for vm_not_found_in_db in vms_not_found_in_db:
             name = vm_not_found_in_db
@@ -1483,3 +1493,15 @@ class ComputeManager(manager.SchedulerDependentManager):
                 # TODO(justinsb): What to do here?  Adopt it?  Shut it down?
                 LOG.warning(_("Found VM not in DB: '%(name)s'.  Ignoring")
                             % locals())
+
+        result = dict(instances=len(db_instances), mismatches=len(states),
+                      vms_not_found_in_db=len(vms_not_found_in_db))
+        elapsed = time.time() - start
+        if states or vms_not_found_in_db:
+            log = LOG.info
+        else:
+            log = LOG.debug
+        log(_("Reconciled %(instances)d instance states in %(elapsed).3f "
+              "seconds: %(mismatches)d mismatches, %(vms_not_found_in_db)d "
+              "VMs not in DB") % dict(result, elapsed=elapsed))
+        return result
@@ -0,0 +1,128 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Usage notifications for the instances active over an audit period.
+
+Instances are read in batches ordered by id, loading only the columns the
+notifications are built from, and each batch is sent at once.  After each
+batch the id of the last instance sent is written to a checkpoint file, so
+an audit that fails part way can be run again from where it stopped.
+"""
+
+import json
+import os
+import time
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import utils
+from nova.notifier import api as notifier_api
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('instance_usage_audit_batch_size', 1000,
+                     'Number of instances read and notified at a time by '
+                     'the instance usage audit')
+flags.DEFINE_string('instance_usage_audit_checkpoint', None,
+                    'File recording the progress of the instance usage '
+                    'audit, so that an interrupted audit resumes from it')
+
+LOG = logging.getLogger('nova.compute.usage_audit')
+
+
+class UsageAudit(object):
+    """Sends compute.instance.exists for instances active from begin to end.
+    """
+
+    def __init__(self, begin, end, batch_size=None, checkpoint_path=None):
+        self.begin = begin
+        self.end = end
+        self.batch_size = batch_size or FLAGS.instance_usage_audit_batch_size
+        self.checkpoint_path = (checkpoint_path or
+                                FLAGS.instance_usage_audit_checkpoint)
+
+    def _period(self):
+        return {'begin': str(self.begin), 'end': str(self.end)}
+
+    def _load_checkpoint(self):
+        """Returns the id of the last instance sent for this period."""
+        if not self.checkpoint_path:
+            return None
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except (IOError, ValueError):
+            return None
+        if (checkpoint.get('begin'), checkpoint.get('end')) != \
+           (str(self.begin), str(self.end)):
+            LOG.warn(_('Ignoring checkpoint %s of another audit period'),
+                     self.checkpoint_path)
+            return None
+        return checkpoint.get('marker')
+
+    def _save_checkpoint(self, marker):
+        if not self.checkpoint_path:
+            return
+        checkpoint = self._period()
+        checkpoint['marker'] = marker
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.rename(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.unlink(self.checkpoint_path)
+
+    def run(self, context):
+        """Sends the notifications, returns how many were sent."""
+        marker = self._load_checkpoint()
+        if marker is not None:
+            LOG.info(_('Resuming usage audit after instance %s'), marker)
+        total = db.instance_count_active_by_window(context, self.begin,
+                                                   self.end, marker=marker)
+        LOG.info(_('Creating usages for %(total)d instances from %(begin)s '
+                   'until %(end)s') % dict(self._period(), total=total))
+        sent = 0
+        started = time.time()
+        while True:
+            usages = db.instance_usage_get_active_by_window(context,
+                            self.begin, self.end, marker=marker,
+                            limit=self.batch_size)
+            if not usages:
+                break
+            payloads = [utils.usage_from_instance(usage,
+                                audit_period_begining=str(self.begin),
+                                audit_period_ending=str(self.end))
+                        for usage in usages]
+            notifier_api.notify_many('compute.%s' % FLAGS.host,
+                                     'compute.instance.exists',
+                                     notifier_api.INFO,
+                                     payloads)
+            marker = usages[-1]['id']
+            self._save_checkpoint(marker)
+            sent += len(usages)
+            elapsed = max(time.time() - started, 0.001)
+            LOG.info(_('Sent usage for %(sent)d of %(total)d instances, '
+                       '%(rate).1f per second') %
+                     {'sent': sent, 'total': total,
+                      'rate': sent / elapsed})
+            if len(usages) < self.batch_size:
+                break
+        self._clear_checkpoint()
+        return sent
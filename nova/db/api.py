@@ -31,8 +31,16 @@ The underlying driver is loaded as a :class:`LazyPluggable`.
 :enable_new_services:  when adding a new service to the database, is it in the
                        pool of available hardware (Default: True)
 
+:db_use_tpool:  run the calls to the backend in native threads, so a slow
+                query does not block the other greenthreads (Default: False)
+
 """
 
+import functools
+
+from eventlet import semaphore
+from eventlet import tpool
+
 from nova import exception
 from nova import flags
 from nova import utils
@@ -49,10 +57,43 @@ flags.DEFINE_string('volume_name_template', 'volume-%08x',
                     'Template string to be used to generate instance names')
 flags.DEFINE_string('snapshot_name_template', 'snapshot-%08x',
                     'Template string to be used to generate snapshot names')
+flags.DEFINE_boolean('db_use_tpool', False,
+                     'Run db calls in a pool of native threads')
+flags.DEFINE_integer('db_tpool_size', 10,
+                     'Most db calls run at once when db_use_tpool is set')
+
+
+class TpoolBackend(object):
+    """Runs the calls to a db backend in the eventlet thread pool.
+
+    While a call waits on the database, in a native thread, the other
+    greenthreads keep running.  At most db_tpool_size calls run at once,
+    later ones wait for a free slot.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._semaphore = None
+
+    def _call(self, fn, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = semaphore.Semaphore(FLAGS.db_tpool_size)
+        with self._semaphore:
+            return tpool.execute(fn, *args, **kwargs)
 
+    def __getattr__(self, key):
+        attr = getattr(self._backend, key)
+        if not FLAGS.db_use_tpool or not callable(attr):
+            return attr
 
-IMPL = utils.LazyPluggable(FLAGS['db_backend'],
-                           sqlalchemy='nova.db.sqlalchemy.api')
+        @functools.wraps(attr)
+        def call_in_tpool(*args, **kwargs):
+            return self._call(attr, *args, **kwargs)
+        return call_in_tpool
+
+
+IMPL = TpoolBackend(utils.LazyPluggable(FLAGS['db_backend'],
+                                        sqlalchemy='nova.db.sqlalchemy.api'))
 
 
 class NoMoreBlades(exception.Error):
@@ -98,6 +139,12 @@ def service_get_all_by_topic(context, topic):
     return IMPL.service_get_all_by_topic(context, topic)
 
 
+def service_get_all_hosts_up(context, topic, since):
+    """Get the hosts of the enabled services for a given topic that
+    reported after since."""
+    return IMPL.service_get_all_hosts_up(context, topic, since)
+
+
 def service_get_all_by_host(context, host):
     """Get all services for a given host."""
     return IMPL.service_get_all_by_host(context, host)
@@ -154,6 +201,15 @@ def service_update(context, service_id, values):
     return IMPL.service_update(context, service_id, values)
 
 
+def service_heartbeat(context, service_id):
+    """Increment the report count of a service, in a single statement.
+
+    Raises ServiceNotFound if service does not exist.
+
+    """
+    return IMPL.service_heartbeat(context, service_id)
+
+
 ###################
 
 
@@ -236,6 +292,11 @@ def floating_ip_create(context, values):
     return IMPL.floating_ip_create(context, values)
 
 
+def floating_ip_bulk_create(context, ips):
+    """Create floating ips from a list of values dictionaries."""
+    return IMPL.floating_ip_bulk_create(context, ips)
+
+
 def floating_ip_count_by_project(context, project_id):
     """Count floating ips used by project."""
     return IMPL.floating_ip_count_by_project(context, project_id)
@@ -251,6 +312,11 @@ def floating_ip_destroy(context, address):
     return IMPL.floating_ip_destroy(context, address)
 
 
+def floating_ip_bulk_destroy(context, addresses):
+    """Destroy the floating ips with the addresses that exist."""
+    return IMPL.floating_ip_bulk_destroy(context, addresses)
+
+
 def floating_ip_disassociate(context, address):
     """Disassociate an floating ip from a fixed ip by address.
 
@@ -320,6 +386,13 @@ def migration_get_by_instance_and_status(context, instance_uuid, status):
             status)
 
 
+def migration_get_all_by_instances_and_status(context, instance_uuids,
+                                              status):
+    """Finds all migrations with a status for the given instance uuids."""
+    return IMPL.migration_get_all_by_instances_and_status(context,
+            instance_uuids, status)
+
+
 ####################
 
 
@@ -500,11 +573,33 @@ def instance_get_all(context):
     return IMPL.instance_get_all(context)
 
 
+def instance_get_all_by_filters(context, filters, marker=None, limit=None,
+                                offset=None, detailed=True):
+    """Get a page of instances matching all of the given filters."""
+    return IMPL.instance_get_all_by_filters(context, filters, marker=marker,
+                                            limit=limit, offset=offset,
+                                            detailed=detailed)
+
+
 def instance_get_active_by_window(context, begin, end=None):
     """Get instances active during a certain time window."""
     return IMPL.instance_get_active_by_window(context, begin, end)
 
 
+def instance_usage_get_active_by_window(context, begin, end=None,
+                                        marker=None, limit=None):
+    """Get a page of usage of instances active during a time window."""
+    return IMPL.instance_usage_get_active_by_window(context, begin, end,
+                                                    marker=marker,
+                                                    limit=limit)
+
+
+def instance_count_active_by_window(context, begin, end=None, marker=None):
+    """Count instances active during a time window after marker."""
+    return IMPL.instance_count_active_by_window(context, begin, end,
+                                                marker=marker)
+
+
 def instance_get_all_by_user(context, user_id):
     """Get all instances."""
     return IMPL.instance_get_all_by_user(context, user_id)
@@ -520,6 +615,12 @@ def instance_get_all_by_host(context, host):
     return IMPL.instance_get_all_by_host(context, host)
 
 
+def instance_get_all_states_by_host(context, host):
+    """Get the id, name, state and state_description of all instances
+    belonging to a host, without their associations."""
+    return IMPL.instance_get_all_states_by_host(context, host)
+
+
 def instance_get_all_by_reservation(context, reservation_id):
     """Get all instance belonging to a reservation."""
     return IMPL.instance_get_all_by_reservation(context, reservation_id)
@@ -549,6 +650,15 @@ def instance_set_state(context, instance_id, state, description=None):
     return IMPL.instance_set_state(context, instance_id, state, description)
 
 
+def instance_set_states(context, states):
+    """Set the states of several instances in a single transaction.
+
+    states is a dict of instance id to state.
+
+    """
+    return IMPL.instance_set_states(context, states)
+
+
 def instance_update(context, instance_id, values):
     """Set the given properties on an instance and update it.
 
@@ -860,6 +970,30 @@ def quota_destroy_all_by_project(context, project_id):
 ###################
 
 
+def quota_usage_get_all_by_project(context, project_id):
+    """Retrieve the quotas and the resource usages of a project."""
+    return IMPL.quota_usage_get_all_by_project(context, project_id)
+
+
+def quota_usage_reserve(context, project_id, deltas, quotas, expire):
+    """Reserve resources of a project within its quotas or raise."""
+    return IMPL.quota_usage_reserve(context, project_id, deltas, quotas,
+                                    expire)
+
+
+def quota_reservation_release(context, reservations):
+    """Release reservations made by quota_usage_reserve."""
+    return IMPL.quota_reservation_release(context, reservations)
+
+
+def quota_usage_sync(context, project_id=None):
+    """Repair the resource usages of a project, or of all projects."""
+    return IMPL.quota_usage_sync(context, project_id)
+
+
+###################
+
+
 def volume_allocate_shelf_and_blade(context, volume_id):
     """Atomically allocate a free shelf and blade from the pool."""
     return IMPL.volume_allocate_shelf_and_blade(context, volume_id)
@@ -1389,6 +1523,24 @@ def instance_metadata_update_or_create(context, instance_id, metadata):
 ####################
 
 
+def instance_info_cache_get(context, instance_id):
+    """Get the info cache of an instance, or None if it has none."""
+    return IMPL.instance_info_cache_get(context, instance_id)
+
+
+def instance_info_cache_update(context, instance_id, values):
+    """Create or update the info cache of an instance."""
+    return IMPL.instance_info_cache_update(context, instance_id, values)
+
+
+def instance_info_cache_delete(context, instance_id):
+    """Delete the info cache of an instance."""
+    return IMPL.instance_info_cache_delete(context, instance_id)
+
+
+####################
+
+
 def agent_build_create(context, values):
     """Create a new agent build entry."""
     return IMPL.agent_build_create(context, values)
@@ -1434,3 +1586,24 @@ def instance_type_extra_specs_update_or_create(context, instance_type_id,
     key/value pairs specified in the extra specs dict argument"""
     IMPL.instance_type_extra_specs_update_or_create(context, instance_type_id,
                                                     extra_specs)
+
+
+####################
+
+
+def archive_deleted_rows(context, before, max_rows):
+    """Move about max_rows rows soft deleted before the datetime before
+    into the shadow tables.
+
+    Rows are only moved once no other row refers to them, and the rows of
+    a deleted instance are moved with it.  Returns the number of rows
+    moved from each table.
+
+    """
+    return IMPL.archive_deleted_rows(context, before, max_rows)
+
+
+def purge_shadow_rows(context, before, max_rows):
+    """Delete up to max_rows shadow table rows deleted before the datetime
+    before.  Returns the number of rows deleted from each shadow table."""
+    return IMPL.purge_shadow_rows(context, before, max_rows)
@@ -18,6 +18,8 @@
 """
 Implementation of SQLAlchemy backend.
 """
+import datetime
+import random
 import warnings
 
 from nova import db
@@ -28,12 +30,20 @@ from nova import utils
 from nova import log as logging
 from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy.session import get_session
+from sqlalchemy import and_
+from sqlalchemy import MetaData
 from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import case
+from sqlalchemy.sql.expression import exists
+from sqlalchemy.sql.expression import literal
 from sqlalchemy.sql.expression import literal_column
+from sqlalchemy.sql.expression import null
+from sqlalchemy.sql.expression import select
+from sqlalchemy.sql.expression import union_all
 
 FLAGS = flags.FLAGS
 LOG = logging.getLogger("nova.db.sqlalchemy")
@@ -185,6 +195,20 @@ def service_get_all_by_topic(context, topic):
                    all()
 
 
+@require_admin_context
+def service_get_all_hosts_up(context, topic, since):
+    session = get_session()
+    last_heartbeat = func.coalesce(models.Service.updated_at,
+                                   models.Service.created_at)
+    rows = session.query(models.Service.host).\
+                   filter_by(deleted=False).\
+                   filter_by(disabled=False).\
+                   filter_by(topic=topic).\
+                   filter(last_heartbeat > since).\
+                   all()
+    return [row[0] for row in rows]
+
+
 @require_admin_context
 def service_get_by_host_and_topic(context, host, topic):
     session = get_session()
@@ -328,6 +352,21 @@ def service_update(context, service_id, values):
         service_ref.save(session=session)
 
 
+@require_admin_context
+def service_heartbeat(context, service_id):
+    session = get_session()
+    with session.begin():
+        count = session.query(models.Service).\
+                        filter_by(id=service_id).\
+                        filter_by(deleted=False).\
+                        update({'report_count':
+                                    models.Service.report_count + 1,
+                                'updated_at': utils.utcnow()},
+                               synchronize_session=False)
+    if not count:
+        raise exception.ServiceNotFound(service_id=service_id)
+
+
 ###################
 
 
@@ -470,34 +509,126 @@ def floating_ip_get(context, id):
     return result
 
 
+def _filter_free_floating_ips(query):
+    return query.filter(models.FloatingIp.fixed_ip_id == None).\
+                 filter(models.FloatingIp.project_id == None).\
+                 filter(models.FloatingIp.deleted == False)
+
+
 @require_context
 def floating_ip_allocate_address(context, project_id):
+    """Assign a free floating ip to the project and return its address.
+
+    Instead of every allocation locking the first free row, each picks a
+    free floating ip starting from a random id and claims it with an update
+    that only succeeds if it is still free.  When another allocation got
+    there first, the pick is made again.
+    """
     authorize_project_context(context, project_id)
+    _quota_usages_create(project_id, ['floating_ips'])
     session = get_session()
-    with session.begin():
-        floating_ip_ref = session.query(models.FloatingIp).\
-                                  filter_by(fixed_ip_id=None).\
-                                  filter_by(project_id=None).\
-                                  filter_by(deleted=False).\
-                                  with_lockmode('update').\
-                                  first()
-        # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
-        #             then this has concurrency issues
-        if not floating_ip_ref:
+    while True:
+        first_id, last_id = _filter_free_floating_ips(
+                session.query(func.min(models.FloatingIp.id),
+                              func.max(models.FloatingIp.id))).one()
+        if first_id is None:
             raise exception.NoMoreFloatingIps()
-        floating_ip_ref['project_id'] = project_id
-        session.add(floating_ip_ref)
-    return floating_ip_ref['address']
+        start_id = random.randint(first_id, last_id)
+        floating_ip_ref = _filter_free_floating_ips(
+                session.query(models.FloatingIp)).\
+                        filter(models.FloatingIp.id >= start_id).\
+                        order_by(models.FloatingIp.id).\
+                        first()
+        if floating_ip_ref and _floating_ip_claim(session,
+                                                  floating_ip_ref['id'],
+                                                  project_id):
+            return floating_ip_ref['address']
+
+
+def _floating_ip_claim(session, floating_ip_id, project_id):
+    """Assign the floating ip to the project if it is still free."""
+    with session.begin():
+        count = _filter_free_floating_ips(session.query(models.FloatingIp)).\
+                        filter(models.FloatingIp.id == floating_ip_id).\
+                        update({'project_id': project_id},
+                               synchronize_session=False)
+        if count == 1:
+            _quota_usage_update(session, project_id, {'floating_ips': 1})
+    return count == 1
+
+
+def _floating_ip_quota_project(floating_ip_ref):
+    """The project whose floating_ips quota the floating ip counts in."""
+    if floating_ip_ref['deleted'] or floating_ip_ref['auto_assigned']:
+        return None
+    return floating_ip_ref['project_id']
+
+
+def _floating_ip_quota_update(session, project_before, project_after):
+    if project_before != project_after:
+        _quota_usage_update(session, project_before, {'floating_ips': -1})
+        _quota_usage_update(session, project_after, {'floating_ips': 1})
 
 
 @require_context
 def floating_ip_create(context, values):
     floating_ip_ref = models.FloatingIp()
     floating_ip_ref.update(values)
-    floating_ip_ref.save()
+    _quota_usages_create(_floating_ip_quota_project(floating_ip_ref),
+                         ['floating_ips'])
+    session = get_session()
+    with session.begin():
+        floating_ip_ref.save(session=session)
+        _floating_ip_quota_update(session, None,
+                                  _floating_ip_quota_project(floating_ip_ref))
     return floating_ip_ref['address']
 
 
+@require_admin_context
+def floating_ip_bulk_create(context, ips):
+    """Create floating ips from a list of values dictionaries.
+
+    All the rows are inserted by one statement.
+    """
+    if not ips:
+        return
+    session = get_session()
+    with session.begin():
+        session.execute(models.FloatingIp.__table__.insert(), ips)
+
+
+@require_admin_context
+def floating_ip_bulk_destroy(context, addresses):
+    """Destroy the floating ips with the addresses, skipping unknown ones.
+
+    Returns the number of floating ips destroyed.
+    """
+    session = get_session()
+    count = 0
+    with session.begin():
+        # Chunked to stay within the bound parameter limit of sqlite
+        for i in xrange(0, len(addresses), 500):
+            chunk = addresses[i:i + 500]
+            allocated = session.query(models.FloatingIp.project_id,
+                                      func.count(models.FloatingIp.id)).\
+                    filter(models.FloatingIp.address.in_(chunk)).\
+                    filter(models.FloatingIp.project_id != None).\
+                    filter_by(auto_assigned=False).\
+                    filter_by(deleted=False).\
+                    group_by(models.FloatingIp.project_id).\
+                    all()
+            count += session.query(models.FloatingIp).\
+                    filter(models.FloatingIp.address.in_(chunk)).\
+                    filter_by(deleted=False).\
+                    update({'deleted': True,
+                            'deleted_at': utils.utcnow()},
+                           synchronize_session=False)
+            for project_id, project_count in allocated:
+                _quota_usage_update(session, project_id,
+                                    {'floating_ips': -project_count})
+    return count
+
+
 @require_context
 def floating_ip_count_by_project(context, project_id):
     authorize_project_context(context, project_id)
@@ -533,10 +664,12 @@ def floating_ip_deallocate(context, address):
         floating_ip_ref = floating_ip_get_by_address(context,
                                                      address,
                                                      session=session)
+        project_id = _floating_ip_quota_project(floating_ip_ref)
         floating_ip_ref['project_id'] = None
         floating_ip_ref['host'] = None
         floating_ip_ref['auto_assigned'] = False
         floating_ip_ref.save(session=session)
+        _floating_ip_quota_update(session, project_id, None)
 
 
 @require_context
@@ -547,7 +680,9 @@ def floating_ip_destroy(context, address):
         floating_ip_ref = floating_ip_get_by_address(context,
                                                      address,
                                                      session=session)
+        project_id = _floating_ip_quota_project(floating_ip_ref)
         floating_ip_ref.delete(session=session)
+        _floating_ip_quota_update(session, project_id, None)
 
 
 @require_context
@@ -576,8 +711,10 @@ def floating_ip_set_auto_assigned(context, address):
         floating_ip_ref = floating_ip_get_by_address(context,
                                                      address,
                                                      session=session)
+        project_id = _floating_ip_quota_project(floating_ip_ref)
         floating_ip_ref.auto_assigned = True
         floating_ip_ref.save(session=session)
+        _floating_ip_quota_update(session, project_id, None)
 
 
 @require_admin_context
@@ -639,12 +776,16 @@ def floating_ip_get_by_address(context, address, session=None):
 
 @require_context
 def floating_ip_update(context, address, values):
+    _quota_usages_create(values.get('project_id'), ['floating_ips'])
     session = get_session()
     with session.begin():
         floating_ip_ref = floating_ip_get_by_address(context, address, session)
+        project_id = _floating_ip_quota_project(floating_ip_ref)
         for (key, value) in values.iteritems():
             floating_ip_ref[key] = value
         floating_ip_ref.save(session=session)
+        _floating_ip_quota_update(session, project_id,
+                                  _floating_ip_quota_project(floating_ip_ref))
 
 
 ###################
@@ -1051,12 +1192,22 @@ def instance_create(context, values):
 
     instance_ref.update(values)
 
+    usage = _instance_quota_usage(instance_ref)
+    _quota_usages_create(instance_ref['project_id'], usage.keys())
     session = get_session()
     with session.begin():
         instance_ref.save(session=session)
+        _quota_usage_update(session, instance_ref['project_id'], usage)
     return instance_ref
 
 
+def _instance_quota_usage(instance_ref, sign=1):
+    """The usage of the instance, by quota resource."""
+    return {'instances': sign,
+            'cores': sign * (instance_ref['vcpus'] or 0),
+            'ram': sign * (instance_ref['memory_mb'] or 0)}
+
+
 @require_admin_context
 def instance_data_get_for_project(context, project_id):
     session = get_session()
@@ -1074,11 +1225,23 @@ def instance_data_get_for_project(context, project_id):
 def instance_destroy(context, instance_id):
     session = get_session()
     with session.begin():
-        session.query(models.Instance).\
+        usage = session.query(models.Instance.project_id,
+                              models.Instance.vcpus,
+                              models.Instance.memory_mb).\
+                        filter_by(id=instance_id).\
+                        filter_by(deleted=False).\
+                        first()
+        count = session.query(models.Instance).\
                 filter_by(id=instance_id).\
+                filter_by(deleted=False).\
                 update({'deleted': True,
                         'deleted_at': utils.utcnow(),
                         'updated_at': literal_column('updated_at')})
+        if count and usage:
+            project_id, vcpus, memory_mb = usage
+            usage = _instance_quota_usage({'vcpus': vcpus,
+                                           'memory_mb': memory_mb}, sign=-1)
+            _quota_usage_update(session, project_id, usage)
         session.query(models.SecurityGroupInstanceAssociation).\
                 filter_by(instance_id=instance_id).\
                 update({'deleted': True,
@@ -1168,6 +1331,85 @@ def instance_get_all(context):
                    all()
 
 
+@require_context
+def instance_get_all_by_filters(context, filters, marker=None, limit=None,
+                                offset=None, detailed=True):
+    """Return instances that match all of the given filters.
+
+    Recognized filters are project_id, user_id, reservation_id,
+    display_name, state (a list of power states, None meaning no state
+    yet) and changes-since (a datetime compared against updated_at, or
+    created_at for instances never updated).
+
+    Results are ordered by id so they can be paged with 'marker', the id
+    of the last instance the caller has seen, and 'limit'; MarkerNotFound
+    is raised if the marker is not an instance of the project and user
+    filtered on.  The marker need not match the other filters, since the
+    instance it names may have changed state since the last page.
+    'offset' is only meant for the offset based v1.0 OpenStack API.
+    Related rows are eagerly loaded only if 'detailed' is set.
+    """
+    filters = dict(filters)
+    if is_user_context(context):
+        project_id = filters.setdefault('project_id', context.project_id)
+        authorize_project_context(context, project_id)
+
+    session = get_session()
+    query = session.query(models.Instance)
+    if detailed:
+        query = query.options(joinedload_all('fixed_ips.floating_ips')).\
+                      options(joinedload('virtual_interfaces')).\
+                      options(joinedload('security_groups')).\
+                      options(joinedload_all('fixed_ips.network')).\
+                      options(joinedload('metadata')).\
+                      options(joinedload('instance_type'))
+    scope = [models.Instance.deleted == can_read_deleted(context)]
+    for key in ('project_id', 'user_id'):
+        if filters.get(key) is not None:
+            scope.append(getattr(models.Instance, key) == filters[key])
+
+    if marker is not None:
+        if not session.query(models.Instance.id).\
+                       filter(models.Instance.id == marker).\
+                       filter(and_(*scope)).\
+                       count():
+            raise exception.MarkerNotFound(marker=marker)
+        scope.append(models.Instance.id > marker)
+    query = query.filter(and_(*scope))
+
+    for key in ('reservation_id', 'display_name'):
+        if filters.get(key) is not None:
+            query = query.filter(getattr(models.Instance, key) == filters[key])
+
+    if 'state' in filters:
+        states = list(filters['state'])
+        state_filter = models.Instance.state.in_(
+                [state for state in states if state is not None])
+        if None in states:
+            state_filter = or_(state_filter, models.Instance.state == None)
+        query = query.filter(state_filter)
+
+    if filters.get('changes-since'):
+        changed_at = func.coalesce(models.Instance.updated_at,
+                                   models.Instance.created_at)
+        query = query.filter(changed_at >= filters['changes-since'])
+
+    query = query.order_by(models.Instance.id)
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def _filter_active_by_window(query, begin, end):
+    query = query.filter(models.Instance.launched_at < begin)
+    if end:
+        return query.filter(or_(models.Instance.terminated_at == None,
+                                models.Instance.terminated_at > end))
+    return query.filter(models.Instance.terminated_at == None)
+
+
 @require_admin_context
 def instance_get_active_by_window(context, begin, end=None):
     """Return instances that were continuously active over the given window"""
@@ -1176,14 +1418,53 @@ def instance_get_active_by_window(context, begin, end=None):
                    options(joinedload_all('fixed_ips.floating_ips')).\
                    options(joinedload('security_groups')).\
                    options(joinedload_all('fixed_ips.network')).\
-                   options(joinedload('instance_type')).\
-                   filter(models.Instance.launched_at < begin)
-    if end:
-        query = query.filter(or_(models.Instance.terminated_at == None,
-                                 models.Instance.terminated_at > end))
-    else:
-        query = query.filter(models.Instance.terminated_at == None)
-    return query.all()
+                   options(joinedload('instance_type'))
+    return _filter_active_by_window(query, begin, end).all()
+
+
+_USAGE_COLUMNS = ('id', 'project_id', 'user_id', 'instance_type_id',
+                  'display_name', 'created_at', 'launched_at', 'image_ref')
+
+
+@require_admin_context
+def instance_usage_get_active_by_window(context, begin, end=None,
+                                        marker=None, limit=None):
+    """Return the usage of instances continuously active over the window.
+
+    Only the columns usage notifications are built from are loaded, as
+    dicts with the instance type name under 'instance_type'.  Results are
+    ordered by id so they can be paged with 'marker' and 'limit'.
+    """
+    session = get_session()
+    columns = [getattr(models.Instance, column) for column in _USAGE_COLUMNS]
+    columns.append(models.InstanceTypes.name)
+    query = session.query(*columns).\
+                   outerjoin((models.InstanceTypes,
+                              models.Instance.instance_type_id ==
+                              models.InstanceTypes.id))
+    query = _filter_active_by_window(query, begin, end)
+    if marker is not None:
+        query = query.filter(models.Instance.id > marker)
+    query = query.order_by(models.Instance.id)
+    if limit is not None:
+        query = query.limit(limit)
+    usages = []
+    for row in query.all():
+        usage = dict(zip(_USAGE_COLUMNS, row))
+        usage['instance_type'] = {'name': row[-1]}
+        usages.append(usage)
+    return usages
+
+
+@require_admin_context
+def instance_count_active_by_window(context, begin, end=None, marker=None):
+    """Count instances continuously active over the window after marker."""
+    session = get_session()
+    query = session.query(func.count(models.Instance.id))
+    query = _filter_active_by_window(query, begin, end)
+    if marker is not None:
+        query = query.filter(models.Instance.id > marker)
+    return query.scalar()
 
 
 @require_admin_context
@@ -1216,6 +1497,21 @@ def instance_get_all_by_host(context, host):
                    all()
 
 
+@require_admin_context
+def instance_get_all_states_by_host(context, host):
+    session = get_session()
+    rows = session.query(models.Instance.id,
+                         models.Instance.state,
+                         models.Instance.state_description).\
+                   filter(models.Instance.host == host).\
+                   filter(models.Instance.deleted ==
+                          can_read_deleted(context)).\
+                   all()
+    return [dict(id=id, name=FLAGS.instance_name_template % id,
+                 state=state, state_description=state_description)
+            for id, state, state_description in rows]
+
+
 @require_context
 def instance_get_all_by_project(context, project_id):
     authorize_project_context(context, project_id)
@@ -1340,6 +1636,22 @@ def instance_set_state(context, instance_id, state, description=None):
                         'state_description': description})
 
 
+@require_admin_context
+def instance_set_states(context, states):
+    from nova.compute import power_state
+    ids_by_state = {}
+    for instance_id, state in states.iteritems():
+        ids_by_state.setdefault(state, []).append(instance_id)
+    session = get_session()
+    with session.begin():
+        for state, ids in ids_by_state.iteritems():
+            session.query(models.Instance).\
+                    filter(models.Instance.id.in_(ids)).\
+                    update({'state': state,
+                            'state_description': power_state.name(state)},
+                           synchronize_session=False)
+
+
 @require_context
 def instance_update(context, instance_id, values):
     session = get_session()
@@ -1354,8 +1666,18 @@ def instance_update(context, instance_id, values):
                                                 session=session)
         else:
             instance_ref = instance_get(context, instance_id, session=session)
+        if (not instance_ref['deleted'] and
+            ('vcpus' in values or 'memory_mb' in values)):
+            usage = _instance_quota_usage(instance_ref, sign=-1)
+        else:
+            usage = None
         instance_ref.update(values)
         instance_ref.save(session=session)
+        if usage:
+            for resource, used in _instance_quota_usage(instance_ref).\
+                                  iteritems():
+                usage[resource] += used
+            _quota_usage_update(session, instance_ref['project_id'], usage)
         return instance_ref
 
 
@@ -1932,6 +2254,263 @@ def quota_destroy_all_by_project(context, project_id):
 ###################
 
 
+def _quota_usages_create(project_id, resources):
+    """Creates the usages of the resources by the project there are none of.
+
+    Called before the transaction updating the usages.  Each usage is
+    inserted in its own transaction; when a concurrent request inserted it
+    first the unique index on project_id and resource rejects the insert,
+    and the usage created by that request is used.
+    """
+    if not project_id:
+        return
+    session = get_session()
+    existing = session.query(models.QuotaUsage.resource).\
+                       filter_by(project_id=project_id).\
+                       filter(models.QuotaUsage.resource.in_(resources)).\
+                       all()
+    existing = set(resource for resource, in existing)
+    for resource in resources:
+        if resource in existing:
+            continue
+        try:
+            session.execute(models.QuotaUsage.__table__.insert(),
+                            {'created_at': utils.utcnow(),
+                             'deleted': False,
+                             'project_id': project_id,
+                             'resource': resource,
+                             'in_use': 0,
+                             'reserved': 0})
+        except IntegrityError:
+            # Created by a concurrent request
+            pass
+
+
+def _quota_usage_query(session, project_id, resource):
+    return session.query(models.QuotaUsage).\
+                   filter_by(project_id=project_id).\
+                   filter_by(resource=resource)
+
+
+def _quota_usage_update(session, project_id, deltas):
+    """Adds deltas, by resource, to the usages of the project.
+
+    Called in the transaction creating or destroying the resources.  The
+    usages of resources being created must have been created beforehand
+    by _quota_usages_create.
+    """
+    if not project_id:
+        return
+    for resource, delta in deltas.iteritems():
+        if not delta:
+            continue
+        _quota_usage_query(session, project_id, resource).\
+                update({'in_use': models.QuotaUsage.in_use + delta,
+                        'updated_at': utils.utcnow()},
+                       synchronize_session=False)
+
+
+@require_context
+def quota_usage_get_all_by_project(context, project_id):
+    """Returns the quotas and the usages of the project.
+
+    Both are read by a single query.  The quotas are as returned by
+    quota_get_all_by_project, the usages map each resource to its in_use
+    and reserved counts.
+    """
+    authorize_project_context(context, project_id)
+    quotas = models.Quota.__table__
+    usages = models.QuotaUsage.__table__
+    query = union_all(
+            select([literal(True).label('is_quota'), quotas.c.resource,
+                    quotas.c.hard_limit, null().label('in_use'),
+                    null().label('reserved')],
+                   and_(quotas.c.project_id == project_id,
+                        quotas.c.deleted == False)),
+            select([literal(False).label('is_quota'), usages.c.resource,
+                    null().label('hard_limit'), usages.c.in_use,
+                    usages.c.reserved],
+                   and_(usages.c.project_id == project_id,
+                        usages.c.deleted == False)))
+    quota = {'project_id': project_id}
+    usage = {}
+    for is_quota, resource, hard_limit, in_use, reserved in \
+            get_session().execute(query):
+        if is_quota:
+            quota[resource] = hard_limit
+        else:
+            counts = usage.setdefault(resource, {'in_use': 0, 'reserved': 0})
+            counts['in_use'] += in_use
+            counts['reserved'] += reserved
+    return quota, usage
+
+
+@require_context
+def quota_usage_reserve(context, project_id, deltas, quotas, expire):
+    """Reserves deltas, by resource, of the quotas of the project.
+
+    quotas maps the resources to their hard limit, None when unlimited.
+    Either all the resources are reserved, and the uuids of the
+    reservations are returned, or QuotaUsageExceeded is raised for the
+    first resource that would exceed its quota.  The reservations are
+    released by quota_reservation_release, or by quota_usage_sync once
+    past expire.
+    """
+    authorize_project_context(context, project_id)
+    _quota_usages_create(project_id, deltas.keys())
+    reservations = []
+    session = get_session()
+    with session.begin():
+        for resource, delta in deltas.iteritems():
+            query = _quota_usage_query(session, project_id, resource)
+            if quotas.get(resource) is not None:
+                query = query.filter(models.QuotaUsage.in_use +
+                                     models.QuotaUsage.reserved + delta <=
+                                     quotas[resource])
+            count = query.update({'reserved': models.QuotaUsage.reserved +
+                                              delta,
+                                  'updated_at': utils.utcnow()},
+                                 synchronize_session=False)
+            if not count:
+                raise exception.QuotaUsageExceeded(resource=resource,
+                                                   project_id=project_id)
+            reservation_ref = models.Reservation()
+            reservation_ref.update({'uuid': str(utils.gen_uuid()),
+                                    'project_id': project_id,
+                                    'resource': resource,
+                                    'delta': delta,
+                                    'expire': expire})
+            reservation_ref.save(session=session)
+            reservations.append(reservation_ref['uuid'])
+    return reservations
+
+
+@require_context
+def quota_reservation_release(context, reservations):
+    """Releases the reservations with the uuids reservations.
+
+    Reservations already released or expired are skipped.
+    """
+    if not reservations:
+        return
+    session = get_session()
+    with session.begin():
+        reservation_refs = session.query(models.Reservation).\
+                filter(models.Reservation.uuid.in_(reservations)).\
+                filter_by(deleted=False).\
+                with_lockmode('update').\
+                all()
+        for reservation_ref in reservation_refs:
+            delta = reservation_ref['delta']
+            reserved = case([(models.QuotaUsage.reserved > delta,
+                              models.QuotaUsage.reserved - delta)],
+                            else_=0)
+            _quota_usage_query(session, reservation_ref['project_id'],
+                               reservation_ref['resource']).\
+                    update({'reserved': reserved,
+                            'updated_at': utils.utcnow()},
+                           synchronize_session=False)
+            reservation_ref.delete(session=session)
+
+
+def _quota_usages_actual(session, project_id=None):
+    """Counts the resources of the projects, by project and resource."""
+    queries = [
+        (('instances', 'cores', 'ram'),
+         session.query(models.Instance.project_id,
+                       func.count(models.Instance.id),
+                       func.sum(models.Instance.vcpus),
+                       func.sum(models.Instance.memory_mb)).\
+                 filter_by(deleted=False).\
+                 group_by(models.Instance.project_id)),
+        (('volumes', 'gigabytes'),
+         session.query(models.Volume.project_id,
+                       func.count(models.Volume.id),
+                       func.sum(models.Volume.size)).\
+                 filter_by(deleted=False).\
+                 group_by(models.Volume.project_id)),
+        (('floating_ips',),
+         session.query(models.FloatingIp.project_id,
+                       func.count(models.FloatingIp.id)).\
+                 filter(models.FloatingIp.project_id != None).\
+                 filter_by(auto_assigned=False).\
+                 filter_by(deleted=False).\
+                 group_by(models.FloatingIp.project_id))]
+    actual = {}
+    for resources, query in queries:
+        if project_id:
+            query = query.filter_by(project_id=project_id)
+        for row in query.all():
+            for resource, in_use in zip(resources, row[1:]):
+                actual[(row[0], resource)] = in_use or 0
+    return actual
+
+
+@require_admin_context
+def quota_usage_sync(context, project_id=None):
+    """Sets the usages of the projects to the resources they have.
+
+    Repairs the usages that drifted from the instances, volumes and
+    floating ips of the project, or of all projects when project_id is
+    None.  Reservations past their expire time are dropped, and reserved
+    is set to the sum of the remaining ones.  Returns (project_id,
+    resource, in_use, actual) for each usage repaired.
+    """
+    session = get_session()
+    repaired = []
+    with session.begin():
+        # The usages are locked first, so that resources created or
+        # destroyed meanwhile update them after they are repaired
+        query = session.query(models.QuotaUsage).\
+                        filter_by(deleted=False).\
+                        with_lockmode('update')
+        if project_id:
+            query = query.filter_by(project_id=project_id)
+        usages = dict(((usage_ref['project_id'], usage_ref['resource']),
+                       usage_ref)
+                      for usage_ref in query.all())
+
+        expired = session.query(models.Reservation).\
+                          filter(models.Reservation.expire < utils.utcnow()).\
+                          filter_by(deleted=False)
+        reserved = session.query(models.Reservation.project_id,
+                                 models.Reservation.resource,
+                                 func.sum(models.Reservation.delta)).\
+                           filter_by(deleted=False).\
+                           group_by(models.Reservation.project_id,
+                                    models.Reservation.resource)
+        if project_id:
+            expired = expired.filter_by(project_id=project_id)
+            reserved = reserved.filter_by(project_id=project_id)
+        expired.update({'deleted': True,
+                        'deleted_at': utils.utcnow()},
+                       synchronize_session=False)
+        reserved = dict(((row[0], row[1]), row[2]) for row in reserved.all())
+
+        actual = _quota_usages_actual(session, project_id)
+        for key, usage_ref in usages.iteritems():
+            in_use = actual.pop(key, 0)
+            if usage_ref['in_use'] != in_use:
+                repaired.append(key + (usage_ref['in_use'], in_use))
+                usage_ref['in_use'] = in_use
+            usage_ref['reserved'] = reserved.get(key) or 0
+            usage_ref.save(session=session)
+        for (usage_project_id, resource), in_use in actual.iteritems():
+            if not in_use:
+                continue
+            repaired.append((usage_project_id, resource, 0, in_use))
+            usage_ref = models.QuotaUsage()
+            usage_ref.update({'project_id': usage_project_id,
+                              'resource': resource,
+                              'in_use': in_use,
+                              'reserved': 0})
+            usage_ref.save(session=session)
+    return repaired
+
+
+###################
+
+
 @require_admin_context
 def volume_allocate_shelf_and_blade(context, volume_id):
     session = get_session()
@@ -1987,9 +2566,13 @@ def volume_create(context, values):
     volume_ref = models.Volume()
     volume_ref.update(values)
 
+    _quota_usages_create(volume_ref['project_id'], ['volumes', 'gigabytes'])
     session = get_session()
     with session.begin():
         volume_ref.save(session=session)
+        _quota_usage_update(session, volume_ref['project_id'],
+                            {'volumes': 1,
+                             'gigabytes': volume_ref['size'] or 0})
     return volume_ref
 
 
@@ -2009,11 +2592,21 @@ def volume_data_get_for_project(context, project_id):
 def volume_destroy(context, volume_id):
     session = get_session()
     with session.begin():
-        session.query(models.Volume).\
+        usage = session.query(models.Volume.project_id,
+                              models.Volume.size).\
+                        filter_by(id=volume_id).\
+                        filter_by(deleted=False).\
+                        first()
+        count = session.query(models.Volume).\
                 filter_by(id=volume_id).\
+                filter_by(deleted=False).\
                 update({'deleted': True,
                         'deleted_at': utils.utcnow(),
                         'updated_at': literal_column('updated_at')})
+        if count and usage:
+            project_id, size = usage
+            _quota_usage_update(session, project_id,
+                                {'volumes': -1, 'gigabytes': -(size or 0)})
         session.query(models.ExportDevice).\
                 filter_by(volume_id=volume_id).\
                 update({'volume_id': None})
@@ -2834,6 +3427,18 @@ def migration_get_by_instance_and_status(context, instance_uuid, status):
     return result
 
 
+@require_admin_context
+def migration_get_all_by_instances_and_status(context, instance_uuids,
+                                              status):
+    if not instance_uuids:
+        return []
+    session = get_session()
+    return session.query(models.Migration).\
+                   filter(models.Migration.instance_uuid.in_(instance_uuids)).\
+                   filter_by(status=status).\
+                   all()
+
+
 ##################
 
 
@@ -3212,6 +3817,41 @@ def instance_metadata_update_or_create(context, instance_id, metadata):
 ####################
 
 
+@require_context
+def instance_info_cache_get(context, instance_id, session=None):
+    """Return the info cache of the instance, or None if it has none."""
+    session = session or get_session()
+    return session.query(models.InstanceInfoCache).\
+                   filter_by(instance_id=instance_id).\
+                   first()
+
+
+@require_context
+def instance_info_cache_update(context, instance_id, values):
+    session = get_session()
+    with session.begin():
+        info_cache = instance_info_cache_get(context, instance_id,
+                                             session=session)
+        if not info_cache:
+            info_cache = models.InstanceInfoCache()
+            info_cache['instance_id'] = instance_id
+        info_cache.update(values)
+        info_cache.save(session=session)
+    return info_cache
+
+
+@require_context
+def instance_info_cache_delete(context, instance_id):
+    session = get_session()
+    with session.begin():
+        session.query(models.InstanceInfoCache).\
+                filter_by(instance_id=instance_id).\
+                delete(synchronize_session=False)
+
+
+####################
+
+
 @require_admin_context
 def agent_build_create(context, values):
     agent_build_ref = models.AgentBuild()
@@ -3328,3 +3968,177 @@ def instance_type_extra_specs_update_or_create(context, instance_type_id,
                          "deleted": 0})
         spec_ref.save(session=session)
     return specs
+
+
+####################
+
+
+# Tables archived by archive_deleted_rows, each before the tables its rows
+# reference.  Rows referencing a deleted row of an archived table, such as
+# the actions of a deleted instance, are archived with that row.
+ARCHIVED_TABLES = ['instance_actions',
+                   'instance_metadata',
+                   'instance_info_caches',
+                   'security_group_instance_association',
+                   'block_device_mapping',
+                   'migrations',
+                   'instances']
+
+_archive_meta = {}
+
+
+def _archive_metadata(session):
+    """Returns the reflected tables, reflecting them once per engine."""
+    if session.bind not in _archive_meta:
+        meta = MetaData(bind=session.bind)
+        meta.reflect()
+        _archive_meta[session.bind] = meta
+    return _archive_meta[session.bind]
+
+
+def _archive_dependents(meta, table):
+    """Returns the foreign keys of the archived tables to table."""
+    return [fk for name in ARCHIVED_TABLES
+               for fk in meta.tables[name].foreign_keys
+               if fk.column.table is table]
+
+
+def _archivable(meta, table, before):
+    """Returns the clause selecting the rows of table to archive."""
+    archivable = and_(table.c.deleted == True, table.c.deleted_at < before)
+
+    # Rows of a deleted row of an archived table wait to be archived with it
+    for fk in table.foreign_keys:
+        parent = fk.column.table
+        if parent.name in ARCHIVED_TABLES:
+            archivable = and_(archivable,
+                              ~exists([parent.c.id]).where(
+                                      and_(fk.parent == fk.column,
+                                           parent.c.deleted == True)))
+
+    # Rows still referenced from another table stay
+    for other in meta.tables.values():
+        if other.name.startswith('shadow_') or other.name in ARCHIVED_TABLES:
+            continue
+        for fk in other.foreign_keys:
+            if fk.column.table is table:
+                archivable = and_(archivable,
+                                  ~exists([fk.parent]).where(
+                                          fk.parent == fk.column))
+    return archivable
+
+
+def _archive_batch(session, meta, table, ids, max_rows):
+    """Returns the first ids whose rows and dependent rows fit in max_rows.
+
+    The first id is always returned, so that a row with more dependent
+    rows than max_rows is archived anyway.
+    """
+    row_counts = dict((id, 1) for id in ids)
+    for fk in _archive_dependents(meta, table):
+        query = select([fk.parent, func.count()]).\
+                       where(fk.parent.in_(ids)).\
+                       group_by(fk.parent)
+        for id, count in session.execute(query):
+            row_counts[id] += count
+    batch = []
+    for id in ids:
+        max_rows -= row_counts[id]
+        if batch and max_rows < 0:
+            break
+        batch.append(id)
+    return batch
+
+
+def _archive_rows(session, meta, table, where, now):
+    """Moves the rows of table matching where into its shadow table."""
+    rows = []
+    for row in session.execute(table.select().where(where)):
+        row = dict(row)
+        # Rows archived with the row they belong to are marked deleted when
+        # they are archived
+        if not row['deleted']:
+            row.update(deleted=True, deleted_at=now)
+        rows.append(row)
+    if rows:
+        shadow = meta.tables['shadow_%s' % table.name]
+        session.execute(shadow.insert(), rows)
+        session.execute(table.delete().where(
+                table.c.id.in_([row['id'] for row in rows])))
+    return len(rows)
+
+
+@require_admin_context
+def archive_deleted_rows(context, before, max_rows):
+    """Moves about max_rows rows deleted before into the shadow tables.
+
+    The rows of a deleted instance, such as its actions, are archived in
+    the same transaction as the instance, which may exceed max_rows for
+    an instance with more rows than that.  Returns the number of rows
+    archived from each table.
+    """
+    session = get_session()
+    meta = _archive_metadata(session)
+    archived = {}
+    for name in ARCHIVED_TABLES:
+        if max_rows <= 0:
+            break
+        table = meta.tables[name]
+        archivable = _archivable(meta, table, before)
+        query = select([table.c.id]).\
+                       where(archivable).\
+                       order_by(table.c.id).\
+                       limit(max_rows)
+        ids = [row[0] for row in session.execute(query)]
+        if not ids:
+            continue
+        now = utils.utcnow()
+        with session.begin():
+            # The rows are selected again in the transaction, in case
+            # one has been referred to since
+            query = select([table.c.id]).\
+                           where(and_(table.c.id.in_(ids), archivable)).\
+                           order_by(table.c.id)
+            ids = [row[0] for row in session.execute(query)]
+            if not ids:
+                continue
+            ids = _archive_batch(session, meta, table, ids, max_rows)
+            for fk in _archive_dependents(meta, table):
+                count = _archive_rows(session, meta, fk.parent.table,
+                                      fk.parent.in_(ids), now)
+                if count:
+                    dependent = fk.parent.table.name
+                    archived[dependent] = archived.get(dependent, 0) + count
+                    max_rows -= count
+            count = _archive_rows(session, meta, table,
+                                  table.c.id.in_(ids), now)
+        archived[name] = archived.get(name, 0) + count
+        max_rows -= count
+    return archived
+
+
+@require_admin_context
+def purge_shadow_rows(context, before, max_rows):
+    """Deletes up to max_rows shadow table rows deleted before.
+
+    Returns the number of rows deleted from each shadow table.
+    """
+    session = get_session()
+    meta = _archive_metadata(session)
+    purged = {}
+    for name in ARCHIVED_TABLES:
+        if max_rows <= 0:
+            break
+        shadow = meta.tables['shadow_%s' % name]
+        query = select([shadow.c.id]).\
+                       where(shadow.c.deleted_at < before).\
+                       order_by(shadow.c.id).\
+                       limit(max_rows)
+        ids = [row[0] for row in session.execute(query)]
+        if not ids:
+            continue
+        with session.begin():
+            session.execute(shadow.delete().where(shadow.c.id.in_(ids)))
+        purged[shadow.name] = len(ids)
+        max_rows -= len(ids)
+    return purged
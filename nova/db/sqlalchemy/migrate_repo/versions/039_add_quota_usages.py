@@ -0,0 +1,100 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, String
+from sqlalchemy import Table, and_, func, select
+from nova import log as logging
+
+meta = MetaData()
+
+#
+# New Tables
+#
+
+quota_usages = Table('quota_usages', meta,
+        Column('created_at', DateTime(timezone=False)),
+        Column('updated_at', DateTime(timezone=False)),
+        Column('deleted_at', DateTime(timezone=False)),
+        Column('deleted', Boolean(create_constraint=True, name=None)),
+        Column('id', Integer(), primary_key=True, nullable=False),
+        Column('project_id',
+               String(length=255, convert_unicode=False, assert_unicode=None,
+                      unicode_error=None, _warn_on_bytestring=False),
+               index=True),
+        Column('resource',
+               String(length=255, convert_unicode=False, assert_unicode=None,
+                      unicode_error=None, _warn_on_bytestring=False)),
+        Column('in_use', Integer(), nullable=False),
+        Column('reserved', Integer(), nullable=False))
+
+
+def _usages(migrate_engine):
+    """The usage of the projects, by project and resource."""
+    instances = Table('instances', meta, autoload=True)
+    volumes = Table('volumes', meta, autoload=True)
+    floating_ips = Table('floating_ips', meta, autoload=True)
+    queries = [
+        (('instances', 'cores', 'ram'),
+         select([instances.c.project_id, func.count(instances.c.id),
+                 func.sum(instances.c.vcpus),
+                 func.sum(instances.c.memory_mb)],
+                instances.c.deleted == False,
+                group_by=[instances.c.project_id])),
+        (('volumes', 'gigabytes'),
+         select([volumes.c.project_id, func.count(volumes.c.id),
+                 func.sum(volumes.c.size)],
+                volumes.c.deleted == False,
+                group_by=[volumes.c.project_id])),
+        (('floating_ips',),
+         select([floating_ips.c.project_id, func.count(floating_ips.c.id)],
+                and_(floating_ips.c.deleted == False,
+                     floating_ips.c.project_id != None,
+                     floating_ips.c.auto_assigned == False),
+                group_by=[floating_ips.c.project_id]))]
+    usages = []
+    for resources, query in queries:
+        for row in migrate_engine.execute(query):
+            for resource, in_use in zip(resources, row[1:]):
+                usages.append((row[0], resource, in_use or 0))
+    return usages
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine;
+    # bind migrate_engine to your metadata
+    meta.bind = migrate_engine
+    try:
+        quota_usages.create()
+    except Exception:
+        logging.info(repr(quota_usages))
+        logging.exception('Exception while creating table')
+        raise
+
+    now = datetime.datetime.utcnow()
+    rows = [dict(created_at=now, deleted=False, project_id=project_id,
+                 resource=resource, in_use=in_use, reserved=0)
+            for project_id, resource, in_use in _usages(migrate_engine)]
+    if rows:
+        migrate_engine.execute(quota_usages.insert(), rows)
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    meta.bind = migrate_engine
+    quota_usages.drop()
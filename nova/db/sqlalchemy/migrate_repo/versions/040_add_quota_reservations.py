@@ -0,0 +1,88 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData
+from sqlalchemy import String, Table, select
+from nova import log as logging
+
+meta = MetaData()
+
+#
+# New Tables
+#
+
+reservations = Table('reservations', meta,
+        Column('created_at', DateTime(timezone=False)),
+        Column('updated_at', DateTime(timezone=False)),
+        Column('deleted_at', DateTime(timezone=False)),
+        Column('deleted', Boolean(create_constraint=True, name=None)),
+        Column('id', Integer(), primary_key=True, nullable=False),
+        Column('uuid',
+               String(length=36, convert_unicode=False, assert_unicode=None,
+                      unicode_error=None, _warn_on_bytestring=False),
+               nullable=False, index=True),
+        Column('project_id',
+               String(length=255, convert_unicode=False, assert_unicode=None,
+                      unicode_error=None, _warn_on_bytestring=False)),
+        Column('resource',
+               String(length=255, convert_unicode=False, assert_unicode=None,
+                      unicode_error=None, _warn_on_bytestring=False)),
+        Column('delta', Integer(), nullable=False),
+        Column('expire', DateTime(timezone=False)))
+
+
+def _merge_duplicate_usages(migrate_engine, quota_usages):
+    """Folds the usages created by concurrent first uses into one row."""
+    usages = {}
+    for row in migrate_engine.execute(select([quota_usages],
+                                             order_by=[quota_usages.c.id])):
+        key = (row['project_id'], row['resource'])
+        if key not in usages:
+            usages[key] = row
+            continue
+        first = usages[key]
+        migrate_engine.execute(quota_usages.update().
+                where(quota_usages.c.id == first['id']).
+                values(in_use=quota_usages.c.in_use + row['in_use'],
+                       reserved=quota_usages.c.reserved + row['reserved']))
+        migrate_engine.execute(quota_usages.delete().
+                where(quota_usages.c.id == row['id']))
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine;
+    # bind migrate_engine to your metadata
+    meta.bind = migrate_engine
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    _merge_duplicate_usages(migrate_engine, quota_usages)
+    Index('quota_usages_project_id_resource_idx', quota_usages.c.project_id,
+          quota_usages.c.resource, unique=True).create(migrate_engine)
+    try:
+        reservations.create()
+    except Exception:
+        logging.info(repr(reservations))
+        logging.exception('Exception while creating table')
+        raise
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    meta.bind = migrate_engine
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    Index('quota_usages_project_id_resource_idx', quota_usages.c.project_id,
+          quota_usages.c.resource, unique=True).drop(migrate_engine)
+    reservations.drop()
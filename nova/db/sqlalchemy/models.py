@@ -337,6 +337,39 @@ class Quota(BASE, NovaBase):
     hard_limit = Column(Integer, nullable=True)
 
 
+class QuotaUsage(BASE, NovaBase):
+    """Represents the usage of a resource by a project.
+
+    in_use is kept up to date by the database api calls creating and
+    destroying the resources.  reserved is the sum of the live
+    reservations of the resource by the project.  There is at most one
+    usage per project and resource.
+    """
+
+    __tablename__ = 'quota_usages'
+    id = Column(Integer, primary_key=True)
+
+    project_id = Column(String(255), index=True)
+
+    resource = Column(String(255))
+    in_use = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0)
+
+
+class Reservation(BASE, NovaBase):
+    """Represents quota reserved by a request until its resources are
+    created, or until it expires."""
+
+    __tablename__ = 'reservations'
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(36), nullable=False)
+
+    project_id = Column(String(255))
+    resource = Column(String(255))
+    delta = Column(Integer, nullable=False)
+    expire = Column(DateTime)
+
+
 class Snapshot(BASE, NovaBase):
     """Represents a block storage device that can be attached to a vm."""
     __tablename__ = 'snapshots'
@@ -754,6 +787,18 @@ class InstanceMetadata(BASE, NovaBase):
                                 'InstanceMetadata.deleted == False)')
 
 
+class InstanceInfoCache(BASE, NovaBase):
+    """Represents information about an instance cached for its consumers"""
+    __tablename__ = 'instance_info_caches'
+    id = Column(Integer, primary_key=True)
+    instance_id = Column(Integer, ForeignKey('instances.id'),
+                         nullable=False, unique=True)
+    # The host the information was built for
+    host = Column(String(255))
+    # json serialized network info, as returned by get_instance_nw_info
+    network_info = Column(Text)
+
+
 class InstanceTypeExtraSpecs(BASE, NovaBase):
     """Represents additional specs as key/value pairs for an instance_type"""
     __tablename__ = 'instance_type_extra_specs'
@@ -805,7 +850,8 @@ def register_models():
               Network, SecurityGroup, SecurityGroupIngressRule,
               SecurityGroupInstanceAssociation, AuthToken, User,
               Project, Certificate, ConsolePool, Console, Zone,
-              AgentBuild, InstanceMetadata, InstanceTypeExtraSpecs, Migration)
+              AgentBuild, InstanceMetadata, InstanceTypeExtraSpecs, Migration,
+              InstanceInfoCache, QuotaUsage, Reservation)
     engine = create_engine(FLAGS.sql_connection, echo=False)
     for model in models:
         model.metadata.create_all(engine)
@@ -19,18 +19,63 @@
 Session Handling for SQLAlchemy backend
 """
 
+from eventlet import patcher
 from sqlalchemy import create_engine
 from sqlalchemy import pool
+from sqlalchemy import queue as sqla_queue
 from sqlalchemy.orm import sessionmaker
 
 from nova import exception
 from nova import flags
 
 FLAGS = flags.FLAGS
+flags.DECLARE('db_use_tpool', 'nova.db.api')
 
 _ENGINE = None
 _MAKER = None
 
+# The threading module of the standard library, even once eventlet has
+# monkey patched it.
+_threading = patcher.original('threading')
+
+
+class _NativeQueue(sqla_queue.Queue):
+    """A sqlalchemy Queue whose locks are native thread locks."""
+
+    def __init__(self, maxsize=0):
+        sqla_queue.Queue.__init__(self, maxsize)
+        self.mutex = _threading.RLock()
+        self.not_empty = _threading.Condition(self.mutex)
+        self.not_full = _threading.Condition(self.mutex)
+
+
+class NativeQueuePool(pool.QueuePool):
+    """A QueuePool that can be shared by the native threads of tpool.
+
+    In processes which monkey patched threading before importing
+    sqlalchemy, the locks of QueuePool are green locks, which cannot be
+    waited for across native threads.  This pool uses native locks, so it
+    must only be used from native threads, as the db calls are when
+    db_use_tpool is set: a greenthread waiting for a connection would
+    block every other greenthread.
+    """
+
+    def __init__(self, creator, pool_size=5, **kw):
+        pool.QueuePool.__init__(self, creator, pool_size=pool_size, **kw)
+        self._pool = _NativeQueue(pool_size)
+        if self._overflow_lock is not None:
+            self._overflow_lock = _threading.Lock()
+
+    def recreate(self):
+        self.logger.info("Pool recreating")
+        return NativeQueuePool(self._creator, pool_size=self._pool.maxsize,
+                               max_overflow=self._max_overflow,
+                               timeout=self._timeout,
+                               recycle=self._recycle, echo=self.echo,
+                               logging_name=self._orig_logging_name,
+                               use_threadlocal=self._use_threadlocal,
+                               listeners=self.listeners)
+
 
 def get_session(autocommit=True, expire_on_commit=False):
     """Helper method to grab session"""
@@ -43,6 +88,12 @@ def get_session(autocommit=True, expire_on_commit=False):
 
             if FLAGS.sql_connection.startswith('sqlite'):
                 kwargs['poolclass'] = pool.NullPool
+            else:
+                kwargs['pool_size'] = FLAGS.sql_max_pool_size
+                kwargs['max_overflow'] = FLAGS.sql_max_overflow
+                kwargs['pool_timeout'] = FLAGS.sql_pool_timeout
+                if FLAGS.db_use_tpool:
+                    kwargs['poolclass'] = NativeQueuePool
 
             _ENGINE = create_engine(FLAGS.sql_connection,
                                     **kwargs)
@@ -304,6 +304,10 @@ class InstanceNotFound(NotFound):
     message = _("Instance %(instance_id)s could not be found.")
 
 
+class MarkerNotFound(NotFound):
+    message = _("Marker %(marker)s could not be found.")
+
+
 class VolumeNotFound(NotFound):
     message = _("Volume %(volume_id)s could not be found.")
 
@@ -336,6 +340,11 @@ class InvalidImageRef(Invalid):
     message = _("Invalid image href %(image_href)s.")
 
 
+class ImageChecksumMismatch(Invalid):
+    message = _("Checksum of image %(image_id)s is %(actual)s, "
+                "expected %(expected)s.")
+
+
 class ListingImageRefsNotSupported(Invalid):
     message = _("Some images have been stored via hrefs."
         + " This version of the api does not support displaying image hrefs.")
@@ -502,6 +511,10 @@ class ProjectQuotaNotFound(QuotaNotFound):
     message = _("Quota for project %(project_id)s could not be found.")
 
 
+class QuotaUsageExceeded(NovaException):
+    message = _("Quota of %(resource)s exceeded for project %(project_id)s.")
+
+
 class SecurityGroupNotFound(NotFound):
     message = _("Security group %(security_group_id)s not found.")
 
@@ -27,6 +27,9 @@ class Client(object):
     def __init__(self, *args, **kwargs):
         """Ignores the passed in args."""
         self.cache = {}
+        self._versions = {}
+        self.cas_ids = {}
+        self._next_version = 0
 
     def get(self, key):
         """Retrieves the value for a key or None."""
@@ -35,14 +38,31 @@ class Client(object):
             return value
         return None
 
+    def get_multi(self, keys):
+        """Retrieves the values for several keys, skipping missing ones."""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
     def set(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key."""
         timeout = 0
         if time != 0:
             timeout = utils.utcnow_ts() + time
         self.cache[key] = (timeout, value)
+        self._next_version += 1
+        self._versions[key] = self._next_version
         return True
 
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        self.cache.pop(key, None)
+        self._versions.pop(key, None)
+        return 1
+
     def add(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key if it doesn't exist."""
         if not self.get(key) is None:
@@ -56,4 +76,22 @@ class Client(object):
             return None
         new_value = int(value) + delta
         self.cache[key] = (self.cache[key][0], str(new_value))
+        self._next_version += 1
+        self._versions[key] = self._next_version
         return new_value
+
+    def gets(self, key):
+        """Retrieves the value for a key, remembering it for cas."""
+        value = self.get(key)
+        if value is not None:
+            self.cas_ids[key] = self._versions[key]
+        return value
+
+    def cas(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key if it is unchanged since gets."""
+        version = self.cas_ids.pop(key, None)
+        if version is None:
+            return self.set(key, value, time, min_compress_len)
+        if self.get(key) is None or self._versions[key] != version:
+            return False
+        return self.set(key, value, time, min_compress_len)
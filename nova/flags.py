@@ -353,6 +353,12 @@ DEFINE_integer('sql_idle_timeout',
               'timeout for idle sql database connections')
 DEFINE_integer('sql_max_retries', 12, 'sql connection attempts')
 DEFINE_integer('sql_retry_interval', 10, 'sql connection retry interval')
+DEFINE_integer('sql_max_pool_size', 5,
+               'maximum number of sql connections kept open in the pool')
+DEFINE_integer('sql_max_overflow', 10,
+               'sql connections allowed beyond sql_max_pool_size')
+DEFINE_integer('sql_pool_timeout', 30,
+               'seconds to wait for a sql connection from the pool')
 
 DEFINE_string('compute_manager', 'nova.compute.manager.ComputeManager',
               'Manager for compute')
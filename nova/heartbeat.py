@@ -0,0 +1,131 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Heartbeats of the services and whether they are up.
+
+Each service reports every report_interval seconds through the driver
+named by heartbeat_driver, and is up while its last report is less than
+service_down_time seconds old.
+
+DbHeartbeatDriver records the reports in the services table, each with a
+single UPDATE.  MemcacheHeartbeatDriver keeps them in memcached, as keys
+expiring after service_down_time, so reports do not write to the
+database at all.  Without memcached_servers, the services could not see
+each other's heartbeats, so DbHeartbeatDriver is used instead.
+"""
+
+import datetime
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('service_down_time', 60,
+                     'maximum time since last checkin for up service')
+flags.DEFINE_string('heartbeat_driver', 'nova.heartbeat.DbHeartbeatDriver',
+                    'Driver recording the heartbeats of the services')
+
+if FLAGS.memcached_servers:
+    import memcache
+else:
+    from nova import fakememcache as memcache
+
+LOG = logging.getLogger('nova.heartbeat')
+
+
+class HeartbeatDriver(object):
+    """Base class for heartbeat drivers."""
+
+    def beat(self, context, service_id, topic, host):
+        """Records a heartbeat of the service.
+
+        Raises ServiceNotFound if the service has no database entry.
+        """
+        raise NotImplementedError()
+
+    def is_up(self, service):
+        """Whether the service, a row of the services table, is up."""
+        raise NotImplementedError()
+
+    def get_hosts_up(self, context, topic):
+        """Returns the hosts of the enabled services of topic that are up.
+        """
+        raise NotImplementedError()
+
+
+class DbHeartbeatDriver(HeartbeatDriver):
+    """Records heartbeats in the report_count and updated_at columns."""
+
+    def beat(self, context, service_id, topic, host):
+        db.service_heartbeat(context, service_id)
+
+    def is_up(self, service):
+        last_heartbeat = service['updated_at'] or service['created_at']
+        # Timestamps in DB are UTC.
+        elapsed = utils.utcnow() - last_heartbeat
+        return elapsed < datetime.timedelta(seconds=FLAGS.service_down_time)
+
+    def get_hosts_up(self, context, topic):
+        since = utils.utcnow() - datetime.timedelta(
+                seconds=FLAGS.service_down_time)
+        return db.service_get_all_hosts_up(context, topic, since)
+
+
+class MemcacheHeartbeatDriver(HeartbeatDriver):
+    """Records heartbeats as memcached keys expiring when a service is
+    down.
+    """
+
+    def __init__(self):
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
+
+    def _key(self, topic, host):
+        return str('heartbeat-%s-%s' % (topic, host))
+
+    def beat(self, context, service_id, topic, host):
+        self.mc.set(self._key(topic, host), utils.utcnow_ts(),
+                    time=FLAGS.service_down_time)
+
+    def is_up(self, service):
+        key = self._key(service['topic'], service['host'])
+        return self.mc.get(key) is not None
+
+    def get_hosts_up(self, context, topic):
+        hosts = [service['host']
+                 for service in db.service_get_all_by_topic(context, topic)]
+        up = self.mc.get_multi([self._key(topic, host) for host in hosts])
+        return [host for host in hosts if self._key(topic, host) in up]
+
+
+_drivers = {}
+
+
+def get_driver():
+    """Returns the heartbeat_driver of this process."""
+    name = FLAGS.heartbeat_driver
+    if name not in _drivers:
+        driver_class = utils.import_class(name)
+        if (issubclass(driver_class, MemcacheHeartbeatDriver) and
+            not FLAGS.memcached_servers):
+            LOG.warn(_("%s needs memcached_servers, using "
+                       "DbHeartbeatDriver instead"), name)
+            driver_class = DbHeartbeatDriver
+        _drivers[name] = driver_class()
+    return _drivers[name]
@@ -19,6 +19,7 @@
 
 from __future__ import absolute_import
 
+import copy
 import datetime
 import random
 
@@ -35,6 +36,13 @@ LOG = logging.getLogger('nova.image.glance')
 
 
 FLAGS = flags.FLAGS
+flags.DEFINE_integer('glance_image_cache_size', 1000,
+                     'Number of image metadata entries cached per process')
+flags.DEFINE_integer('glance_image_cache_ttl', 60,
+                     'Seconds to cache image metadata, 0 disables the cache')
+flags.DEFINE_integer('glance_page_size', 25,
+                     'Number of images requested from glance per page, '
+                     'should not exceed the glance registry limit')
 
 
 GlanceClient = utils.import_class('glance.client.Client')
@@ -55,6 +63,69 @@ def pick_glance_api_server():
     return host, port
 
 
+class ImageMetaCache(object):
+    """Caches raw glance image metadata by id, with an index by name.
+
+    Entries expire after glance_image_cache_ttl seconds.  Callers purge
+    images they change; changes made elsewhere are seen once the entry
+    expires.  The name index is bounded like the metadata and may point
+    at an image that has since been renamed, so callers check the name of
+    the image they find.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.ttl = ttl
+        self._metas = utils.LRUCache(max_size, ttl)
+        self._names = utils.LRUCache(max_size, ttl)
+
+    @property
+    def hit_rate(self):
+        return self._metas.hit_rate
+
+    def get(self, image_id):
+        if self.ttl <= 0:
+            return None
+        image_meta = self._metas.get(str(image_id))
+        if image_meta is None:
+            LOG.debug(_('Image metadata cache miss for %(image_id)s '
+                        '(hit rate %(rate).2f)'),
+                      {'image_id': image_id, 'rate': self.hit_rate})
+            return None
+        return copy.deepcopy(image_meta)
+
+    def get_id_by_name(self, name):
+        return self._names.get(name)
+
+    def set(self, image_meta):
+        if self.ttl <= 0:
+            return
+        image_id = image_meta.get('id')
+        if image_id is None:
+            return
+        self._metas.set(str(image_id), copy.deepcopy(image_meta))
+        if image_meta.get('name'):
+            self._names.set(image_meta['name'], image_id)
+
+    def purge(self, image_id):
+        self._metas.delete(str(image_id))
+
+    def clear(self):
+        self._metas.clear()
+        self._names.clear()
+
+
+_image_meta_cache = None
+
+
+def get_image_meta_cache():
+    """Returns the cache shared by services using the default servers."""
+    global _image_meta_cache
+    if _image_meta_cache is None:
+        _image_meta_cache = ImageMetaCache(FLAGS.glance_image_cache_size,
+                                           FLAGS.glance_image_cache_ttl)
+    return _image_meta_cache
+
+
 class GlanceImageService(service.BaseImageService):
     """Provides storage and retrieval of disk image objects within Glance."""
 
@@ -66,8 +137,17 @@ class GlanceImageService(service.BaseImageService):
     SERVICE_IMAGE_ATTRS = service.BaseImageService.BASE_IMAGE_ATTRS +\
                           GLANCE_ONLY_ATTRS
 
-    def __init__(self, client=None):
+    def __init__(self, client=None, meta_cache=None):
         self._client = client
+        # Services talking to a specific glance server get a cache of
+        # their own, as image ids are only unique per server.
+        if meta_cache is None:
+            if client is None:
+                meta_cache = get_image_meta_cache()
+            else:
+                meta_cache = ImageMetaCache(FLAGS.glance_image_cache_size,
+                                            FLAGS.glance_image_cache_ttl)
+        self.meta_cache = meta_cache
 
     def _get_client(self):
         # NOTE(sirp): we want to load balance each request across glance
@@ -89,41 +169,61 @@ class GlanceImageService(service.BaseImageService):
         # `get_images` here because we need `is_public` and `properties`
         # included so we can filter by user
         filtered = []
-        filters = filters or {}
-        if 'is_public' not in filters:
-            # NOTE(vish): don't filter out private images
-            filters['is_public'] = 'none'
-        image_metas = self.client.get_images_detailed(filters=filters,
-                                                      marker=marker,
-                                                      limit=limit)
+        image_metas = self._get_images(context, filters, marker, limit)
         for image_meta in image_metas:
-            if self._is_image_available(context, image_meta):
-                meta_subset = utils.subset_dict(image_meta, ('id', 'name'))
-                filtered.append(meta_subset)
+            meta_subset = utils.subset_dict(image_meta, ('id', 'name'))
+            filtered.append(meta_subset)
         return filtered
 
     def detail(self, context, filters=None, marker=None, limit=None):
         """Calls out to Glance for a list of detailed image information."""
-        filtered = []
+        image_metas = self._get_images(context, filters, marker, limit)
+        return [self._translate_to_base(image_meta)
+                for image_meta in image_metas]
+
+    def _get_images(self, context, filters=None, marker=None, limit=None):
+        """Yields the available images, fetching pages from glance lazily.
+
+        Every image seen is also stored in the metadata cache.
+        """
         filters = filters or {}
         if 'is_public' not in filters:
             # NOTE(vish): don't filter out private images
             filters['is_public'] = 'none'
-        image_metas = self.client.get_images_detailed(filters=filters,
-                                                      marker=marker,
-                                                      limit=limit)
-        for image_meta in image_metas:
-            if self._is_image_available(context, image_meta):
-                base_image_meta = self._translate_to_base(image_meta)
-                filtered.append(base_image_meta)
-        return filtered
+        page_size = FLAGS.glance_page_size
+        while limit is None or limit > 0:
+            if limit is not None:
+                page_size = min(page_size, limit)
+            # The client adds marker and limit to the dict it is given
+            page = list(self.client.get_images_detailed(
+                    filters=dict(filters), marker=marker, limit=page_size))
+            for image_meta in page:
+                self.meta_cache.set(image_meta)
+                if not self._is_image_available(context, image_meta):
+                    continue
+                yield image_meta
+                if limit is not None:
+                    limit -= 1
+                    if limit == 0:
+                        return
+            if len(page) < page_size:
+                return
+            marker = page[-1]['id']
+
+    def _get_image_meta(self, image_id):
+        """Returns raw glance metadata for an image, using the cache."""
+        image_meta = self.meta_cache.get(image_id)
+        if image_meta is None:
+            try:
+                image_meta = self.client.get_image_meta(image_id)
+            except glance_exception.NotFound:
+                raise exception.ImageNotFound(image_id=image_id)
+            self.meta_cache.set(image_meta)
+        return image_meta
 
     def show(self, context, image_id):
         """Returns a dict with image data for the given opaque image id."""
-        try:
-            image_meta = self.client.get_image_meta(image_id)
-        except glance_exception.NotFound:
-            raise exception.ImageNotFound(image_id=image_id)
+        image_meta = self._get_image_meta(image_id)
 
         if not self._is_image_available(context, image_meta):
             raise exception.ImageNotFound(image_id=image_id)
@@ -133,12 +233,19 @@ class GlanceImageService(service.BaseImageService):
 
     def show_by_name(self, context, name):
         """Returns a dict containing image data for the given name."""
+        image_id = self.meta_cache.get_id_by_name(name)
+        if image_id is not None:
+            try:
+                image_meta = self.show(context, image_id)
+            except exception.ImageNotFound:
+                image_meta = None
+            if image_meta and image_meta.get('name') == name:
+                return image_meta
         # TODO(vish): replace this with more efficient call when glance
         #             supports it.
-        image_metas = self.detail(context)
-        for image_meta in image_metas:
+        for image_meta in self._get_images(context):
             if name == image_meta.get('name'):
-                return image_meta
+                return self._translate_to_base(image_meta)
         raise exception.ImageNotFound(image_id=name)
 
     def get(self, context, image_id, data):
@@ -184,10 +291,13 @@ class GlanceImageService(service.BaseImageService):
         """
         # NOTE(vish): show is to check if image is available
         self.show(context, image_id)
+        # The image may be shown, and cached again, while it is uploaded
         try:
             image_meta = self.client.update_image(image_id, image_meta, data)
         except glance_exception.NotFound:
             raise exception.ImageNotFound(image_id=image_id)
+        finally:
+            self.meta_cache.purge(image_id)
 
         base_image_meta = self._translate_to_base(image_meta)
         return base_image_meta
@@ -204,6 +314,8 @@ class GlanceImageService(service.BaseImageService):
             result = self.client.delete_image(image_id)
         except glance_exception.NotFound:
             raise exception.ImageNotFound(image_id=image_id)
+        finally:
+            self.meta_cache.purge(image_id)
         return result
 
     def delete_all(self):
@@ -18,6 +18,7 @@
 
 """Handles all requests relating to instances (guest vms)."""
 
+from nova import db
 from nova import exception
 from nova import flags
 from nova import log as logging
@@ -192,10 +193,26 @@ class API(base.Base):
                   'args': {'project_id': project_id}})
 
     def get_instance_nw_info(self, context, instance):
-        """Returns all network info related to an instance."""
+        """Returns all network info related to an instance.
+
+        The network info cached by the network manager is returned if it
+        was built for the host the instance is on.
+        """
+        network_info = get_cached_nw_info(context, instance)
+        if network_info is not None:
+            return network_info
         args = {'instance_id': instance['id'],
                 'instance_type_id': instance['instance_type_id'],
                 'host': instance['host']}
         return rpc.call(context, FLAGS.network_topic,
                         {'method': 'get_instance_nw_info',
                          'args': args})
+
+
+def get_cached_nw_info(context, instance):
+    """Returns the cached network info of an instance, or None."""
+    info_cache = db.instance_info_cache_get(context.elevated(),
+                                            instance['id'])
+    if not info_cache or info_cache['host'] != instance['host']:
+        return None
+    return [tuple(vif) for vif in utils.loads(info_cache['network_info'])]
@@ -257,15 +257,21 @@ class FloatingIP(object):
         """Gets an floating ip from the pool."""
         # NOTE(tr3buchet): all networks hosts in zone now use the same pool
         LOG.debug("QUOTA: %s" % quota.allowed_floating_ips(context, 1))
-        if quota.allowed_floating_ips(context, 1) < 1:
+        reservations = None
+        if quota.allowed_floating_ips(context, 1) >= 1:
+            reservations = quota.reserve_floating_ips(context, 1)
+        if reservations is None:
             LOG.warn(_('Quota exceeded for %s, tried to allocate '
                        'address'),
                      context.project_id)
             raise quota.QuotaError(_('Address quota exceeded. You cannot '
                                      'allocate any more addresses'))
         # TODO(vish): add floating ips through manage command
-        return self.db.floating_ip_allocate_address(context,
-                                                    project_id)
+        try:
+            return self.db.floating_ip_allocate_address(context,
+                                                        project_id)
+        finally:
+            quota.release(context, reservations)
 
     def associate_floating_ip(self, context, floating_address, fixed_address):
         """Associates an floating ip to a fixed ip."""
@@ -421,6 +427,7 @@ class NetworkManager(manager.SchedulerDependentManager):
 
         # deallocate vifs (mac addresses)
         self.db.virtual_interface_delete_by_instance(context, instance_id)
+        self.db.instance_info_cache_delete(context, instance_id)
 
     def get_instance_nw_info(self, context, instance_id,
                              instance_type_id, host, **kwargs):
@@ -428,6 +435,8 @@ class NetworkManager(manager.SchedulerDependentManager):
 
         called by allocate_for_instance and netowrk_api
         context needs to be elevated
+        The list is also stored in the info cache of the instance, where
+        network_api and the virt drivers read it from.
         :returns: network info list [(network,info),(network,info)...]
         where network = dict containing pertinent data from a network db object
         and info = dict containing pertinent networking data
@@ -470,6 +479,7 @@ class NetworkManager(manager.SchedulerDependentManager):
                 'id': network['id'],
                 'cidr': network['cidr'],
                 'cidr_v6': network['cidr_v6'],
+                'gateway_v6': network['gateway_v6'],
                 'injected': network['injected'],
                 'vlan': network['vlan'],
                 'bridge_interface': network['bridge_interface'],
@@ -503,6 +513,8 @@ class NetworkManager(manager.SchedulerDependentManager):
                 info['dns'].append(network['dns2'])
 
             network_info.append((network_dict, info))
+        self.db.instance_info_cache_update(context, instance_id,
+                {'host': host, 'network_info': utils.dumps(network_info)})
         return network_info
 
     def _allocate_mac_addresses(self, context, instance_id, networks):
@@ -535,6 +547,7 @@ class NetworkManager(manager.SchedulerDependentManager):
         """Adds a fixed ip to an instance from specified network."""
         networks = [self.db.network_get(context, network_id)]
         self._allocate_fixed_ips(context, instance_id, host, networks)
+        self.db.instance_info_cache_delete(context, instance_id)
 
     def remove_fixed_ip_from_instance(self, context, instance_id, address):
         """Removes a fixed ip from an instance from specified network."""
@@ -542,6 +555,7 @@ class NetworkManager(manager.SchedulerDependentManager):
         for fixed_ip in fixed_ips:
             if fixed_ip['address'] == address:
                 self.deallocate_fixed_ip(context, address)
+                self.db.instance_info_cache_delete(context, instance_id)
                 return
         raise exception.FixedIpNotFoundForSpecificInstance(
                                     instance_id=instance_id, ip=address)
@@ -81,14 +81,40 @@ def notify(publisher_id, event_type, priority, payload):
         raise BadPriorityException(
                  _('%s not in valid priorities' % priority))
     driver = utils.import_object(FLAGS.notification_driver)
-    msg = dict(message_id=str(uuid.uuid4()),
-                   publisher_id=publisher_id,
-                   event_type=event_type,
-                   priority=priority,
-                   payload=payload,
-                   timestamp=str(utils.utcnow()))
+    msg = _message(publisher_id, event_type, priority, payload)
     try:
         driver.notify(msg)
     except Exception, e:
         LOG.exception(_("Problem '%(e)s' attempting to "
                         "send to notification system." % locals()))
+
+
+def notify_many(publisher_id, event_type, priority, payloads):
+    """
+    Sends a notification of the same event for each of the payloads.
+
+    Drivers with a notify_many method are given all the messages at once,
+    so that they can send them together.  Others get them one at a time.
+    Unlike notify, errors sending the notifications are raised, so that
+    the caller knows which batch to send again.
+    """
+    if priority not in log_levels:
+        raise BadPriorityException(
+                 _('%s not in valid priorities' % priority))
+    driver = utils.import_object(FLAGS.notification_driver)
+    msgs = [_message(publisher_id, event_type, priority, payload)
+            for payload in payloads]
+    if hasattr(driver, 'notify_many'):
+        driver.notify_many(msgs)
+    else:
+        for msg in msgs:
+            driver.notify(msg)
+
+
+def _message(publisher_id, event_type, priority, payload):
+    return dict(message_id=str(uuid.uuid4()),
+                publisher_id=publisher_id,
+                event_type=event_type,
+                priority=priority,
+                payload=payload,
+                timestamp=str(utils.utcnow()))
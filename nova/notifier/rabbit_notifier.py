@@ -26,11 +26,23 @@ flags.DEFINE_string('notification_topic', 'notifications',
                     'RabbitMQ topic used for Nova notifications')
 
 
+def _topic(message):
+    priority = message.get('priority',
+                           FLAGS.default_notification_level)
+    return '%s.%s' % (FLAGS.notification_topic, priority.lower())
+
+
 def notify(message):
     """Sends a notification to the RabbitMQ"""
     context = nova.context.get_admin_context()
-    priority = message.get('priority',
-                           FLAGS.default_notification_level)
-    priority = priority.lower()
-    topic = '%s.%s' % (FLAGS.notification_topic, priority)
-    rpc.cast(context, topic, message)
+    rpc.cast(context, _topic(message), message)
+
+
+def notify_many(messages):
+    """Sends notifications to the RabbitMQ, one publisher per topic"""
+    context = nova.context.get_admin_context()
+    by_topic = {}
+    for message in messages:
+        by_topic.setdefault(_topic(message), []).append(message)
+    for topic, topic_messages in by_topic.iteritems():
+        rpc.cast_many(context, topic, topic_messages)
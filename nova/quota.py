@@ -16,11 +16,26 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Quotas for instances, volumes, and floating ips."""
+"""Quotas for instances, volumes, and floating ips.
+
+The usage of the projects is kept in the quota_usages table, which the
+database api calls creating and destroying instances, volumes and floating
+ips update in the same transaction, so checking a quota reads the usage
+instead of counting the resources.  Requests that pass the check reserve
+what they are about to create, and release the reservations once the
+resources are created or the request failed.  Reservations that are never
+released expire quota_reservation_expire seconds after they were made,
+when the usages are synced with the resources every
+quota_usage_sync_interval seconds.
+"""
+
+import datetime
 
 from nova import db
 from nova import exception
 from nova import flags
+from nova import log as logging
+from nova import utils
 
 
 FLAGS = flags.FLAGS
@@ -44,6 +59,13 @@ flags.DEFINE_integer('quota_max_injected_file_content_bytes', 10 * 1024,
                      'number of bytes allowed per injected file')
 flags.DEFINE_integer('quota_max_injected_file_path_bytes', 255,
                      'number of bytes allowed per injected file path')
+flags.DEFINE_integer('quota_usage_sync_interval', 3600,
+                     'seconds between syncs of the quota usages with the '
+                     'resources of the projects, 0 to disable')
+flags.DEFINE_integer('quota_reservation_expire', 600,
+                     'seconds after which unused quota reservations expire')
+
+LOG = logging.getLogger('nova.quota')
 
 
 def _get_default_quotas():
@@ -66,15 +88,27 @@ def _get_default_quotas():
     return defaults
 
 
-def get_project_quotas(context, project_id):
+def _get_quotas(quota):
     rval = _get_default_quotas()
-    quota = db.quota_get_all_by_project(context, project_id)
     for key in rval.keys():
         if key in quota:
             rval[key] = quota[key]
     return rval
 
 
+def get_project_quotas(context, project_id):
+    return _get_quotas(db.quota_get_all_by_project(context, project_id))
+
+
+def _get_quotas_and_usages(context, project_id):
+    """Returns the quotas of the project and its used and reserved
+    resources."""
+    quota, usages = db.quota_usage_get_all_by_project(context, project_id)
+    used = dict((resource, usage['in_use'] + usage['reserved'])
+                for resource, usage in usages.iteritems())
+    return _get_quotas(quota), used
+
+
 def _get_request_allotment(requested, used, quota):
     if quota is None:
         return requested
@@ -87,15 +121,15 @@ def allowed_instances(context, requested_instances, instance_type):
     context = context.elevated()
     requested_cores = requested_instances * instance_type['vcpus']
     requested_ram = requested_instances * instance_type['memory_mb']
-    usage = db.instance_data_get_for_project(context, project_id)
-    used_instances, used_cores, used_ram = usage
-    quota = get_project_quotas(context, project_id)
+    quota, used = _get_quotas_and_usages(context, project_id)
     allowed_instances = _get_request_allotment(requested_instances,
-                                               used_instances,
+                                               used.get('instances', 0),
                                                quota['instances'])
-    allowed_cores = _get_request_allotment(requested_cores, used_cores,
+    allowed_cores = _get_request_allotment(requested_cores,
+                                           used.get('cores', 0),
                                            quota['cores'])
-    allowed_ram = _get_request_allotment(requested_ram, used_ram, quota['ram'])
+    allowed_ram = _get_request_allotment(requested_ram, used.get('ram', 0),
+                                         quota['ram'])
     allowed_instances = min(allowed_instances,
                             allowed_cores // instance_type['vcpus'],
                             allowed_ram // instance_type['memory_mb'])
@@ -108,13 +142,12 @@ def allowed_volumes(context, requested_volumes, size):
     context = context.elevated()
     size = int(size)
     requested_gigabytes = requested_volumes * size
-    used_volumes, used_gigabytes = db.volume_data_get_for_project(context,
-                                                                  project_id)
-    quota = get_project_quotas(context, project_id)
-    allowed_volumes = _get_request_allotment(requested_volumes, used_volumes,
+    quota, used = _get_quotas_and_usages(context, project_id)
+    allowed_volumes = _get_request_allotment(requested_volumes,
+                                             used.get('volumes', 0),
                                              quota['volumes'])
     allowed_gigabytes = _get_request_allotment(requested_gigabytes,
-                                               used_gigabytes,
+                                               used.get('gigabytes', 0),
                                                quota['gigabytes'])
     allowed_volumes = min(allowed_volumes,
                           int(allowed_gigabytes // size))
@@ -125,14 +158,69 @@ def allowed_floating_ips(context, requested_floating_ips):
     """Check quota and return min(requested, allowed) floating ips."""
     project_id = context.project_id
     context = context.elevated()
-    used_floating_ips = db.floating_ip_count_by_project(context, project_id)
-    quota = get_project_quotas(context, project_id)
+    quota, used = _get_quotas_and_usages(context, project_id)
     allowed_floating_ips = _get_request_allotment(requested_floating_ips,
-                                                  used_floating_ips,
+                                                  used.get('floating_ips', 0),
                                                   quota['floating_ips'])
     return min(requested_floating_ips, allowed_floating_ips)
 
 
+def _reserve(context, deltas):
+    """Reserve deltas of the quotas until the resources are created.
+
+    Returns the reservations, to be passed to release, or None, reserving
+    nothing, when concurrent requests used the quota since it was checked.
+    """
+    project_id = context.project_id
+    context = context.elevated()
+    quota = get_project_quotas(context, project_id)
+    expire = utils.utcnow() + datetime.timedelta(
+            seconds=FLAGS.quota_reservation_expire)
+    try:
+        return db.quota_usage_reserve(context, project_id, deltas, quota,
+                                      expire)
+    except exception.QuotaUsageExceeded, e:
+        LOG.warn(_("Reservation failed: %s"), e)
+        return None
+
+
+def reserve_instances(context, num_instances, instance_type):
+    """Reserve the quota of num_instances instances of instance_type."""
+    return _reserve(context,
+                    {'instances': num_instances,
+                     'cores': num_instances * instance_type['vcpus'],
+                     'ram': num_instances * instance_type['memory_mb']})
+
+
+def reserve_volumes(context, num_volumes, size):
+    """Reserve the quota of num_volumes volumes of size gigabytes."""
+    return _reserve(context, {'volumes': num_volumes,
+                              'gigabytes': num_volumes * int(size)})
+
+
+def reserve_floating_ips(context, num_floating_ips):
+    """Reserve the quota of num_floating_ips floating ips."""
+    return _reserve(context, {'floating_ips': num_floating_ips})
+
+
+def release(context, reservations):
+    """Release reservations, once their resources are created or could
+    not be."""
+    db.quota_reservation_release(context.elevated(), reservations)
+
+
+def sync_usages(context, project_id=None):
+    """Repair the usages that drifted from the resources of the projects.
+
+    Reservations never released expire.
+    """
+    repaired = db.quota_usage_sync(context, project_id)
+    for usage_project_id, resource, in_use, actual in repaired:
+        LOG.warn(_("Quota usage of %(resource)s by %(usage_project_id)s "
+                   "was %(in_use)s instead of %(actual)s") % locals())
+    return repaired
+
+
 def _calculate_simple_quota(context, resource, requested):
     """Check quota for resource; return min(requested, allowed)."""
     quota = get_project_quotas(context, context.project_id)
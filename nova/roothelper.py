@@ -0,0 +1,322 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-lived helper running commands as root on behalf of nova services.
+
+Running ``sudo`` for every command costs a fork, an exec of sudo and a
+policy check.  bin/nova-root-helper runs as root and listens on the UNIX
+socket root_helper_socket; when that flag is set utils.execute sends the
+commands it would run with sudo to the helper instead.
+
+Requests and responses are JSON objects, one per line.  Each request has
+an id that its response carries, so a client may send several requests
+without waiting and the helper runs them concurrently, answering in the
+order they finish.  Only the executables named in root_helper_commands
+are run, looked up by their bare name in the directories of
+root_helper_path, with an environment holding only the variables named in
+root_helper_env; for any other command, or while the helper is
+unreachable, commands run with sudo as before.
+"""
+
+import json
+import os
+import pwd
+import time
+
+from eventlet import event
+from eventlet import greenpool
+from eventlet import greenthread
+from eventlet import semaphore
+from eventlet import timeout
+from eventlet.green import socket
+from eventlet.green import subprocess
+
+from nova import exception
+from nova import flags
+from nova import log as logging
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('root_helper_socket', None,
+                    'UNIX socket of nova-root-helper. When set, commands run '
+                    'with sudo are sent to the helper')
+flags.DEFINE_list('root_helper_commands',
+                  ['iptables', 'iptables-save', 'iptables-restore',
+                   'ip6tables', 'ip6tables-save', 'ip6tables-restore',
+                   'ip', 'brctl', 'vconfig', 'arping', 'sysctl', 'kill',
+                   'dnsmasq', 'radvd', 'ovs-vsctl', 'lvcreate', 'lvremove',
+                   'vgs', 'ietadm', 'iscsiadm', 'qemu-img', 'qemu-nbd',
+                   'kpartx', 'tune2fs', 'mount', 'umount', 'chown', 'dd'],
+                  'Executables nova-root-helper runs')
+flags.DEFINE_list('root_helper_path',
+                  ['/sbin', '/usr/sbin', '/bin', '/usr/bin'],
+                  'Directories nova-root-helper looks commands up in')
+flags.DEFINE_list('root_helper_env', ['FLAGFILE', 'DNSMASQ_INTERFACE'],
+                  'Environment variables callers may pass to the commands '
+                  'nova-root-helper runs')
+flags.DEFINE_string('root_helper_user', 'nova',
+                    'User allowed to connect to nova-root-helper')
+flags.DEFINE_integer('root_helper_timeout', 600,
+                     'Seconds to wait for the result of a command run by '
+                     'nova-root-helper')
+
+LOG = logging.getLogger('nova.roothelper')
+
+
+class CommandNotAllowed(exception.Error):
+    pass
+
+
+class RootHelperTimeout(exception.Error):
+    pass
+
+
+# Command input and output are bytes, which are carried in JSON strings
+# as latin-1 so that any byte survives the round trip.
+def _encode(data):
+    if data is None:
+        return None
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return data.decode('latin-1')
+
+
+def _decode(data):
+    if data is None:
+        return None
+    return data.encode('latin-1')
+
+
+class RootHelperServer(object):
+    """Runs the commands sent to the socket at path, as root."""
+
+    def __init__(self, path, commands=None, user=None, search_path=None):
+        self.path = path
+        self.commands = set(commands or FLAGS.root_helper_commands)
+        self.user = user
+        self.search_path = search_path or FLAGS.root_helper_path
+        self.stats = {}
+        self._pool = greenpool.GreenPool()
+
+    def listen(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        if self.user:
+            os.chown(self.path, pwd.getpwnam(self.user).pw_uid, -1)
+        os.chmod(self.path, 0600)
+        sock.listen(128)
+        return sock
+
+    def serve(self, sock):
+        LOG.info(_('Root helper listening on %s'), self.path)
+        while True:
+            conn, _addr = sock.accept()
+            self._pool.spawn_n(self._handle, conn)
+
+    def _handle(self, conn):
+        """Reads the requests sent on conn and runs them concurrently."""
+        write_lock = semaphore.Semaphore()
+        requests = conn.makefile('r')
+        responses = conn.makefile('w')
+
+        def respond(request):
+            response = self.process(request)
+            with write_lock:
+                responses.write(json.dumps(response) + '\n')
+                responses.flush()
+
+        try:
+            for line in requests:
+                self._pool.spawn_n(respond, json.loads(line))
+        except (IOError, ValueError), e:
+            LOG.warn(_('Closing root helper connection: %s'), e)
+        finally:
+            requests.close()
+
+    def process(self, request):
+        """Returns the response to request."""
+        if not isinstance(request, dict):
+            return {'id': None, 'error': 'bad_request'}
+        response = {'id': request.get('id')}
+        if request.get('op') == 'stats':
+            response['stats'] = self.get_stats()
+            return response
+        cmd = request.get('cmd')
+        addl_env = request.get('env') or {}
+        if not isinstance(cmd, list) or not cmd or \
+           not all(isinstance(arg, basestring) for arg in cmd) or \
+           not isinstance(addl_env, dict) or \
+           not all(isinstance(value, basestring)
+                   for value in addl_env.itervalues()):
+            response['error'] = 'bad_request'
+            return response
+        name = cmd[0]
+        executable = self._find(name)
+        if executable is None:
+            response['error'] = 'not_allowed'
+            return response
+        # Like sudo's env_reset and secure_path, commands get a clean
+        # environment and a PATH made of the trusted directories only.
+        env = {'PATH': ':'.join(self.search_path)}
+        for key, value in addl_env.iteritems():
+            if key in FLAGS.root_helper_env:
+                env[key] = value
+        cmd = [executable] + cmd[1:]
+        start = time.time()
+        _PIPE = subprocess.PIPE  # pylint: disable=E1101
+        try:
+            obj = subprocess.Popen(cmd, stdin=_PIPE, stdout=_PIPE,
+                                   stderr=_PIPE, env=env)
+            stdout, stderr = obj.communicate(_decode(request.get('input')))
+            response.update(exit_code=obj.returncode,
+                            stdout=_encode(stdout), stderr=_encode(stderr))
+        except OSError, e:
+            response.update(exit_code=127, stdout=u'', stderr=_encode(str(e)))
+        self._record(name, time.time() - start)
+        return response
+
+    def _find(self, name):
+        """Returns the path of the allowed command name, or None."""
+        if name not in self.commands or os.path.basename(name) != name:
+            return None
+        for directory in self.search_path:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
+        return None
+
+    def _record(self, name, elapsed):
+        stats = self.stats.setdefault(name, {'count': 0, 'total': 0.0,
+                                             'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+
+    def get_stats(self):
+        """Returns the count, mean and max seconds of each command."""
+        return dict((name, {'count': stats['count'],
+                            'mean': stats['total'] / stats['count'],
+                            'max': stats['max']})
+                    for name, stats in self.stats.iteritems())
+
+
+class RootHelperClient(object):
+    """Sends commands to the root helper over one shared connection."""
+
+    def __init__(self, path):
+        self.path = path
+        self._sock = None
+        self._next_id = 0
+        self._waiters = {}
+        self._send_lock = semaphore.Semaphore()
+        self.not_allowed = set()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self._sock = sock
+        self._waiters = {}
+        greenthread.spawn_n(self._read_responses, sock, self._waiters)
+
+    def _read_responses(self, sock, waiters):
+        try:
+            for line in sock.makefile('r'):
+                response = json.loads(line)
+                waiter = waiters.pop(response['id'], None)
+                if waiter is not None:
+                    waiter.send(response)
+        except (IOError, ValueError), e:
+            LOG.warn(_('Lost root helper connection: %s'), e)
+        if self._sock is sock:
+            self._sock = None
+        sock.close()
+        for waiter in waiters.values():
+            waiter.send_exception(
+                    exception.Error(_('Root helper connection closed')))
+
+    def submit(self, request):
+        """Sends request, returns an event the response is sent to.
+
+        Raises socket.error if the helper cannot be reached.
+        """
+        with self._send_lock:
+            if self._sock is None:
+                self._connect()
+            self._next_id += 1
+            request['id'] = self._next_id
+            waiter = event.Event()
+            self._waiters[request['id']] = waiter
+            try:
+                self._sock.sendall(json.dumps(request) + '\n')
+            except socket.error:
+                del self._waiters[request['id']]
+                self._sock = None
+                raise
+        return waiter
+
+    def _command(self, cmd, process_input=None, addl_env=None):
+        return {'cmd': list(cmd), 'input': _encode(process_input),
+                'env': addl_env}
+
+    def _wait(self, request, waiter):
+        """Returns the response sent to waiter, waiting for it at most
+        root_helper_timeout seconds."""
+        try:
+            with timeout.Timeout(FLAGS.root_helper_timeout):
+                return waiter.wait()
+        except timeout.Timeout:
+            self._waiters.pop(request['id'], None)
+            raise RootHelperTimeout(_('No answer from the root helper '
+                                      'after %d seconds') %
+                                    FLAGS.root_helper_timeout)
+
+    def _result(self, cmd, response):
+        if response.get('error') == 'not_allowed':
+            self.not_allowed.add(cmd[0])
+            raise CommandNotAllowed(_('Root helper does not run %s') %
+                                    cmd[0])
+        if response.get('error'):
+            raise exception.Error(_('Root helper refused %(cmd)r: %(error)s')
+                                  % {'cmd': cmd, 'error': response['error']})
+        return response['exit_code'], (_decode(response['stdout']),
+                                       _decode(response['stderr']))
+
+    def execute(self, cmd, process_input=None, addl_env=None):
+        """Runs cmd as root, returns (exit_code, (stdout, stderr))."""
+        request = self._command(cmd, process_input, addl_env)
+        waiter = self.submit(request)
+        return self._result(cmd, self._wait(request, waiter))
+
+    def get_stats(self):
+        """Returns the per command latency statistics of the helper."""
+        request = {'op': 'stats'}
+        return self._wait(request, self.submit(request))['stats']
+
+
+_client = None
+
+
+def get_client():
+    """Returns the client of root_helper_socket, or None if it is unset."""
+    global _client
+    if not FLAGS.root_helper_socket:
+        return None
+    if _client is None or _client.path != FLAGS.root_helper_socket:
+        _client = RootHelperClient(FLAGS.root_helper_socket)
+    return _client
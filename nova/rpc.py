@@ -559,6 +559,18 @@ def cast(context, topic, msg):
         publisher.close()
 
 
+def cast_many(context, topic, msgs):
+    """Sends messages on a topic, all through one publisher."""
+    LOG.debug(_('Making %(count)d asynchronous casts on %(topic)s...') %
+              {'count': len(msgs), 'topic': topic})
+    with ConnectionPool.item() as conn:
+        publisher = TopicPublisher(connection=conn, topic=topic)
+        for msg in msgs:
+            _pack_context(msg, context)
+            publisher.send(msg)
+        publisher.close()
+
+
 def fanout_cast(context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
@@ -17,7 +17,10 @@
 Handles all requests relating to schedulers.
 """
 
+import bisect
+import datetime
 import novaclient
+import time
 
 from nova import db
 from nova import exception
@@ -27,11 +30,24 @@ from nova import rpc
 from nova import utils
 
 from eventlet import greenpool
+from eventlet import timeout as eventlet_timeout
 
 FLAGS = flags.FLAGS
 flags.DEFINE_bool('enable_zone_routing',
     False,
     'When True, routing to child zones will occur.')
+flags.DEFINE_integer('zone_client_token_ttl', 3600,
+    'Seconds the authentication token of a child zone is reused')
+flags.DEFINE_integer('zone_location_ttl', 600,
+    'Seconds the child zone a resource was found in is remembered')
+flags.DEFINE_integer('zone_location_cache_size', 10000,
+    'Number of resources whose child zone is remembered')
+flags.DEFINE_integer('zone_call_timeout', 30,
+    'Seconds to wait for the answers of child zones')
+flags.DEFINE_integer('zone_timeouts_to_skip', 3,
+    'Number of consecutive timeouts before a child zone is skipped')
+flags.DEFINE_integer('zone_skip_interval', 60,
+    'Seconds a child zone is skipped for before it is called again')
 
 LOG = logging.getLogger('nova.scheduler.api')
 
@@ -109,65 +125,296 @@ def _wrap_method(function, self):
     return _wrap
 
 
+def _create_novaclient(zone):
+    """Returns an unauthenticated novaclient of zone. Broken out for
+    testing."""
+    return novaclient.OpenStack(zone.username, zone.password, None,
+                                zone.api_url)
+
+
+class ZoneClientPool(object):
+    """Authenticated novaclients of one child zone.
+
+    Every client is used by one caller at a time; idle clients are kept
+    for the next caller.  The clients share the token and management url
+    of the zone, which are only renewed once zone_client_token_ttl seconds
+    have passed or a client had to authenticate again itself.
+    """
+
+    def __init__(self, zone):
+        self.zone = zone
+        self.auth_token = None
+        self.management_url = None
+        self.authenticated_at = None
+        self.free = []
+
+    def _token_expired(self):
+        if self.auth_token is None:
+            return True
+        ttl = datetime.timedelta(seconds=FLAGS.zone_client_token_ttl)
+        return utils.utcnow() - self.authenticated_at >= ttl
+
+    def _save_token(self, nova):
+        self.auth_token = nova.client.auth_token
+        self.management_url = nova.client.management_url
+        self.authenticated_at = utils.utcnow()
+
+    def get(self):
+        """Returns an authenticated client for the caller's sole use.
+
+        Raises novaclient.exceptions.BadRequest on bad credentials.
+        """
+        if self.free:
+            nova = self.free.pop()
+        else:
+            nova = _create_novaclient(self.zone)
+        if self._token_expired():
+            nova.authenticate()
+            self._save_token(nova)
+        else:
+            nova.client.auth_token = self.auth_token
+            nova.client.management_url = self.management_url
+        return nova
+
+    def put(self, nova):
+        """Returns a client obtained from get to the pool."""
+        if nova.client.auth_token != self.auth_token:
+            # The token was refused and the client authenticated again.
+            self._save_token(nova)
+        self.free.append(nova)
+
+
+_client_pools = {}
+
+
+def get_client_pool(zone):
+    """Returns the client pool of zone, which may be a row of the zones
+    table or a ZoneState."""
+    key = (zone.api_url, zone.username, zone.password)
+    if key not in _client_pools:
+        _client_pools[key] = ZoneClientPool(zone)
+    return _client_pools[key]
+
+
+_locations = None
+
+
+def _get_locations():
+    global _locations
+    if _locations is None:
+        _locations = utils.LRUCache(FLAGS.zone_location_cache_size,
+                                    FLAGS.zone_location_ttl)
+    return _locations
+
+
+def get_location(collection, item_uuid):
+    """Returns the id of the child zone item_uuid was last found in, or
+    None if that is unknown or older than zone_location_ttl seconds."""
+    return _get_locations().get((collection, item_uuid))
+
+
+def set_location(collection, item_uuid, zone_id):
+    _get_locations().set((collection, item_uuid), zone_id)
+
+
+def forget_location(collection, item_uuid, zone_id=None):
+    """Forgets where item_uuid is, if it is in zone_id when given."""
+    locations = _get_locations()
+    if zone_id is None or locations.get((collection, item_uuid)) == zone_id:
+        locations.delete((collection, item_uuid))
+
+
+# Upper bounds, in seconds, of the buckets of the zone call latencies.
+_LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 10, 30)
+
+
+class ZoneCallStats(object):
+    """Latencies, errors and timeouts of the calls to one child zone.
+
+    A zone timing out zone_timeouts_to_skip times in a row is skipped for
+    zone_skip_interval seconds.  It is then called again, and skipped
+    again right away if it still does not answer in time.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.consecutive_timeouts = 0
+        self.skip_until = None
+        self.latency = [0] * (len(_LATENCY_BUCKETS) + 1)
+
+    def record_call(self, elapsed, error=False):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.consecutive_timeouts = 0
+        self.skip_until = None
+        self.latency[bisect.bisect_left(_LATENCY_BUCKETS, elapsed)] += 1
+
+    def record_timeout(self):
+        self.calls += 1
+        self.timeouts += 1
+        self.consecutive_timeouts += 1
+        if self.consecutive_timeouts >= FLAGS.zone_timeouts_to_skip:
+            self.skip_until = utils.utcnow() + datetime.timedelta(
+                    seconds=FLAGS.zone_skip_interval)
+
+    def is_skipped(self):
+        return self.skip_until is not None and \
+               utils.utcnow() < self.skip_until
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in _LATENCY_BUCKETS] + ['inf']
+        return dict(calls=self.calls, errors=self.errors,
+                    timeouts=self.timeouts, skipped=self.is_skipped(),
+                    latency=dict(zip(bounds, self.latency)))
+
+
+_zone_stats = {}
+
+
+def get_zone_stats(zone_id):
+    """Returns the ZoneCallStats of the calls this process made to the
+    child zone zone_id."""
+    if zone_id not in _zone_stats:
+        _zone_stats[zone_id] = ZoneCallStats()
+    return _zone_stats[zone_id]
+
+
+def _timed_call(func, zone, stats):
+    start = time.time()
+    try:
+        result = func(zone)
+    except Exception:
+        stats.record_call(time.time() - start, error=True)
+        raise
+    stats.record_call(time.time() - start)
+    return result
+
+
+def scatter_gather(zones, func, timeout=None, raise_errors=False):
+    """Calls func(zone) for all the zones concurrently.
+
+    Returns (zone, result) for each zone answering within timeout seconds,
+    zone_call_timeout by default, in the order of zones.  The calls still
+    running at the deadline are killed and zones currently skipped after
+    repeated timeouts are not called.  Zones for which func raises are
+    left out of the results, unless raise_errors is set, in which case the
+    exception is raised again and the other calls are killed.
+    """
+    if timeout is None:
+        timeout = FLAGS.zone_call_timeout
+    pool = greenpool.GreenPool()
+    calls = []
+    for zone in zones:
+        stats = get_zone_stats(zone.id)
+        if stats.is_skipped():
+            url = zone.api_url
+            LOG.debug(_("Skipping zone %(url)s after repeated timeouts")
+                    % locals())
+            continue
+        calls.append((zone, stats, pool.spawn(_timed_call, func, zone,
+                                              stats)))
+
+    deadline = time.time() + timeout
+    results = []
+    try:
+        for zone, stats, thread in calls:
+            timer = eventlet_timeout.Timeout(max(deadline - time.time(), 0))
+            try:
+                results.append((zone, thread.wait()))
+            except eventlet_timeout.Timeout, e:
+                if e is not timer:
+                    raise
+                thread.kill()
+                stats.record_timeout()
+                url = zone.api_url
+                LOG.warn(_("Zone %(url)s did not answer within %(timeout)s "
+                           "seconds") % locals())
+            except Exception, e:
+                if raise_errors:
+                    raise
+                url = zone.api_url
+                LOG.warn(_("Call to zone %(url)s failed: %(e)s") % locals())
+            finally:
+                timer.cancel()
+    finally:
+        # Calls still running when a call failed, or the gathering was
+        # interrupted, are not waited for
+        for zone, stats, thread in calls:
+            thread.kill()
+    return results
+
+
 def _process(func, zone):
     """Worker stub for green thread pool. Give the worker
     an authenticated nova client and zone info."""
-    nova = novaclient.OpenStack(zone.username, zone.password, None,
-                                zone.api_url)
-    nova.authenticate()
-    return func(nova, zone)
+    pool = get_client_pool(zone)
+    nova = pool.get()
+    # A client killed mid request, by GreenletExit, is not reused.
+    try:
+        result = func(nova, zone)
+    except Exception:
+        pool.put(nova)
+        raise
+    pool.put(nova)
+    return result
+
+
+# Returned by the calls to the zones call_zone_method could not log in to.
+_NO_ANSWER = object()
 
 
 def call_zone_method(context, method_name, errors_to_ignore=None,
                      novaclient_collection_name='zones', zones=None,
-                     *args, **kwargs):
-    """Returns a list of (zone, call_result) objects."""
+                     raise_errors=False, *args, **kwargs):
+    """Returns a list of (zone, call_result) objects.
+
+    Zones whose call fails are left out, see scatter_gather."""
     if not isinstance(errors_to_ignore, (list, tuple)):
         # This will also handle the default None
         errors_to_ignore = [errors_to_ignore]
 
-    pool = greenpool.GreenPool()
-    results = []
     if zones is None:
         zones = db.zone_get_all(context)
-    for zone in zones:
+
+    def _call(zone):
+        client_pool = get_client_pool(zone)
         try:
-            nova = novaclient.OpenStack(zone.username, zone.password, None,
-                    zone.api_url)
-            nova.authenticate()
+            nova = client_pool.get()
         except novaclient.exceptions.BadRequest, e:
             url = zone.api_url
             LOG.warn(_("Failed request to zone; URL=%(url)s: %(e)s")
                     % locals())
-            #TODO (dabo) - add logic for failure counts per zone,
-            # with escalation after a given number of failures.
-            continue
+            return _NO_ANSWER
         novaclient_collection = getattr(nova, novaclient_collection_name)
-        collection_method = getattr(novaclient_collection, method_name)
-
-        def _error_trap(*args, **kwargs):
-            try:
-                return collection_method(*args, **kwargs)
-            except Exception as e:
-                if type(e) in errors_to_ignore:
-                    return None
-                raise
-
-        res = pool.spawn(_error_trap, *args, **kwargs)
-        results.append((zone, res))
-    pool.waitall()
-    return [(zone.id, res.wait()) for zone, res in results]
-
-
-def child_zone_helper(zone_list, func):
+        try:
+            collection_method = getattr(novaclient_collection, method_name)
+            result = collection_method(*args, **kwargs)
+        except Exception as e:
+            client_pool.put(nova)
+            if type(e) in errors_to_ignore:
+                return None
+            raise
+        client_pool.put(nova)
+        return result
+
+    return [(zone.id, result)
+            for zone, result in scatter_gather(zones, _call,
+                                               raise_errors=raise_errors)
+            if result is not _NO_ANSWER]
+
+
+def child_zone_helper(zone_list, func, raise_errors=False):
     """Fire off a command to each zone in the list.
     The return is [novaclient return objects] from each child zone.
     For example, if you are calling server.pause(), the list will
     be whatever the response from server.pause() is. One entry
-    per child zone called."""
-    green_pool = greenpool.GreenPool()
-    return [result for result in green_pool.imap(
-                    _wrap_method(_process, func), zone_list)]
+    per child zone answering within zone_call_timeout seconds, and
+    without error unless raise_errors is set."""
+    return [result for zone, result in scatter_gather(zone_list,
+                    _wrap_method(_process, func), raise_errors=raise_errors)]
 
 
 def _issue_novaclient_command(nova, zone, collection,
@@ -204,11 +451,15 @@ def _issue_novaclient_command(nova, zone, collection,
         url = zone.api_url
         LOG.debug(_("%(collection)s '%(item)s' not found on '%(url)s'" %
                                                 locals()))
+        forget_location(collection, item, zone.id)
         return None
+    set_location(collection, item, zone.id)
 
     if method_name.lower() != 'get':
         # if we're doing something other than 'get', call it passing args.
         result = getattr(result, method_name)(*args, **kwargs)
+        if method_name.lower() == 'delete':
+            forget_location(collection, item, zone.id)
     return result
 
 
@@ -263,11 +514,23 @@ class reroute_compute(object):
         if not zones:
             raise exception.InstanceNotFound(instance_id=item_uuid)
 
-        # Ask the children to provide an answer ...
-        LOG.debug(_("Asking child zones ..."))
-        result = self._call_child_zones(zones,
-                    wrap_novaclient_function(_issue_novaclient_command,
-                           collection, self.method_name, item_uuid))
+        function = wrap_novaclient_function(_issue_novaclient_command,
+                collection, self.method_name, item_uuid)
+        zone_id = get_location(collection, item_uuid)
+        located = [zone for zone in zones if zone.id == zone_id]
+        result = None
+        if located:
+            # Ask the child zone it was last found in ...
+            LOG.debug(_("Asking child zone %(zone_id)s ...") % locals())
+            result = self._call_child_zones(located, function)
+            if not result or get_location(collection, item_uuid) is None:
+                # ... it is not there anymore or did not answer.
+                result = None
+                zones = [zone for zone in zones if zone.id != zone_id]
+        if result is None:
+            # Ask the children to provide an answer ...
+            LOG.debug(_("Asking child zones ..."))
+            result = self._call_child_zones(zones, function)
         # Scrub the results and raise another exception
         # so the API layers can bail out gracefully ...
         raise RedirectResult(self.unmarshall_result(result))
@@ -245,6 +245,12 @@ class JsonFilter(HostFilter):
         'and': _and,
     }
 
+    # Filters compiled by _compile_filter, by query string. The same few
+    # queries are sent with most requests, so the cache is simply
+    # emptied when it is full.
+    _compiled_filters = {}
+    _max_compiled_filters = 1000
+
     def instance_type_to_filter(self, instance_type):
         """Convert instance_type into JSON filter object."""
         required_ram = instance_type['memory_mb']
@@ -271,7 +277,11 @@ class JsonFilter(HostFilter):
         return services
 
     def _process_filter(self, zone_manager, query, host, services):
-        """Recursively parse the query structure."""
+        """Recursively parse the query structure.
+
+        filter_hosts evaluates the query compiled by _compile_filter
+        instead, which gives the same results.
+        """
         if len(query) == 0:
             return True
         cmd = query[0]
@@ -287,12 +297,77 @@ class JsonFilter(HostFilter):
         result = method(self, cooked_args)
         return result
 
+    def _compile_string(self, string):
+        """Returns a function looking up the capability named by string
+        in the services of a host, as _parse_string does, or None if
+        string is always dropped from the arguments.
+        """
+        if not string:
+            return None
+        if string[0] != '$':
+            return lambda services: string
+
+        path = tuple(string[1:].split('.'))
+
+        def lookup(services):
+            for item in path:
+                services = services.get(item, None)
+                if not services:
+                    return None
+            return services
+        return lookup
+
+    def _compile_filter(self, query):
+        """Compiles the query structure into a function of the services
+        of a host returning what _process_filter would.
+        """
+        if len(query) == 0:
+            return lambda services: True
+        cmd = query[0]
+        if cmd not in self.commands:
+            # Raised for each host, as _process_filter does
+            def unknown(services):
+                return self.commands[cmd]
+            return unknown
+        method = self.commands[cmd]
+        getters = []
+        for arg in query[1:]:
+            if isinstance(arg, list):
+                getter = self._compile_filter(arg)
+            elif isinstance(arg, basestring):
+                getter = self._compile_string(arg)
+            elif arg != None:
+                getter = lambda services, arg=arg: arg
+            else:
+                getter = None
+            if getter is not None:
+                getters.append(getter)
+
+        def process(services):
+            cooked_args = []
+            for getter in getters:
+                arg = getter(services)
+                if arg != None:
+                    cooked_args.append(arg)
+            return method(self, cooked_args)
+        return process
+
+    def _get_compiled_filter(self, query):
+        """Returns the compiled filter of the JSON query string."""
+        compiled = self._compiled_filters.get(query)
+        if compiled is None:
+            if len(self._compiled_filters) >= self._max_compiled_filters:
+                self._compiled_filters.clear()
+            compiled = self._compile_filter(json.loads(query))
+            self._compiled_filters[query] = compiled
+        return compiled
+
     def filter_hosts(self, zone_manager, query):
         """Return a list of hosts that can fulfill filter."""
-        expanded = json.loads(query)
+        process = self._get_compiled_filter(query)
         hosts = []
         for host, services in zone_manager.service_states.iteritems():
-            r = self._process_filter(zone_manager, expanded, host, services)
+            r = process(services)
             if isinstance(r, list):
                 r = True in r
             if r:
@@ -21,12 +21,14 @@
 Scheduler Service
 """
 
+import datetime
 import functools
 
 from nova import db
 from nova import flags
 from nova import log as logging
 from nova import manager
+from nova import quota
 from nova import rpc
 from nova import utils
 from nova.scheduler import zone_manager
@@ -46,6 +48,7 @@ class SchedulerManager(manager.Manager):
             scheduler_driver = FLAGS.scheduler_driver
         self.driver = utils.import_object(scheduler_driver)
         self.driver.set_zone_manager(self.zone_manager)
+        self.last_quota_usage_sync = datetime.datetime.min
         super(SchedulerManager, self).__init__(*args, **kwargs)
 
     def __getattr__(self, key):
@@ -55,6 +58,17 @@ class SchedulerManager(manager.Manager):
     def periodic_tasks(self, context=None):
         """Poll child zones periodically to get status."""
         self.zone_manager.ping(context)
+        self._sync_quota_usages(context)
+
+    def _sync_quota_usages(self, context):
+        """Sync the quota usages every quota_usage_sync_interval seconds."""
+        interval = datetime.timedelta(
+                seconds=FLAGS.quota_usage_sync_interval)
+        if not interval or utils.utcnow() - self.last_quota_usage_sync < \
+                interval:
+            return
+        self.last_quota_usage_sync = utils.utcnow()
+        quota.sync_usages(context)
 
     def get_host_list(self, context=None):
         """Get a list of hosts from the ZoneManager."""
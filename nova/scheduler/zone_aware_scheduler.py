@@ -115,17 +115,19 @@ class ZoneAwareScheduler(driver.Scheduler):
         LOG.debug(_("Forwarding instance create call to child zone %(url)s"
                     ". ReservationID=%(reservation_id)s")
                     % locals())
-        nova = None
+        pool = api.get_client_pool(zone)
         try:
-            nova = novaclient.OpenStack(zone.username, zone.password, None,
-                                        url)
-            nova.authenticate()
+            nova = pool.get()
         except novaclient.exceptions.BadRequest, e:
             raise exception.NotAuthorized(_("Bad credentials attempting "
                             "to talk to zone at %(url)s.") % locals())
 
-        nova.servers.create(name, image_ref, flavor_id, ipgroup, meta, files,
-                            child_blob, reservation_id=reservation_id)
+        try:
+            nova.servers.create(name, image_ref, flavor_id, ipgroup, meta,
+                                files, child_blob,
+                                reservation_id=reservation_id)
+        finally:
+            pool.put(nova)
 
     def _provision_resource_from_blob(self, context, build_plan_item,
                                       instance_id, request_spec, kwargs):
@@ -18,7 +18,6 @@ ZoneManager oversees all communications with child Zones.
 """
 
 import datetime
-import novaclient
 import thread
 import traceback
 
@@ -28,6 +27,7 @@ from nova import db
 from nova import flags
 from nova import log as logging
 from nova import utils
+from nova.scheduler import api
 
 FLAGS = flags.FLAGS
 flags.DEFINE_integer('zone_db_check_interval', 60,
@@ -65,9 +65,11 @@ class ZoneState(object):
         self.is_active = True
 
     def to_dict(self):
+        calls = api.get_zone_stats(self.zone_id)
         return dict(name=self.name, capabilities=self.capabilities,
-                    is_active=self.is_active, api_url=self.api_url,
-                    id=self.zone_id)
+                    is_active=self.is_active and not calls.is_skipped(),
+                    api_url=self.api_url, id=self.zone_id,
+                    calls=calls.to_dict())
 
     def log_error(self, exception):
         """Something went wrong. Check to see if zone should be
@@ -89,9 +91,12 @@ class ZoneState(object):
 
 def _call_novaclient(zone):
     """Call novaclient. Broken out for testing purposes."""
-    client = novaclient.OpenStack(zone.username, zone.password, None,
-                                  zone.api_url)
-    return client.zones.info()._info
+    pool = api.get_client_pool(zone)
+    client = pool.get()
+    try:
+        return client.zones.info()._info
+    finally:
+        pool.put(client)
 
 
 def _poll_zone(zone):
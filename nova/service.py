@@ -31,6 +31,7 @@ from nova import context
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova import rpc
 from nova import utils
@@ -53,6 +54,12 @@ flags.DEFINE_integer('ec2_listen_port', 8773, 'port for ec2 api to listen')
 flags.DEFINE_string('osapi_listen', "0.0.0.0",
                     'IP address for OpenStack API to listen')
 flags.DEFINE_integer('osapi_listen_port', 8774, 'port for os api to listen')
+flags.DEFINE_integer('ec2_workers', 1,
+                     'Number of processes serving the EC2 API',
+                     lower_bound=1)
+flags.DEFINE_integer('osapi_workers', 1,
+                     'Number of processes serving the OpenStack API',
+                     lower_bound=1)
 flags.DEFINE_string('api_paste_config', "api-paste.ini",
                     'File name for the paste.deploy config for nova-api')
 
@@ -268,18 +275,15 @@ class Service(object):
     def report_state(self):
         """Update the state of this service in the datastore."""
         ctxt = context.get_admin_context()
+        driver = heartbeat.get_driver()
         try:
             try:
-                service_ref = db.service_get(ctxt, self.service_id)
+                driver.beat(ctxt, self.service_id, self.topic, self.host)
             except exception.NotFound:
                 logging.debug(_('The service database object disappeared, '
                                 'Recreating it.'))
                 self._create_service_ref(ctxt)
-                service_ref = db.service_get(ctxt, self.service_id)
-
-            db.service_update(ctxt,
-                             self.service_id,
-                             {'report_count': service_ref['report_count'] + 1})
+                driver.beat(ctxt, self.service_id, self.topic, self.host)
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(self, 'model_disconnected', False):
@@ -309,10 +313,12 @@ class WSGIService(object):
         self.app = self.loader.load_app(name)
         self.host = getattr(FLAGS, '%s_listen' % name, "0.0.0.0")
         self.port = getattr(FLAGS, '%s_listen_port' % name, 0)
+        self.workers = getattr(FLAGS, '%s_workers' % name, 1)
         self.server = wsgi.Server(name,
                                   self.app,
                                   host=self.host,
-                                  port=self.port)
+                                  port=self.port,
+                                  workers=self.workers)
 
     def start(self):
         """Start serving this service using loaded configuration.
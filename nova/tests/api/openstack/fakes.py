@@ -249,6 +249,7 @@ def stub_out_glance(stubs, initial_fixtures=None):
 
     GlanceClient = glance_client.Client
     fake = FakeGlanceClient(initial_fixtures)
+    glance.get_image_meta_cache().clear()
 
     stubs.Set(GlanceClient, 'get_images', fake.fake_get_images)
     stubs.Set(GlanceClient, 'get_images_detailed',
@@ -306,11 +307,13 @@ class FakeAuthManager(object):
     #NOTE(justinsb): This should also be private!
     auth_data = []
     projects = {}
+    generation = 0
 
     @classmethod
     def clear_fakes(cls):
         cls.auth_data = []
         cls.projects = {}
+        cls.generation = 0
 
     @classmethod
     def reset_fake_data(cls):
@@ -322,6 +325,9 @@ class FakeAuthManager(object):
                                              'test',
                                               []))
 
+    def get_generation(self):
+        return FakeAuthManager.generation
+
     def add_user(self, user):
         FakeAuthManager.auth_data.append(user)
 
@@ -28,6 +28,7 @@ from nova import auth
 from nova import context
 from nova import db
 from nova import test
+from nova import utils
 from nova.tests.api.openstack import fakes
 
 
@@ -208,6 +209,82 @@ class Test(test.TestCase):
         result = req.get_response(fakes.wsgi_app())
         self.assertEqual(result.status, '401 Unauthorized')
 
+    def _get_token(self, app):
+        f = fakes.FakeAuthManager()
+        user = nova.auth.manager.User('id1', 'user1', 'user1_key', None, None)
+        f.add_user(user)
+        f.create_project('user1_project', user)
+
+        req = webob.Request.blank('/v1.0/', {'HTTP_HOST': 'foo'})
+        req.headers['X-Auth-User'] = 'user1'
+        req.headers['X-Auth-Key'] = 'user1_key'
+        result = req.get_response(app)
+        self.assertEqual(result.status, '204 No Content')
+        return result.headers['X-Auth-Token']
+
+    def _count_token_lookups(self):
+        self.token_lookups = 0
+        auth_token_get = fakes.FakeAuthDatabase.auth_token_get
+
+        def counting_token_get(context, token_hash):
+            self.token_lookups += 1
+            return auth_token_get(context, token_hash)
+
+        self.stubs.Set(fakes.FakeAuthDatabase, 'auth_token_get',
+                       staticmethod(counting_token_get))
+
+    def _authorized_request(self, app, token):
+        req = webob.Request.blank('/v1.0/fake')
+        req.headers['X-Auth-Token'] = token
+        return req.get_response(app)
+
+    def test_validated_token_is_cached(self):
+        self.stubs.Set(nova.api.openstack, 'APIRouterV10', fakes.FakeRouter)
+        app = fakes.wsgi_app()
+        token = self._get_token(app)
+        self._count_token_lookups()
+
+        for i in xrange(3):
+            result = self._authorized_request(app, token)
+            self.assertEqual(result.status, '200 OK')
+        self.assertEqual(self.token_lookups, 1)
+
+    def test_cached_token_invalidated_by_auth_changes(self):
+        self.stubs.Set(nova.api.openstack, 'APIRouterV10', fakes.FakeRouter)
+        app = fakes.wsgi_app()
+        token = self._get_token(app)
+        self._count_token_lookups()
+
+        self._authorized_request(app, token)
+        fakes.FakeAuthManager.generation += 1
+        result = self._authorized_request(app, token)
+        self.assertEqual(result.status, '200 OK')
+        self.assertEqual(self.token_lookups, 2)
+
+    def test_cached_token_expires(self):
+        self.flags(osapi_token_cache_ttl=60)
+        self.stubs.Set(nova.api.openstack, 'APIRouterV10', fakes.FakeRouter)
+        utils.set_time_override()
+        try:
+            app = fakes.wsgi_app()
+            token = self._get_token(app)
+            self._count_token_lookups()
+
+            self._authorized_request(app, token)
+            utils.advance_time_seconds(61)
+            result = self._authorized_request(app, token)
+            self.assertEqual(result.status, '200 OK')
+            self.assertEqual(self.token_lookups, 2)
+        finally:
+            utils.clear_time_override()
+
+    def test_memcached_token_cache_deletes_tokens(self):
+        cache = nova.api.openstack.auth.MemcachedTokenCache(10, 60)
+        cache.set('token_hash', {'user_id': 'user1'}, 60)
+        cache.delete('token_hash')
+        self.assertEqual(None, cache.get('token_hash'))
+        self.assertFalse(cache.mc.cache)
+
 
 class TestFunctional(test.TestCase):
     def test_token_expiry(self):
@@ -276,6 +276,24 @@ class ActionExtensionTest(unittest.TestCase):
         response = self._send_server_action_request("/fdsa/1/action", body)
         self.assertEqual(404, response.status_int)
 
+    def test_core_requests_skip_router(self):
+        app = openstack.APIRouterV11()
+        ext_midware = extensions.ExtensionMiddleware(app)
+
+        def fail(*args, **kwargs):
+            self.fail("Request routed again")
+
+        app._router = fail
+        match = ext_midware._router.mapper.routematch(
+                '/flavors/1', {'REQUEST_METHOD': 'GET'})
+        self.assertEqual('show', match[0]['action'])
+        request = webob.Request.blank("/servers/1/action")
+        request.method = 'POST'
+        request.content_type = 'application/json'
+        request.body = json.dumps(dict(blah=dict(name="test")))
+        response = request.get_response(ext_midware)
+        self.assertEqual(501, response.status_int)
+
 
 class RequestExtensionTest(unittest.TestCase):
 
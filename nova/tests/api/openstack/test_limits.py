@@ -307,6 +307,19 @@ class LimitsControllerV11Test(BaseLimitTestSuite):
         body = json.loads(response.body)
         self.assertEqual(expected, body)
 
+    def test_index_limits_from_limiter(self):
+        """Test the limits of the user shown by the limiter of a request."""
+        request = self._get_index_request()
+        limiter = limits.Limiter([limits.Limit("GET", "*", ".*", 10, 60)])
+        limiter.check_for_delay("GET", "/servers", "otheruser")
+        limiter.check_for_delay("GET", "/servers", "testuser")
+        limiter.check_for_delay("GET", "/servers", "testuser")
+        request.environ["nova.limiter"] = limiter
+        response = request.get_response(self.controller)
+        body = json.loads(response.body)
+        limit = body["limits"]["rate"][0]["limit"][0]
+        self.assertEqual(8, limit["remaining"])
+
     def _populate_limits_diff_regex(self, request):
         """Put limit info into a request."""
         _limits = [
@@ -722,6 +735,49 @@ class LimiterTest(BaseLimitTestSuite):
         self.assertEqual(expected, results)
 
 
+class MemcachedLimiterTest(LimiterTest):
+    """
+    Tests for the `limits.Limiter` class keeping its state in memcached.
+    """
+
+    def setUp(self):
+        """Run before each test."""
+        LimiterTest.setUp(self)
+        self.limiter.store = limits.MemcachedLimitStore()
+
+    def test_limiters_share_limits(self):
+        """
+        Ensure limiters sharing memcached, as API workers do, share limits.
+        """
+        other = limits.Limiter(TEST_LIMITS)
+        other.store = limits.MemcachedLimitStore()
+        other.store.mc = self.limiter.store.mc
+        expected = [None] * 5
+        self.assertEqual(expected, list(self._check(5, "PUT", "/anything")))
+        self.assertEqual((None, None),
+                         other.check_for_delay("PUT", "/anything"))
+        expected = [None] * 4 + [6.0]
+        self.assertEqual(expected, list(self._check(5, "PUT", "/anything")))
+
+    def test_conflicting_update(self):
+        """
+        Ensure a state updated by another worker is read again.
+        """
+        store = self.limiter.store
+        calls = []
+
+        def update(state):
+            calls.append(state)
+            if len(calls) == 2:
+                store.mc.set(store._key("key"), 5)
+            return (state or 0) + 1, None
+
+        store.update("key", update, 60)
+        store.update("key", update, 60)
+        self.assertEqual([None, 1, 5], calls)
+        self.assertEqual(6, store.get("key"))
+
+
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
     Tests for `limits.WsgiLimiter` class.
@@ -108,11 +108,24 @@ def return_servers(context, user_id=1):
     return [stub_instance(i, user_id) for i in xrange(5)]
 
 
-def return_servers_by_reservation(context, reservation_id=""):
-    return [stub_instance(i, reservation_id) for i in xrange(5)]
+def return_servers_by_filters(context, filters, marker=None, limit=None,
+                              offset=None, detailed=True):
+    servers = return_servers(context)
+    if marker is not None:
+        if marker not in [server['id'] for server in servers]:
+            raise exception.MarkerNotFound(marker=marker)
+        servers = [server for server in servers if server['id'] > marker]
+    servers = servers[offset or 0:]
+    if limit is not None:
+        servers = servers[:limit]
+    return servers
 
 
-def return_servers_by_reservation_empty(context, reservation_id=""):
+def return_servers_by_reservation(context, filters, **kwargs):
+    return [stub_instance(i, filters['reservation_id']) for i in xrange(5)]
+
+
+def return_servers_by_reservation_empty(context, filters, **kwargs):
     return []
 
 
@@ -245,12 +258,11 @@ class ServersTest(test.TestCase):
         fakes.stub_out_key_pair_funcs(self.stubs)
         fakes.stub_out_image_service(self.stubs)
         self.stubs.Set(utils, 'gen_uuid', fake_gen_uuid)
-        self.stubs.Set(nova.db.api, 'instance_get_all', return_servers)
+        self.stubs.Set(nova.db.api, 'instance_get_all_by_filters',
+                       return_servers_by_filters)
         self.stubs.Set(nova.db.api, 'instance_get', return_server_by_id)
         self.stubs.Set(nova.db, 'instance_get_by_uuid',
                        return_server_by_uuid)
-        self.stubs.Set(nova.db.api, 'instance_get_all_by_user',
-                       return_servers)
         self.stubs.Set(nova.db.api, 'instance_add_security_group',
                        return_security_group)
         self.stubs.Set(nova.db.api, 'instance_update', instance_update)
@@ -980,7 +992,7 @@ class ServersTest(test.TestCase):
             i += 1
 
     def test_get_server_list_with_reservation_id(self):
-        self.stubs.Set(nova.db.api, 'instance_get_all_by_reservation',
+        self.stubs.Set(nova.db.api, 'instance_get_all_by_filters',
                        return_servers_by_reservation)
         self.stubs.Set(nova.scheduler.api, 'call_zone_method',
                        return_servers_from_child_zones)
@@ -997,7 +1009,7 @@ class ServersTest(test.TestCase):
                 i += 1
 
     def test_get_server_list_with_reservation_id_empty(self):
-        self.stubs.Set(nova.db.api, 'instance_get_all_by_reservation',
+        self.stubs.Set(nova.db.api, 'instance_get_all_by_filters',
                        return_servers_by_reservation_empty)
         self.stubs.Set(nova.scheduler.api, 'call_zone_method',
                        return_servers_from_child_zones_empty)
@@ -1014,7 +1026,7 @@ class ServersTest(test.TestCase):
                 i += 1
 
     def test_get_server_list_with_reservation_id_details(self):
-        self.stubs.Set(nova.db.api, 'instance_get_all_by_reservation',
+        self.stubs.Set(nova.db.api, 'instance_get_all_by_filters',
                        return_servers_by_reservation)
         self.stubs.Set(nova.scheduler.api, 'call_zone_method',
                        return_servers_from_child_zones)
@@ -1111,6 +1123,87 @@ class ServersTest(test.TestCase):
         self.assertEqual(res.status_int, 400)
         self.assertTrue(res.body.find('marker param') > -1)
 
+    def test_get_servers_with_unknown_marker(self):
+        req = webob.Request.blank('/v1.1/servers?limit=2&marker=42')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 400)
+        self.assertTrue(res.body.find('marker [42] not found') > -1)
+
+    def _stub_filtered_servers(self):
+        calls = []
+
+        def fake_get_all_by_filters(context, filters, **kwargs):
+            calls.append((filters, kwargs))
+            return []
+
+        self.stubs.Set(nova.db.api, 'instance_get_all_by_filters',
+                       fake_get_all_by_filters)
+        return calls
+
+    def test_get_servers_pushes_paging_into_db(self):
+        calls = self._stub_filtered_servers()
+        req = webob.Request.blank('/v1.1/servers?limit=2&marker=1')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        filters, kwargs = calls[0]
+        self.assertEqual(kwargs['marker'], 1)
+        self.assertEqual(kwargs['limit'], 2)
+        self.assertFalse(kwargs['detailed'])
+
+    def test_get_servers_detail_with_offset_pushes_paging_into_db(self):
+        calls = self._stub_filtered_servers()
+        req = webob.Request.blank('/v1.0/servers/detail?limit=2&offset=3')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        filters, kwargs = calls[0]
+        self.assertEqual(kwargs['offset'], 3)
+        self.assertEqual(kwargs['limit'], 2)
+        self.assertTrue(kwargs['detailed'])
+
+    def test_get_servers_with_filters(self):
+        calls = self._stub_filtered_servers()
+        req = webob.Request.blank('/v1.1/servers?name=foo&status=active'
+                                  '&changes-since=2011-01-24T17:08:01Z')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        filters, kwargs = calls[0]
+        self.assertEqual(filters['display_name'], 'foo')
+        self.assertEqual(sorted(filters['state']),
+                         [power_state.RUNNING, power_state.BLOCKED])
+        self.assertEqual(filters['changes-since'],
+                         datetime.datetime(2011, 1, 24, 17, 8, 1))
+
+    def test_get_servers_by_reservation_with_filters(self):
+        calls = self._stub_filtered_servers()
+        self.stubs.Set(nova.scheduler.api, 'call_zone_method',
+                       return_servers_from_child_zones_empty)
+        req = webob.Request.blank('/v1.1/servers?reservation_id=r-1'
+                                  '&name=foo&status=active')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        filters, kwargs = calls[0]
+        self.assertEqual(filters['reservation_id'], 'r-1')
+        self.assertEqual(filters['display_name'], 'foo')
+        self.assertEqual(sorted(filters['state']),
+                         [power_state.RUNNING, power_state.BLOCKED])
+
+    def test_get_servers_by_fixed_ip_with_filters(self):
+        req = webob.Request.blank('/v1.1/servers?fixed_ip=10.0.0.2&name=foo')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 400)
+
+    def test_get_servers_with_bad_status(self):
+        self._stub_filtered_servers()
+        req = webob.Request.blank('/v1.1/servers?status=bogus')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 400)
+
+    def test_get_servers_with_bad_changes_since(self):
+        self._stub_filtered_servers()
+        req = webob.Request.blank('/v1.1/servers?changes-since=yesterday')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 400)
+
     def _setup_for_create_instance(self):
         """Shared implementation for tests below that create instance"""
         def instance_create(context, inst):
@@ -1728,10 +1821,10 @@ class ServersTest(test.TestCase):
         instances - 2 on one host and 3 on another.
         '''
 
-        def return_servers_with_host(context, user_id=1):
+        def return_servers_with_host(context, *args, **kwargs):
             return [stub_instance(i, 1, None, None, i % 2) for i in xrange(5)]
 
-        self.stubs.Set(nova.db.api, 'instance_get_all_by_user',
+        self.stubs.Set(nova.db.api, 'instance_get_all_by_filters',
             return_servers_with_host)
 
         req = webob.Request.blank('/v1.0/servers/detail')
@@ -2222,6 +2315,28 @@ class ServersTest(test.TestCase):
         body = json.loads(res.body)
         self.assertEqual(body['server']['status'], 'RESIZE-CONFIRM')
 
+    def test_server_list_detail_batches_migration_lookups(self):
+        req = webob.Request.blank('/v1.1/servers/detail')
+        self.calls = []
+
+        def fake_migrations_get(context, instance_uuids, status):
+            self.calls.append(instance_uuids)
+            return [{'instance_uuid': FAKE_UUID}]
+
+        def fake_migration_get(*args):
+            self.fail('unexpected per-instance migration lookup')
+
+        self.stubs.Set(nova.db, 'migration_get_all_by_instances_and_status',
+                fake_migrations_get)
+        self.stubs.Set(nova.db, 'migration_get_by_instance_and_status',
+                fake_migration_get)
+        res = req.get_response(fakes.wsgi_app())
+        servers = json.loads(res.body)['servers']
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(servers), 5)
+        for server in servers:
+            self.assertEqual(server['status'], 'RESIZE-CONFIRM')
+
     def test_confirm_resize_server(self):
         req = self.webreq('/1/action', 'POST', dict(confirmResize=None))
 
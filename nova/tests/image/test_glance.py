@@ -232,3 +232,94 @@ class TestMutatorDateTimeTests(BaseGlanceTest):
                    'updated_at': None,
                    'deleted_at': None}
         return fixture
+
+
+class TestGlanceImageServiceCache(test.TestCase):
+    """Tests the image metadata cache and lazy listings"""
+
+    def setUp(self):
+        super(TestGlanceImageServiceCache, self).setUp()
+        self.client = StubGlanceClient(None)
+        self.service = glance.GlanceImageService(client=self.client)
+        self.context = context.RequestContext(None, None)
+        self.calls = []
+        self.client.images = dict(('image%d' % i,
+                                   {'id': 'image%d' % i,
+                                    'name': 'name%d' % i,
+                                    'is_public': True})
+                                  for i in xrange(5))
+        self.client.update_response = {'id': 'image1', 'name': 'renamed',
+                                       'is_public': True}
+        get_image_meta = self.client.get_image_meta
+        get_images_detailed = self.client.get_images_detailed
+
+        def counting_get_image_meta(image_id):
+            self.calls.append(('get_image_meta', image_id))
+            return get_image_meta(image_id)
+
+        def counting_get_images_detailed(filters=None, marker=None,
+                                         limit=None):
+            self.calls.append(('get_images_detailed', marker))
+            images = sorted(get_images_detailed(), key=lambda i: i['id'])
+            if marker is not None:
+                images = [i for i in images if i['id'] > marker]
+            return images[:limit]
+
+        self.client.get_image_meta = counting_get_image_meta
+        self.client.get_images_detailed = counting_get_images_detailed
+
+    def test_show_uses_cache(self):
+        for i in xrange(3):
+            self.service.show(self.context, 'image1')
+        self.assertEqual([('get_image_meta', 'image1')], self.calls)
+        self.assertTrue(self.service.meta_cache.hit_rate > 0.5)
+
+    def test_update_purges_cache(self):
+        self.service.show(self.context, 'image1')
+        self.service.update(self.context, 'image1', {})
+        self.client.images['image1'] = self.client.update_response
+        image_meta = self.service.show(self.context, 'image1')
+        self.assertEqual('renamed', image_meta['name'])
+
+    def test_update_purges_cache_when_done(self):
+        update_image = self.client.update_image
+
+        def slow_update_image(image_id, metadata, data):
+            # The image is shown while it is uploaded
+            self.service.show(self.context, image_id)
+            self.client.images[image_id] = self.client.update_response
+            return update_image(image_id, metadata, data)
+
+        self.client.update_image = slow_update_image
+        self.service.update(self.context, 'image1', {})
+        image_meta = self.service.show(self.context, 'image1')
+        self.assertEqual('renamed', image_meta['name'])
+
+    def test_name_index_is_bounded(self):
+        meta_cache = glance.ImageMetaCache(2, 60)
+        for i in xrange(5):
+            meta_cache.set({'id': 'image%d' % i, 'name': 'name%d' % i})
+        self.assertEqual(2, len(meta_cache._names))
+        self.assertEqual(None, meta_cache.get_id_by_name('name0'))
+        self.assertEqual('image4', meta_cache.get_id_by_name('name4'))
+
+    def test_show_by_name_uses_name_index(self):
+        self.service.detail(self.context)
+        del self.calls[:]
+        image_meta = self.service.show_by_name(self.context, 'name3')
+        self.assertEqual('image3', image_meta['id'])
+        self.assertEqual([], self.calls)
+
+    def test_detail_fetches_all_pages(self):
+        self.flags(glance_page_size=2)
+        image_metas = self.service.detail(self.context)
+        self.assertEqual(5, len(image_metas))
+        self.assertEqual([('get_images_detailed', None),
+                          ('get_images_detailed', 'image1'),
+                          ('get_images_detailed', 'image3')], self.calls)
+
+    def test_show_by_name_stops_at_first_match(self):
+        self.flags(glance_page_size=2)
+        image_meta = self.service.show_by_name(self.context, 'name1')
+        self.assertEqual('image1', image_meta['id'])
+        self.assertEqual([('get_images_detailed', None)], self.calls)
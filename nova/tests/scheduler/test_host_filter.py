@@ -238,3 +238,32 @@ class HostFilterTestCase(test.TestCase):
 
         self.assertFalse(hf.filter_hosts(self.zone_manager,
                 json.dumps(['=', {}, ['>', '$missing....foo']])))
+
+    def test_compiled_json_filter_matches_interpreter(self):
+        hf = host_filter.JsonFilter()
+        queries = [[],
+                   ['=', '$compute.host_memory_free', 30],
+                   ['=', '$compute.host_memory_free', 10],
+                   ['not', ['<', '$compute.disk_available', 500], False],
+                   ['and', ['>=', '$compute.host_memory_free', 40],
+                           ['in', '$compute.xpu_arch', 'fermi', 'radeon']],
+                   ['or', ['=', '$compute.xpu_info', 'Tesla 2050'],
+                          ['=', '$compute.host_other-config.foo', 1]],
+                   ['=', '', None, 'literal', 'literal'],
+                   ['<', '$compute', {}],
+                   ['>', ['and', ['or', ['not', ['<', ['>=']]]]]]]
+        for query in queries:
+            process = hf._compile_filter(query)
+            for host, services in self.zone_manager.service_states.items():
+                self.assertEqual(
+                        hf._process_filter(self.zone_manager, query, host,
+                                           services),
+                        process(services))
+
+    def test_json_filter_is_compiled_once(self):
+        hf = host_filter.JsonFilter()
+        query = json.dumps(['>', '$compute.host_memory_free', 50])
+        self.assertEqual(5, len(hf.filter_hosts(self.zone_manager, query)))
+        compiled = hf._get_compiled_filter(query)
+        self.assertTrue(compiled is
+                host_filter.JsonFilter()._get_compiled_filter(query))
@@ -25,6 +25,7 @@ import novaclient.exceptions
 import stubout
 import webob
 
+from eventlet import greenthread
 from mox import IgnoreArg
 from nova import context
 from nova import db
@@ -977,6 +978,8 @@ class ZoneRedirectTest(test.TestCase):
         self.stubs.Set(db, 'instance_get_by_uuid',
                        fake_instance_get_by_uuid)
 
+        self.stubs.Set(api, '_locations', None)
+
         self.enable_zone_routing = FLAGS.enable_zone_routing
         FLAGS.enable_zone_routing = True
 
@@ -1011,6 +1014,49 @@ class ZoneRedirectTest(test.TestCase):
         except api.RedirectResult, e:
             self.assertEquals(e.results['magic'], 'found me')
 
+    def test_reroute_asks_located_zone_only(self):
+        zones = [FakeZone(1, 'http://example.com', 'bob', 'xxx'),
+                 FakeZone(2, 'http://example.org', 'bob', 'xxx')]
+        self.stubs.Set(db, 'zone_get_all', lambda context: zones)
+        called = []
+
+        def call_child_zones(zones, function):
+            called.append([zone.id for zone in zones])
+            return [FakeResource(dict(a=1))]
+
+        decorator = api.reroute_compute("get")
+        self.stubs.Set(decorator, '_call_child_zones', call_child_zones)
+        api.set_location('servers', FAKE_UUID_NOT_FOUND, 2)
+        try:
+            decorator(go_boom)(None, None, FAKE_UUID_NOT_FOUND)
+            self.fail(_("Should have rerouted."))
+        except api.RedirectResult, e:
+            self.assertEquals(e.results, dict(server=dict(a=1)))
+        self.assertEquals(called, [[2]])
+
+    def test_reroute_asks_other_zones_when_moved(self):
+        zones = [FakeZone(1, 'http://example.com', 'bob', 'xxx'),
+                 FakeZone(2, 'http://example.org', 'bob', 'xxx')]
+        self.stubs.Set(db, 'zone_get_all', lambda context: zones)
+        called = []
+
+        def call_child_zones(zones, function):
+            called.append([zone.id for zone in zones])
+            # Not found in zone 2 anymore, found in zone 1.
+            api.forget_location('servers', FAKE_UUID_NOT_FOUND, 2)
+            if zones[0].id == 1:
+                api.set_location('servers', FAKE_UUID_NOT_FOUND, 1)
+            return [None]
+
+        decorator = api.reroute_compute("get")
+        self.stubs.Set(decorator, '_call_child_zones', call_child_zones)
+        api.set_location('servers', FAKE_UUID_NOT_FOUND, 2)
+        self.assertRaises(api.RedirectResult,
+                          decorator(go_boom), None, None, FAKE_UUID_NOT_FOUND)
+        self.assertEquals(called, [[2], [1]])
+        self.assertEquals(api.get_location('servers', FAKE_UUID_NOT_FOUND),
+                          1)
+
     def test_routing_flags(self):
         FLAGS.enable_zone_routing = False
         decorator = FakeRerouteCompute("foo")
@@ -1065,6 +1111,10 @@ class FakeNovaClient(object):
 
 
 class DynamicNovaClientTest(test.TestCase):
+    def setUp(self):
+        super(DynamicNovaClientTest, self).setUp()
+        self.stubs.Set(api, '_locations', None)
+
     def test_issue_novaclient_command_found(self):
         zone = FakeZone(1, 'http://example.com', 'bob', 'xxx')
         self.assertEquals(api._issue_novaclient_command(
@@ -1079,6 +1129,26 @@ class DynamicNovaClientTest(test.TestCase):
                     FakeNovaClient(FakeServerCollection()),
                     zone, "servers", "pause", 100), None)
 
+    def test_issue_novaclient_command_records_location(self):
+        zone = FakeZone(1, 'http://example.com', 'bob', 'xxx')
+        api._issue_novaclient_command(FakeNovaClient(FakeServerCollection()),
+                                      zone, "servers", "get", FAKE_UUID)
+        self.assertEquals(api.get_location('servers', FAKE_UUID), 1)
+
+        utils.set_time_override(utils.utcnow())
+        try:
+            utils.advance_time_seconds(FLAGS.zone_location_ttl)
+            self.assertEquals(api.get_location('servers', FAKE_UUID), None)
+        finally:
+            utils.clear_time_override()
+
+    def test_locations_are_bounded(self):
+        self.flags(zone_location_cache_size=2)
+        for item_uuid in ('a', 'b', 'c'):
+            api.set_location('servers', item_uuid, 1)
+        self.assertEquals(api.get_location('servers', 'a'), None)
+        self.assertEquals(api.get_location('servers', 'c'), 1)
+
     def test_issue_novaclient_command_not_found(self):
         zone = FakeZone(1, 'http://example.com', 'bob', 'xxx')
         self.assertEquals(api._issue_novaclient_command(
@@ -1102,12 +1172,27 @@ class FakeZonesProxy(object):
         raise Exception('testing')
 
 
+class FakeHTTPClient(object):
+    def __init__(self):
+        self.auth_token = None
+        self.management_url = None
+
+
 class FakeNovaClientOpenStack(object):
+    authentications = 0
+
     def __init__(self, *args, **kwargs):
         self.zones = FakeZonesProxy()
+        self.client = FakeHTTPClient()
 
     def authenticate(self):
-        pass
+        FakeNovaClientOpenStack.authentications += 1
+        self.client.auth_token = 'token%d' % self.authentications
+        self.client.management_url = 'http://example.com/v1.1'
+
+
+def fake_create_novaclient(zone):
+    return FakeNovaClientOpenStack()
 
 
 class CallZoneMethodTest(test.TestCase):
@@ -1115,7 +1200,9 @@ class CallZoneMethodTest(test.TestCase):
         super(CallZoneMethodTest, self).setUp()
         self.stubs = stubout.StubOutForTesting()
         self.stubs.Set(db, 'zone_get_all', zone_get_all)
-        self.stubs.Set(novaclient, 'OpenStack', FakeNovaClientOpenStack)
+        self.stubs.Set(api, '_create_novaclient', fake_create_novaclient)
+        self.stubs.Set(api, '_client_pools', {})
+        FakeNovaClientOpenStack.authentications = 0
 
     def tearDown(self):
         self.stubs.UnsetAll()
@@ -1132,9 +1219,127 @@ class CallZoneMethodTest(test.TestCase):
         context = {}
         method = 'not_present'
         self.assertRaises(AttributeError, api.call_zone_method,
-                          context, method)
+                          context, method, raise_errors=True)
 
     def test_call_zone_method_generates_exception(self):
         context = {}
         method = 'raises_exception'
-        self.assertRaises(Exception, api.call_zone_method, context, method)
+        self.assertRaises(Exception, api.call_zone_method, context, method,
+                          raise_errors=True)
+
+    def test_call_zone_method_leaves_out_failed_zones(self):
+        context = {}
+        self.assertEqual([], api.call_zone_method(context,
+                                                  'raises_exception'))
+
+    def test_call_zone_method_reuses_token(self):
+        context = {}
+        api.call_zone_method(context, 'do_something')
+        api.call_zone_method(context, 'do_something')
+        self.assertEqual(1, FakeNovaClientOpenStack.authentications)
+
+        utils.set_time_override(utils.utcnow())
+        try:
+            utils.advance_time_seconds(FLAGS.zone_client_token_ttl)
+            api.call_zone_method(context, 'do_something')
+        finally:
+            utils.clear_time_override()
+        self.assertEqual(2, FakeNovaClientOpenStack.authentications)
+
+
+class ZoneClientPoolTest(test.TestCase):
+    def setUp(self):
+        super(ZoneClientPoolTest, self).setUp()
+        self.stubs.Set(api, '_create_novaclient', fake_create_novaclient)
+        self.stubs.Set(api, '_client_pools', {})
+        FakeNovaClientOpenStack.authentications = 0
+        self.zone = FakeZone(1, 'http://example.com', 'bob', 'xxx')
+
+    def test_clients_share_token(self):
+        pool = api.get_client_pool(self.zone)
+        first = pool.get()
+        second = pool.get()
+        self.assertNotEqual(first, second)
+        self.assertEqual('token1', second.client.auth_token)
+        self.assertEqual(1, FakeNovaClientOpenStack.authentications)
+        pool.put(first)
+        pool.put(second)
+        self.assertTrue(pool.get() in (first, second))
+
+    def test_token_renewed_by_client_is_shared(self):
+        pool = api.get_client_pool(self.zone)
+        nova = pool.get()
+        nova.authenticate()
+        pool.put(nova)
+        self.assertEqual('token2', pool.auth_token)
+
+    def test_pool_per_credentials(self):
+        pool = api.get_client_pool(self.zone)
+        self.assertEqual(pool, api.get_client_pool(
+                FakeZone(2, 'http://example.com', 'bob', 'xxx')))
+        self.assertNotEqual(pool, api.get_client_pool(
+                FakeZone(1, 'http://example.com', 'bob', 'yyy')))
+
+
+class ScatterGatherTest(test.TestCase):
+    def setUp(self):
+        super(ScatterGatherTest, self).setUp()
+        self.stubs.Set(api, '_zone_stats', {})
+        self.zones = [FakeZone(1, 'http://example.com', 'bob', 'xxx'),
+                      FakeZone(2, 'http://example.org', 'bob', 'xxx')]
+        self.called = []
+
+    def _call(self, zone):
+        self.called.append(zone.id)
+        if zone.id == 2:
+            greenthread.sleep(1)
+        return zone.id * 10
+
+    def test_returns_answers_within_deadline(self):
+        results = api.scatter_gather(self.zones, self._call, timeout=0.1)
+        self.assertEqual([(self.zones[0], 10)], results)
+        self.assertEqual(1, api.get_zone_stats(1).calls)
+        self.assertEqual(1, api.get_zone_stats(2).timeouts)
+
+    def test_skips_zone_after_repeated_timeouts(self):
+        for i in xrange(FLAGS.zone_timeouts_to_skip):
+            api.scatter_gather(self.zones, self._call, timeout=0.1)
+        self.called = []
+        api.scatter_gather(self.zones, self._call, timeout=0.1)
+        self.assertEqual([1], self.called)
+        self.assertTrue(api.get_zone_stats(2).to_dict()['skipped'])
+
+        utils.set_time_override(utils.utcnow())
+        try:
+            utils.advance_time_seconds(FLAGS.zone_skip_interval)
+            api.scatter_gather(self.zones, self._call, timeout=0.1)
+        finally:
+            utils.clear_time_override()
+        self.assertEqual([1, 1, 2], self.called)
+
+    def test_records_errors(self):
+        def _call(zone):
+            if zone.id == 1:
+                raise exception.Error()
+            return zone.id * 10
+
+        results = api.scatter_gather(self.zones, _call)
+        self.assertEqual([(self.zones[1], 20)], results)
+        stats = api.get_zone_stats(1).to_dict()
+        self.assertEqual(1, stats['errors'])
+        self.assertEqual(1, stats['latency']['0.1'])
+        self.assertEqual(0, api.get_zone_stats(2).errors)
+
+    def test_raise_errors_kills_other_calls(self):
+        finished = []
+
+        def _call(zone):
+            if zone.id == 1:
+                raise exception.Error()
+            greenthread.sleep(0.1)
+            finished.append(zone.id)
+
+        self.assertRaises(exception.Error, api.scatter_gather,
+                          self.zones, _call, raise_errors=True)
+        greenthread.sleep(0.2)
+        self.assertEqual([], finished)
@@ -20,12 +20,14 @@ from M2Crypto import X509
 import unittest
 
 from nova import crypto
+from nova import exception
 from nova import flags
 from nova import log as logging
 from nova import test
 from nova.auth import manager
 from nova.api.ec2 import cloud
 from nova.auth import fakeldap
+from nova.auth import ldapdriver
 
 FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.tests.auth_unittest')
@@ -141,6 +143,48 @@ class _AuthManagerBaseTestCase(test.TestCase):
                         '127.0.0.1',
                         '/services/Cloud'))
 
+    def test_authenticate_caches_credentials(self):
+        lookups = []
+        get_user_from_access_key = self.manager.get_user_from_access_key
+
+        def counting_lookup(access_key):
+            lookups.append(access_key)
+            return get_user_from_access_key(access_key)
+
+        self.stubs.Set(self.manager, 'get_user_from_access_key',
+                       counting_lookup)
+        with user_generator(self.manager, name='admin', secret='admin',
+                            access='admin'):
+            with project_generator(self.manager, name="admin",
+                                   manager_user='admin'):
+                sig = 'd67Wzd9Bwz8xid9QU+lzWXcF2Y3tRicYABPJgrqfrwM='
+                auth_params = {'AWSAccessKeyId': 'admin:admin',
+                               'Action': 'DescribeAvailabilityZones',
+                               'SignatureMethod': 'HmacSHA256',
+                               'SignatureVersion': '2',
+                               'Timestamp': '2011-04-22T11:29:29',
+                               'Version': '2009-11-30'}
+                for i in xrange(3):
+                    (user, project) = self.manager.authenticate(
+                            'admin:admin', sig, auth_params, 'GET',
+                            '127.0.0.1:8773', '/services/Cloud/')
+                    self.assertEqual('admin', user.id)
+                    self.assertEqual('admin', project.id)
+        self.assertEqual(['admin'], lookups)
+
+    def test_authenticate_sees_membership_changes(self):
+        with user_generator(self.manager, name='test2', access='access2'):
+            with user_and_project_generator(self.manager) as (_user, proj):
+                self.manager.add_to_project('test2', proj)
+                (user, project) = self.manager.authenticate(
+                        'access2:testproj', None, {}, check_type=None)
+                self.assertEqual('test2', user.id)
+                self.manager.remove_from_project('test2', proj)
+                self.assertRaises(exception.ProjectMembershipNotFound,
+                                  self.manager.authenticate,
+                                  'access2:testproj', None, {},
+                                  check_type=None)
+
     def test_005_can_get_credentials(self):
         return
         credentials = self.manager.get_user('test1').get_credentials()
@@ -167,6 +211,15 @@ class _AuthManagerBaseTestCase(test.TestCase):
             self.manager.remove_role('test1', 'itsec')
             self.assertFalse(self.manager.has_role('test1', 'itsec'))
 
+    def test_auth_changes_bump_generation(self):
+        with user_generator(self.manager):
+            generation = self.manager.get_generation()
+            self.manager.add_role('test1', 'itsec')
+            self.assertNotEqual(generation, self.manager.get_generation())
+            generation = self.manager.get_generation()
+            self.manager.modify_user('test1', 'access', 'secret')
+            self.assertNotEqual(generation, self.manager.get_generation())
+
     def test_can_create_and_get_project(self):
         with user_and_project_generator(self.manager) as (u, p):
             self.assert_(self.manager.get_user('test1'))
@@ -379,6 +432,59 @@ class AuthManagerLdapTestCase(_AuthManagerBaseTestCase):
             fakeldap.server_fail = False
         self.manager.get_users()
 
+    def _count_searches(self):
+        searches = []
+        search_s = fakeldap.FakeLDAP.search_s
+
+        def counting_search_s(conn, *args, **kwargs):
+            searches.append(args)
+            return search_s(conn, *args, **kwargs)
+
+        self.stubs.Set(fakeldap.FakeLDAP, 'search_s', counting_search_s)
+        return searches
+
+    def test_authenticate_searches_are_cached(self):
+        self.flags(auth_credential_cache_size=0)
+        self.manager = manager.AuthManager(new=True)
+        user_state = {'name': 'test1', 'access': 'access1'}
+        with user_and_project_generator(self.manager, user_state=user_state):
+            searches = self._count_searches()
+            # NOTE: the second request finds the user through the dn that
+            #       the driver remembers for the access key
+            for i in xrange(2):
+                self.manager.authenticate('access1:testproj', None, {},
+                                          check_type=None)
+            self.assertTrue(searches)
+            del searches[:]
+            self.manager.authenticate('access1:testproj', None, {},
+                                      check_type=None)
+            self.assertEqual([], searches)
+
+    def test_cached_searches_are_not_changed(self):
+        stored = []
+        self.manager.get_users()
+        search_cache = ldapdriver.LdapDriver.search_cache
+        cache_set = search_cache.set
+
+        def recording_set(key, results, **kwargs):
+            stored.append(results)
+            return cache_set(key, results, **kwargs)
+
+        self.stubs.Set(search_cache, 'set', recording_set)
+        with user_generator(self.manager):
+            for i in xrange(2):
+                self.assertEqual('test1', self.manager.get_user('test1').id)
+        self.assertTrue(stored)
+        for results in stored:
+            for dn, attributes in results:
+                self.assertFalse('dn' in attributes)
+
+    def test_writes_invalidate_search_cache(self):
+        with user_generator(self.manager):
+            self.assertFalse(self.manager.get_user('test1').is_admin())
+            self.manager.modify_user('test1', admin=True)
+            self.assertTrue(self.manager.get_user('test1').is_admin())
+
 
 class AuthManagerDbTestCase(_AuthManagerBaseTestCase):
     auth_driver = 'nova.auth.dbdriver.DbDriver'
@@ -38,6 +38,7 @@ from nova import rpc
 from nova import test
 from nova import utils
 from nova.notifier import test_notifier
+from nova.virt import driver
 
 LOG = logging.getLogger('nova.tests.compute')
 FLAGS = flags.FLAGS
@@ -983,3 +984,29 @@ class ComputeTestCase(test.TestCase):
             self.context, instance_id):
             db.block_device_mapping_destroy(self.context, bdm['id'])
         self.compute.terminate_instance(self.context, instance_id)
+
+    def test_poll_instance_states(self):
+        admin_context = context.get_admin_context()
+        running_id = self._create_instance({'host': self.compute.host,
+                                            'state': power_state.RUNNING})
+        stopped_id = self._create_instance({'host': self.compute.host,
+                                            'state': power_state.RUNNING})
+        building_id = self._create_instance({'host': self.compute.host,
+                                             'state': power_state.BUILDING})
+        vms = [driver.InstanceInfo(FLAGS.instance_name_template % running_id,
+                                   power_state.RUNNING),
+               driver.InstanceInfo(FLAGS.instance_name_template % stopped_id,
+                                   power_state.SHUTDOWN),
+               driver.InstanceInfo('instance-ffffffff', power_state.RUNNING)]
+        self.stubs.Set(self.compute.driver, 'list_instances_detail',
+                       lambda: vms)
+        self.mox.StubOutWithMock(db, 'instance_update')
+        self.mox.ReplayAll()
+
+        result = self.compute._poll_instance_states(admin_context)
+        self.assertEqual(dict(instances=3, mismatches=1,
+                              vms_not_found_in_db=1), result)
+        states = [db.instance_get(admin_context, instance_id)['state']
+                  for instance_id in (running_id, stopped_id, building_id)]
+        self.assertEqual([power_state.RUNNING, power_state.SHUTDOWN,
+                          power_state.BUILDING], states)
@@ -18,11 +18,22 @@
 
 """Unit tests for the DB API"""
 
+import datetime
+import os
+import tempfile
+
+import eventlet
+import sqlalchemy
+
 from nova import test
 from nova import context
 from nova import db
+from nova import exception
 from nova import flags
+from nova import utils
 from nova.auth import manager
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import session as sqlalchemy_session
 
 FLAGS = flags.FLAGS
 
@@ -84,3 +95,351 @@ class DbApiTestCase(test.TestCase):
         self.assertEqual(instance.id, result.id)
         self.assertEqual(result['fixed_ips'][0]['floating_ips'][0].address,
                          '1.2.1.2')
+
+    def _create_instances(self, count, **kwargs):
+        values = {'instance_type_id': FLAGS.default_instance_type,
+                  'project_id': self.project.id}
+        values.update(kwargs)
+        return [db.instance_create(self.context, values)
+                for i in xrange(count)]
+
+    def test_instance_get_all_by_filters_pages_by_marker(self):
+        instances = self._create_instances(5)
+        ids = [instance.id for instance in instances]
+        filters = {'project_id': self.project.id}
+
+        result = db.instance_get_all_by_filters(self.context, filters,
+                                                limit=2)
+        self.assertEqual([inst.id for inst in result], ids[:2])
+        result = db.instance_get_all_by_filters(self.context, filters,
+                                                marker=ids[1], limit=2)
+        self.assertEqual([inst.id for inst in result], ids[2:4])
+        result = db.instance_get_all_by_filters(self.context, filters,
+                                                marker=ids[3])
+        self.assertEqual([inst.id for inst in result], ids[4:])
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, filters, marker=max(ids) + 1)
+
+    def test_instance_get_all_by_filters_marker_outside_filters(self):
+        instances = self._create_instances(3, state=1)
+        ids = [instance.id for instance in instances]
+        db.instance_update(self.context, ids[0], {'state': 2})
+        filters = {'project_id': self.project.id, 'state': [1]}
+        result = db.instance_get_all_by_filters(self.context, filters,
+                                                marker=ids[0])
+        self.assertEqual([inst.id for inst in result], ids[1:])
+
+        filters['project_id'] = 'other'
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, filters, marker=ids[0])
+
+    def test_instance_get_all_by_filters_with_offset(self):
+        instances = self._create_instances(4)
+        ids = [instance.id for instance in instances]
+        filters = {'project_id': self.project.id}
+        result = db.instance_get_all_by_filters(self.context, filters,
+                                                offset=1, limit=2)
+        self.assertEqual([inst.id for inst in result], ids[1:3])
+
+    def test_instance_get_all_by_filters_state_and_name(self):
+        self._create_instances(2, display_name='foo', state=1)
+        self._create_instances(1, display_name='foo', state=None)
+        self._create_instances(1, display_name='bar', state=1)
+        filters = {'project_id': self.project.id, 'display_name': 'foo'}
+        result = db.instance_get_all_by_filters(self.context, filters)
+        self.assertEqual(len(result), 3)
+
+        filters['state'] = [1]
+        result = db.instance_get_all_by_filters(self.context, filters)
+        self.assertEqual(len(result), 2)
+
+        filters['state'] = [None, 0]
+        result = db.instance_get_all_by_filters(self.context, filters)
+        self.assertEqual(len(result), 1)
+
+    def test_instance_get_all_by_filters_changes_since(self):
+        old, new = self._create_instances(2)
+        db.instance_update(self.context, new.id, {'display_name': 'new'})
+        since = db.instance_get(self.context, new.id)['updated_at']
+        created = self._create_instances(1)[0]
+        filters = {'project_id': self.project.id, 'changes-since': since}
+        result = db.instance_get_all_by_filters(self.context, filters)
+        self.assertEqual([inst.id for inst in result], [new.id, created.id])
+
+    def test_migration_get_all_by_instances_and_status(self):
+        ctxt = context.get_admin_context()
+        db.migration_create(ctxt, {'instance_uuid': 'a', 'status': 'finished'})
+        db.migration_create(ctxt, {'instance_uuid': 'b', 'status': 'finished'})
+        db.migration_create(ctxt, {'instance_uuid': 'c', 'status': 'reverted'})
+        result = db.migration_get_all_by_instances_and_status(ctxt,
+                ['a', 'c', 'd'], 'finished')
+        self.assertEqual([m['instance_uuid'] for m in result], ['a'])
+        self.assertEqual(db.migration_get_all_by_instances_and_status(ctxt,
+                [], 'finished'), [])
+
+    def _create_floating_ips(self, count):
+        ctxt = context.get_admin_context()
+        addresses = ['10.10.0.%d' % i for i in xrange(count)]
+        db.floating_ip_bulk_create(ctxt,
+                                   [{'address': address}
+                                    for address in addresses])
+        return addresses
+
+    def test_floating_ip_bulk_create_and_destroy(self):
+        ctxt = context.get_admin_context()
+        addresses = self._create_floating_ips(20)
+        result = db.floating_ip_get_all(ctxt)
+        self.assertEqual(sorted(ip['address'] for ip in result),
+                         sorted(addresses))
+
+        count = db.floating_ip_bulk_destroy(ctxt,
+                                            addresses[:10] + ['10.20.0.1'])
+        self.assertEqual(count, 10)
+        result = db.floating_ip_get_all(ctxt)
+        self.assertEqual(sorted(ip['address'] for ip in result),
+                         sorted(addresses[10:]))
+
+    def test_floating_ip_allocate_address_starts_at_random(self):
+        ctxt = context.get_admin_context()
+        addresses = self._create_floating_ips(5)
+        floating_ip = db.floating_ip_get_by_address(ctxt, addresses[3])
+        self.stubs.Set(sqlalchemy_api.random, 'randint',
+                       lambda first, last: floating_ip['id'])
+        self.assertEqual(db.floating_ip_allocate_address(ctxt, 'proj'),
+                         addresses[3])
+        # Allocated floating ips are skipped
+        self.assertEqual(db.floating_ip_allocate_address(ctxt, 'proj'),
+                         addresses[4])
+
+    def test_floating_ip_allocate_address_retries_when_claimed(self):
+        ctxt = context.get_admin_context()
+        addresses = self._create_floating_ips(5)
+        orig_claim = sqlalchemy_api._floating_ip_claim
+        self.claims = []
+
+        def racing_claim(session, floating_ip_id, project_id):
+            if not self.claims:
+                # Another allocation claims the floating ip first
+                orig_claim(session, floating_ip_id, 'other')
+            self.claims.append(floating_ip_id)
+            return orig_claim(session, floating_ip_id, project_id)
+
+        self.stubs.Set(sqlalchemy_api, '_floating_ip_claim', racing_claim)
+        address = db.floating_ip_allocate_address(ctxt, 'proj')
+        self.assertEqual(len(self.claims), 2)
+        self.assertEqual(db.floating_ip_get_by_address(ctxt,
+                                                       address)['project_id'],
+                         'proj')
+        claimed = db.floating_ip_get(ctxt, self.claims[0])
+        self.assertEqual(claimed['project_id'], 'other')
+
+    def test_floating_ip_allocate_address_until_exhausted(self):
+        ctxt = context.get_admin_context()
+        addresses = self._create_floating_ips(8)
+        pool = eventlet.GreenPool()
+        allocated = list(pool.imap(
+                lambda i: db.floating_ip_allocate_address(ctxt, 'proj'),
+                xrange(8)))
+        self.assertEqual(sorted(allocated), sorted(addresses))
+        self.assertRaises(exception.NoMoreFloatingIps,
+                          db.floating_ip_allocate_address, ctxt, 'proj')
+
+
+class ArchiveTestCase(test.TestCase):
+    def setUp(self):
+        super(ArchiveTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        utils.set_time_override()
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(ArchiveTestCase, self).tearDown()
+
+    def _create_instance(self):
+        instance = db.instance_create(self.context, {'project_id': 'fake'})
+        db.instance_action_create(self.context,
+                                  {'instance_id': instance['id'],
+                                   'action': 'reboot'})
+        db.instance_metadata_update_or_create(self.context, instance['id'],
+                                              {'key': 'value'})
+        return instance['id']
+
+    def _count(self, table):
+        session = sqlalchemy_api.get_session()
+        return session.execute('SELECT COUNT(*) FROM %s' % table).scalar()
+
+    def _archive(self, max_rows=100):
+        before = utils.utcnow() - datetime.timedelta(days=1)
+        return db.archive_deleted_rows(self.context, before, max_rows)
+
+    def test_archive_moves_deleted_instances_and_their_rows(self):
+        live_id = self._create_instance()
+        deleted_id = self._create_instance()
+        db.instance_destroy(self.context, deleted_id)
+        utils.advance_time_seconds(2 * 24 * 3600)
+        recent_id = self._create_instance()
+        db.instance_destroy(self.context, recent_id)
+
+        self.assertEqual({'instances': 1, 'instance_actions': 1,
+                          'instance_metadata': 1}, self._archive())
+        self.assertEqual(2, self._count('instances'))
+        self.assertEqual(1, self._count('shadow_instances'))
+        self.assertEqual(1, self._count('shadow_instance_actions'))
+        db.instance_get(self.context, live_id)
+        self.assertEqual(1, len(db.instance_get_actions(self.context,
+                                                        live_id)))
+        self.assertEqual({}, self._archive())
+
+    def test_archive_keeps_referenced_rows(self):
+        instance_id = self._create_instance()
+        db.virtual_interface_create(self.context,
+                                    {'address': '02:16:3e:00:00:01',
+                                     'instance_id': instance_id})
+        db.instance_destroy(self.context, instance_id)
+        utils.advance_time_seconds(2 * 24 * 3600)
+        # The rows of the instance stay with it
+        self.assertEqual({}, self._archive())
+        self.assertEqual(1, self._count('instance_actions'))
+        self.assertEqual(1, self._count('instance_metadata'))
+        self.assertEqual(0, self._count('shadow_instances'))
+
+    def test_archive_deleted_rows_of_live_instances(self):
+        instance_id = self._create_instance()
+        db.instance_metadata_delete(self.context, instance_id, 'key')
+        utils.advance_time_seconds(2 * 24 * 3600)
+        self.assertEqual({'instance_metadata': 1}, self._archive())
+        db.instance_get(self.context, instance_id)
+
+    def test_archive_reflects_tables_once(self):
+        reflections = []
+        reflect = sqlalchemy_api.MetaData.reflect
+
+        def counting_reflect(meta, *args, **kwargs):
+            reflections.append(meta)
+            return reflect(meta, *args, **kwargs)
+
+        self.stubs.Set(sqlalchemy_api, '_archive_meta', {})
+        self.stubs.Set(sqlalchemy_api.MetaData, 'reflect', counting_reflect)
+        db.instance_destroy(self.context, self._create_instance())
+        utils.advance_time_seconds(2 * 24 * 3600)
+        self._archive(1)
+        self._archive(1)
+        self.assertEqual(1, len(reflections))
+
+    def test_archive_in_batches(self):
+        for i in xrange(3):
+            db.instance_destroy(self.context, self._create_instance())
+        utils.advance_time_seconds(2 * 24 * 3600)
+        # Each instance is archived with its action and metadata
+        self.assertEqual({'instances': 1, 'instance_actions': 1,
+                          'instance_metadata': 1}, self._archive(5))
+        self.assertEqual({'instances': 2, 'instance_actions': 2,
+                          'instance_metadata': 2}, self._archive(6))
+        self.assertEqual({}, self._archive(6))
+
+    def test_purge_deletes_old_shadow_rows(self):
+        db.instance_destroy(self.context, self._create_instance())
+        utils.advance_time_seconds(2 * 24 * 3600)
+        self._archive()
+        before = utils.utcnow() - datetime.timedelta(days=1)
+        self.assertEqual({'shadow_instances': 1,
+                          'shadow_instance_metadata': 1},
+                         db.purge_shadow_rows(self.context, before, 100))
+        # The actions were marked deleted when they were archived
+        self.assertEqual(1, self._count('shadow_instance_actions'))
+        self.assertEqual(0, self._count('shadow_instances'))
+
+
+class TpoolBackendTestCase(test.TestCase):
+    def setUp(self):
+        super(TpoolBackendTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.heartbeats = 0
+        blocking_sleep = eventlet.patcher.original('time').sleep
+
+        def slow_service_get(context, service_id):
+            blocking_sleep(0.3)
+            return {'id': service_id}
+
+        self.stubs.Set(sqlalchemy_api, 'service_get', slow_service_get)
+
+    def _heartbeat(self):
+        while True:
+            self.heartbeats += 1
+            eventlet.sleep(0.01)
+
+    def _slow_query_heartbeats(self):
+        heartbeat = eventlet.spawn(self._heartbeat)
+        eventlet.sleep(0)
+        self.heartbeats = 0
+        try:
+            self.assertEqual({'id': 1}, db.service_get(self.context, 1))
+        finally:
+            heartbeat.kill()
+        return self.heartbeats
+
+    def test_slow_query_blocks_heartbeats(self):
+        self.assertEqual(0, self._slow_query_heartbeats())
+
+    def test_heartbeats_run_during_slow_query_in_tpool(self):
+        self.flags(db_use_tpool=True)
+        self.assertTrue(self._slow_query_heartbeats() > 10)
+
+    def test_tpool_calls_share_native_pool(self):
+        self.flags(db_use_tpool=True)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        engine = sqlalchemy.create_engine('sqlite:///%s' % path,
+                poolclass=sqlalchemy_session.NativeQueuePool,
+                pool_size=2, max_overflow=0, pool_timeout=5,
+                connect_args={'check_same_thread': False})
+        blocking_sleep = eventlet.patcher.original('time').sleep
+
+        class Backend(object):
+            def select(self):
+                connection = engine.connect()
+                try:
+                    blocking_sleep(0.05)
+                    return connection.execute('SELECT 1').scalar()
+                finally:
+                    connection.close()
+
+        backend = db.api.TpoolBackend(Backend())
+        try:
+            calls = [eventlet.spawn(backend.select) for i in xrange(8)]
+            with eventlet.Timeout(10):
+                self.assertEqual([1] * 8, [call.wait() for call in calls])
+        finally:
+            engine.dispose()
+            os.unlink(path)
+
+    def test_tpool_engine_uses_native_pool(self):
+        self.flags(db_use_tpool=True, sql_connection='mysql://nova@db/nova')
+        engines = []
+
+        class FakeSession(object):
+            def query(self):
+                pass
+
+            def flush(self):
+                pass
+
+        def fake_create_engine(connection, **kwargs):
+            engines.append(kwargs)
+
+        self.stubs.Set(sqlalchemy_session, '_ENGINE', None)
+        self.stubs.Set(sqlalchemy_session, '_MAKER', None)
+        self.stubs.Set(sqlalchemy_session, 'create_engine',
+                       fake_create_engine)
+        self.stubs.Set(sqlalchemy_session, 'sessionmaker',
+                       lambda **kwargs: FakeSession)
+        sqlalchemy_session.get_session()
+        self.assertEqual(sqlalchemy_session.NativeQueuePool,
+                         engines[0]['poolclass'])
+
+    def test_tpool_calls_raise_backend_errors(self):
+        self.flags(db_use_tpool=True)
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get, self.context, 99999)
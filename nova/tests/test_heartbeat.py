@@ -0,0 +1,113 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the service heartbeat drivers."""
+
+from nova import context
+from nova import db
+from nova import exception
+from nova import flags
+from nova import heartbeat
+from nova import test
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+
+
+class _HeartbeatDriverTestCase(object):
+    def setUp(self):
+        super(_HeartbeatDriverTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        utils.set_time_override()
+        self.services = [self._create_service('host%d' % i)
+                         for i in xrange(3)]
+        self._create_service('host3', disabled=True)
+        self._create_service('host4', topic='volume')
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(_HeartbeatDriverTestCase, self).tearDown()
+
+    def _create_service(self, host, topic='compute', disabled=False):
+        return db.service_create(self.context, {'host': host,
+                                                'binary': 'nova-%s' % topic,
+                                                'topic': topic,
+                                                'disabled': disabled,
+                                                'report_count': 0})
+
+    def _beat(self, service):
+        self.driver.beat(self.context, service['id'], service['topic'],
+                         service['host'])
+
+    def test_services_go_down_without_heartbeats(self):
+        for service in self.services:
+            self._beat(service)
+        utils.advance_time_seconds(FLAGS.service_down_time - 10)
+        self._beat(self.services[1])
+        utils.advance_time_seconds(20)
+        self.assertEqual(['host1'],
+                         self.driver.get_hosts_up(self.context, 'compute'))
+        services = [db.service_get(self.context, service['id'])
+                    for service in self.services]
+        self.assertEqual([False, True, False],
+                         [self.driver.is_up(service) for service in services])
+
+
+class DbHeartbeatDriverTestCase(_HeartbeatDriverTestCase, test.TestCase):
+    def setUp(self):
+        self.driver = heartbeat.DbHeartbeatDriver()
+        super(DbHeartbeatDriverTestCase, self).setUp()
+
+    def test_beat_increments_report_count(self):
+        service = self.services[0]
+        self._beat(service)
+        self._beat(service)
+        service = db.service_get(self.context, service['id'])
+        self.assertEqual(2, service['report_count'])
+        self.assertEqual(utils.utcnow(), service['updated_at'])
+
+    def test_beat_raises_for_deleted_service(self):
+        service = self.services[0]
+        db.service_destroy(self.context, service['id'])
+        self.assertRaises(exception.ServiceNotFound, self._beat, service)
+
+    def test_new_services_are_up(self):
+        self.assertEqual(['host0', 'host1', 'host2'],
+                         sorted(self.driver.get_hosts_up(self.context,
+                                                         'compute')))
+
+
+class MemcacheHeartbeatDriverTestCase(_HeartbeatDriverTestCase,
+                                      test.TestCase):
+    def setUp(self):
+        self.driver = heartbeat.MemcacheHeartbeatDriver()
+        super(MemcacheHeartbeatDriverTestCase, self).setUp()
+
+    def test_beat_does_not_write_to_db(self):
+        self.stubs.Set(db, 'service_update', None)
+        self.stubs.Set(db, 'service_heartbeat', None)
+        self._beat(self.services[0])
+        self.assertEqual(['host0'],
+                         self.driver.get_hosts_up(self.context, 'compute'))
+
+    def test_get_driver_needs_memcached_servers(self):
+        self.stubs.Set(heartbeat, '_drivers', {})
+        self.flags(heartbeat_driver='nova.heartbeat.MemcacheHeartbeatDriver',
+                   memcached_servers=[])
+        self.assertTrue(isinstance(heartbeat.get_driver(),
+                                   heartbeat.DbHeartbeatDriver))
@@ -21,6 +21,7 @@ import os
 import re
 import shutil
 import sys
+import tempfile
 
 from xml.etree.ElementTree import fromstring as xml_to_tree
 from xml.dom.minidom import parseString as xml_to_dom
@@ -36,6 +37,8 @@ from nova.auth import manager
 from nova.compute import power_state
 from nova.virt.libvirt import connection
 from nova.virt.libvirt import firewall
+from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import resources
 
 libvirt = None
 FLAGS = flags.FLAGS
@@ -44,6 +47,7 @@ flags.DECLARE('instances_path', 'nova.compute.manager')
 
 def _concurrency(wait, done, target):
     wait.wait()
+    open(target, 'w').close()
     done.send()
 
 
@@ -94,6 +98,10 @@ def _setup_networking(instance_id, ip='1.2.3.4'):
 class CacheConcurrencyTestCase(test.TestCase):
     def setUp(self):
         super(CacheConcurrencyTestCase, self).setUp()
+        self.instances_path = tempfile.mkdtemp()
+        self.flags(instances_path=self.instances_path,
+                   lock_path=self.instances_path)
+        os.mkdir(os.path.join(self.instances_path, '_base'))
 
         def fake_exists(fname):
             basedir = os.path.join(FLAGS.instances_path, '_base')
@@ -107,6 +115,10 @@ class CacheConcurrencyTestCase(test.TestCase):
         self.stubs.Set(os.path, 'exists', fake_exists)
         self.stubs.Set(utils, 'execute', fake_execute)
 
+    def tearDown(self):
+        shutil.rmtree(self.instances_path)
+        super(CacheConcurrencyTestCase, self).tearDown()
+
     def test_same_fname_concurrency(self):
         """Ensures that the same fname cache runs at a sequentially"""
         conn = connection.LibvirtConnection
@@ -148,6 +160,189 @@ class CacheConcurrencyTestCase(test.TestCase):
             eventlet.sleep(0)
 
 
+class ImageCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.instances_path = tempfile.mkdtemp()
+        self.flags(instances_path=self.instances_path,
+                   lock_path=self.instances_path)
+        self.cache = imagecache.ImageCache()
+        self.fetches = []
+        utils.set_time_override()
+
+    def tearDown(self):
+        utils.clear_time_override()
+        shutil.rmtree(self.instances_path)
+        super(ImageCacheTestCase, self).tearDown()
+
+    def _fetch(self, target, data='x'):
+        self.fetches.append(target)
+        with open(target, 'w') as image_file:
+            image_file.write(data * 4096)
+
+    def _make_disk(self, name):
+        path = os.path.join(self.instances_path, name)
+        open(path, 'w').close()
+        return path
+
+    def test_fetches_base_image_once(self):
+        disk1 = self._make_disk('disk1')
+        disk2 = self._make_disk('disk2')
+        base = self.cache.fetch('image', self._fetch, disk1)
+        self.assertEqual(base, self.cache.fetch('image', self._fetch, disk2))
+        self.assertEqual(1, len(self.fetches))
+        self.assertTrue(os.path.exists(base))
+        self.assertEqual([disk1, disk2],
+                         self.cache._read_info('image')['users'])
+
+    def test_fetch_locks_and_writes_in_base_dir(self):
+        locks = []
+
+        def fake_synchronized(name, external=False, lock_path=None):
+            locks.append((name, external, lock_path))
+            return lambda f: f
+
+        def failing_fetch(target):
+            self.fetches.append(target)
+            raise IOError()
+
+        self.stubs.Set(utils, 'synchronized', fake_synchronized)
+        self.assertRaises(IOError, self.cache.fetch, 'image', failing_fetch)
+        base_dir = os.path.join(self.instances_path, '_base')
+        self.assertEqual([('image', True, os.path.join(base_dir, '.locks'))],
+                         locks)
+        self.assertEqual(base_dir, os.path.dirname(self.fetches[0]))
+        self.assertEqual(['.locks'], os.listdir(base_dir))
+
+    def test_evicts_least_recently_used_unreferenced_images(self):
+        disk = self._make_disk('disk')
+        self.cache.fetch('in_use', self._fetch, disk)
+        self.cache.fetch('oldest', self._fetch)
+        utils.advance_time_seconds(10)
+        self.cache.fetch('newer', self._fetch)
+        utils.advance_time_seconds(FLAGS.image_cache_min_age + 1)
+        self.cache.evict(1)
+        self.assertTrue(os.path.exists(self.cache.path('in_use')))
+        self.assertFalse(os.path.exists(self.cache.path('oldest')))
+        self.assertFalse(os.path.exists(self.cache.path('newer')))
+
+    def test_evict_keeps_recently_used_images(self):
+        self.cache.fetch('recent', self._fetch)
+        self.cache.evict(1)
+        self.assertTrue(os.path.exists(self.cache.path('recent')))
+
+    def test_evict_stops_within_budget(self):
+        self.cache.fetch('oldest', self._fetch)
+        utils.advance_time_seconds(10)
+        self.cache.fetch('newer', self._fetch)
+        utils.advance_time_seconds(FLAGS.image_cache_min_age + 1)
+        budget = self.cache._disk_usage(self.cache.path('newer'))
+        self.cache.evict(budget)
+        self.assertFalse(os.path.exists(self.cache.path('oldest')))
+        self.assertTrue(os.path.exists(self.cache.path('newer')))
+
+    def test_reference_released_when_disk_is_deleted(self):
+        disk = self._make_disk('disk')
+        self.cache.fetch('image', self._fetch, disk)
+        os.unlink(disk)
+        utils.advance_time_seconds(FLAGS.image_cache_min_age + 1)
+        self.cache.evict(1)
+        self.assertFalse(os.path.exists(self.cache.path('image')))
+
+
+class TemplateCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(TemplateCacheTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test.xml.template')
+        self._write_template('<name>$name</name>', 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TemplateCacheTestCase, self).tearDown()
+
+    def _write_template(self, source, mtime):
+        with open(self.path, 'w') as template_file:
+            template_file.write(source)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_template_is_compiled_once(self):
+        template = connection._get_template(self.path)
+        self.assertTrue(template is connection._get_template(self.path))
+        self.assertEqual('<name>foo</name>',
+                         str(template(searchList=[{'name': 'foo'}])))
+
+    def test_changed_template_is_compiled_again(self):
+        template = connection._get_template(self.path)
+        self._write_template('<uuid>$name</uuid>', 10)
+        changed = connection._get_template(self.path)
+        self.assertFalse(template is changed)
+        self.assertEqual('<uuid>foo</uuid>',
+                         str(changed(searchList=[{'name': 'foo'}])))
+
+
+class FakeResourceDomain(object):
+    def __init__(self, name, vcpus, memory_mb):
+        self._name = name
+        self._info = [power_state.RUNNING, memory_mb * 1024,
+                      memory_mb * 1024, vcpus, 0]
+
+    def name(self):
+        return self._name
+
+    def info(self):
+        return self._info
+
+
+class HostResourceTrackerTestCase(test.TestCase):
+    def setUp(self):
+        super(HostResourceTrackerTestCase, self).setUp()
+        self.domains = {1: FakeResourceDomain('instance-1', 2, 2048),
+                        2: FakeResourceDomain('instance-2', 1, 512)}
+        self.lookups = 0
+        self.tracker = resources.HostResourceTracker(lambda: self)
+        self.meminfo = {'MemTotal': 16384, 'MemFree': 8192,
+                        'Buffers': 512, 'Cached': 1536}
+        self.stubs.Set(resources, 'read_meminfo', lambda: self.meminfo)
+        self.stubs.Set(sys, 'platform', 'linux2')
+        utils.set_time_override()
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(HostResourceTrackerTestCase, self).tearDown()
+
+    def listDomainsID(self):
+        return self.domains.keys()
+
+    def lookupByID(self, dom_id):
+        self.lookups += 1
+        return self.domains[dom_id]
+
+    def test_totals_are_reconciled_once(self):
+        self.assertEqual(3, self.tracker.get_vcpu_used())
+        self.assertEqual(6144, self.tracker.get_memory_mb_used())
+        self.assertEqual(16384, self.tracker.get_memory_mb_total())
+        self.assertEqual(3, self.tracker.get_vcpu_used())
+        self.assertEqual(2, self.lookups)
+
+    def test_totals_follow_added_and_removed_domains(self):
+        self.tracker.get_vcpu_used()
+        self.tracker.add('instance-3', 4, 4096)
+        self.assertEqual(7, self.tracker.get_vcpu_used())
+        self.assertEqual(10240, self.tracker.get_memory_mb_used())
+        self.tracker.remove('instance-1')
+        self.assertEqual(5, self.tracker.get_vcpu_used())
+        self.assertEqual(8192, self.tracker.get_memory_mb_used())
+        self.assertEqual(2, self.lookups)
+
+    def test_reconciles_after_interval(self):
+        self.tracker.get_vcpu_used()
+        self.tracker.add('instance-3', 4, 4096)
+        utils.advance_time_seconds(FLAGS.libvirt_resource_reconcile_interval)
+        self.assertEqual(3, self.tracker.get_vcpu_used())
+        self.assertEqual(4, self.lookups)
+
+
 class LibvirtConnTestCase(test.TestCase):
 
     def setUp(self):
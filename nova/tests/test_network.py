@@ -15,12 +15,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from nova import context
 from nova import db
 from nova import exception
 from nova import flags
 from nova import log as logging
+from nova import rpc
 from nova import test
+from nova.network import api as network_api
 from nova.network import manager as network_manager
+from nova.virt.libvirt import netutils
 
 
 import mox
@@ -139,7 +143,8 @@ class FlatNetworkTestCase(test.TestCase):
                                    mox.IgnoreArg()).AndReturn(flavor)
         self.mox.ReplayAll()
 
-        nw_info = self.network.get_instance_nw_info(None, 0, 0, None)
+        nw_info = self.network.get_instance_nw_info(
+                context.get_admin_context(), 0, 0, None)
 
         self.assertTrue(nw_info)
 
@@ -148,6 +153,7 @@ class FlatNetworkTestCase(test.TestCase):
             check = {'bridge': 'fa%s' % i,
                      'cidr': '192.168.%s.0/24' % i,
                      'cidr_v6': '2001:db%s::/64' % i8,
+                     'gateway_v6': '2001:db%s::1' % i8,
                      'id': i,
                      'multi_host': False,
                      'injected': 'DONTCARE',
@@ -181,6 +187,101 @@ class FlatNetworkTestCase(test.TestCase):
             self.assertDictListMatch(nw[1]['ips'], check)
 
 
+class InstanceInfoCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(InstanceInfoCacheTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.network = network_manager.FlatManager(host=HOST)
+        self.network.db = db
+        self.network_api = network_api.API()
+
+        values = dict(networks[1])
+        del values['id']
+        network = db.network_create_safe(self.context, values)
+        instance_type = db.instance_type_get_by_name(self.context, 'm1.tiny')
+        self.instance = db.instance_create(self.context,
+                {'host': HOST,
+                 'instance_type_id': instance_type['id'],
+                 'project_id': 'fake_project'})
+        vif = db.virtual_interface_create(self.context,
+                {'address': 'DE:AD:BE:EF:00:01',
+                 'network_id': network['id'],
+                 'instance_id': self.instance['id']})
+        db.fixed_ip_create(self.context,
+                {'address': '192.168.1.100',
+                 'network_id': network['id'],
+                 'virtual_interface_id': vif['id'],
+                 'allocated': True,
+                 'instance_id': self.instance['id']})
+
+        self.rpc_calls = []
+
+        def fake_call(ctxt, topic, msg):
+            self.rpc_calls.append(msg['method'])
+            return getattr(self.network, msg['method'])(ctxt, **msg['args'])
+
+        self.stubs.Set(rpc, 'call', fake_call)
+
+    def _count_db_calls(self):
+        """Records the names of the db api functions called."""
+        calls = []
+
+        def counted(name, func):
+            def wrapper(*args, **kwargs):
+                calls.append(name)
+                return func(*args, **kwargs)
+            return wrapper
+
+        for name in dir(db):
+            func = getattr(db, name)
+            if getattr(func, '__module__', None) == 'nova.db.api':
+                self.stubs.Set(db, name, counted(name, func))
+        return calls
+
+    def test_reboot_reads_network_info_from_cache(self):
+        calls = self._count_db_calls()
+        # What compute does on every reboot, before and once cached
+        built = self.network_api.get_instance_nw_info(self.context,
+                                                      self.instance)
+        self.assertEqual(self.rpc_calls, ['get_instance_nw_info'])
+        self.assertEqual(calls, ['instance_info_cache_get',
+                                 'fixed_ip_get_by_instance',
+                                 'virtual_interface_get_by_instance',
+                                 'instance_type_get',
+                                 'instance_info_cache_update'])
+
+        calls[:] = []
+        cached = self.network_api.get_instance_nw_info(self.context,
+                                                       self.instance)
+        self.assertEqual(calls, ['instance_info_cache_get'])
+        self.assertEqual(self.rpc_calls, ['get_instance_nw_info'])
+        self.assertEqual(cached, built)
+        self.assertEqual(netutils.get_network_info(self.instance), built)
+
+    def test_cache_is_dropped_when_fixed_ips_change(self):
+        self.network_api.get_instance_nw_info(self.context, self.instance)
+        self.network.remove_fixed_ip_from_instance(self.context,
+                                                   self.instance['id'],
+                                                   '192.168.1.100')
+        self.assertEqual(db.instance_info_cache_get(self.context,
+                                                    self.instance['id']),
+                         None)
+        nw_info = self.network_api.get_instance_nw_info(self.context,
+                                                        self.instance)
+        self.assertEqual(self.rpc_calls, ['get_instance_nw_info'] * 2)
+        self.assertEqual(nw_info[0][1]['ips'], [])
+
+    def test_cache_of_another_host_is_not_used(self):
+        self.network_api.get_instance_nw_info(self.context, self.instance)
+        db.instance_update(self.context, self.instance['id'],
+                           {'host': 'otherhost'})
+        instance = db.instance_get(self.context, self.instance['id'])
+        self.network_api.get_instance_nw_info(self.context, instance)
+        self.assertEqual(self.rpc_calls, ['get_instance_nw_info'] * 2)
+        info_cache = db.instance_info_cache_get(self.context, instance['id'])
+        self.assertEqual(info_cache['host'], 'otherhost')
+
+
 class VlanNetworkTestCase(test.TestCase):
     def setUp(self):
         super(VlanNetworkTestCase, self).setUp()
@@ -249,6 +350,9 @@ class CommonNetworkTestCase(test.TestCase):
                 return [dict(address='10.0.0.0'),  dict(address='10.0.0.1'),
                         dict(address='10.0.0.2')]
 
+            def instance_info_cache_delete(self, context, instance_id):
+                pass
+
         def __init__(self):
             self.db = self.FakeDB()
             self.deallocate_called = None
@@ -116,6 +116,22 @@ class NotifierTestCase(test.TestCase):
                 'event_type', 'DEBUG', dict(a=3))
         self.assertEqual(self.test_topic, 'testnotify.debug')
 
+    def test_rabbit_notify_many_uses_one_publisher(self):
+        self.stubs.Set(nova.flags.FLAGS, 'notification_driver',
+                'nova.notifier.rabbit_notifier')
+        self.stubs.Set(nova.flags.FLAGS, 'notification_topic',
+                'testnotify')
+        self.casts = []
+
+        def mock_cast_many(context, topic, msgs):
+            self.casts.append((topic, [msg['payload'] for msg in msgs]))
+
+        self.stubs.Set(nova.rpc, 'cast_many', mock_cast_many)
+        nova.notifier.api.notify_many('publisher_id', 'event_type', 'DEBUG',
+                                      [dict(a=1), dict(a=2)])
+        self.assertEqual(self.casts,
+                         [('testnotify.debug', [dict(a=1), dict(a=2)])])
+
     def test_error_notification(self):
         self.stubs.Set(nova.flags.FLAGS, 'notification_driver',
             'nova.notifier.rabbit_notifier')
@@ -19,6 +19,7 @@
 from nova import compute
 from nova import context
 from nova import db
+from nova import exception
 from nova import flags
 from nova import network
 from nova import quota
@@ -27,6 +28,8 @@ from nova import utils
 from nova import volume
 from nova.auth import manager
 from nova.compute import instance_types
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
 
 
 FLAGS = flags.FLAGS
@@ -392,3 +395,116 @@ class QuotaTestCase(test.TestCase):
         files = [(path, 'config = quotatest')]
         self.assertRaises(quota.QuotaError,
                           self._create_with_injected_files, files)
+
+    def _get_usages(self):
+        quota, usages = db.quota_usage_get_all_by_project(self.context,
+                                                          self.project.id)
+        return dict((resource, (usage['in_use'], usage['reserved']))
+                    for resource, usage in usages.iteritems())
+
+    def test_usages_follow_resources(self):
+        instance_id = self._create_instance(cores=2)
+        volume_id = self._create_volume(size=10)
+        address = '192.168.0.100'
+        db.floating_ip_create(context.get_admin_context(),
+                              {'address': address})
+        self.network.allocate_floating_ip(self.context, self.project.id)
+        usages = self._get_usages()
+        self.assertEqual((1, 0), usages['instances'])
+        self.assertEqual((2, 0), usages['cores'])
+        self.assertEqual((1, 0), usages['volumes'])
+        self.assertEqual((10, 0), usages['gigabytes'])
+        self.assertEqual((1, 0), usages['floating_ips'])
+
+        db.instance_destroy(self.context, instance_id)
+        db.instance_destroy(self.context, instance_id)
+        db.volume_destroy(self.context, volume_id)
+        db.floating_ip_deallocate(self.context, address)
+        usages = self._get_usages()
+        self.assertEqual((0, 0), usages['instances'])
+        self.assertEqual((0, 0), usages['cores'])
+        self.assertEqual((0, 0), usages['volumes'])
+        self.assertEqual((0, 0), usages['gigabytes'])
+        self.assertEqual((0, 0), usages['floating_ips'])
+
+    def test_reservations(self):
+        instance_type = self._get_instance_type('m1.small')
+        reservations = quota.reserve_instances(self.context, 1,
+                                               instance_type)
+        self.assertNotEqual(None, reservations)
+        self.assertEqual((0, 1), self._get_usages()['instances'])
+        self.assertEqual(1, quota.allowed_instances(self.context, 2,
+                                                    instance_type))
+        self.assertEqual(None, quota.reserve_instances(self.context, 2,
+                                                       instance_type))
+        self.assertEqual((0, 1), self._get_usages()['instances'])
+        self._create_instance(cores=1)
+        self.assertEqual((1, 1), self._get_usages()['instances'])
+        quota.release(self.context, reservations)
+        self.assertEqual((1, 0), self._get_usages()['instances'])
+        quota.release(self.context, reservations)
+        self.assertEqual((1, 0), self._get_usages()['instances'])
+
+    def test_reservations_released_on_failure(self):
+        self.assertRaises(exception.NoMoreFloatingIps,
+                          self.network.allocate_floating_ip,
+                          self.context, self.project.id)
+        self.assertEqual((0, 0), self._get_usages()['floating_ips'])
+
+    def test_reservations_expire_while_usage_changes(self):
+        utils.set_time_override(utils.utcnow())
+        try:
+            self.assertNotEqual(None,
+                                quota.reserve_volumes(self.context, 1, 5))
+            utils.advance_time_seconds(FLAGS.quota_reservation_expire + 1)
+            # NOTE: changing the usage bumps its updated_at, which must
+            # not keep the reservation made before alive.
+            self._create_volume(size=1)
+            quota.sync_usages(context.get_admin_context())
+        finally:
+            utils.clear_time_override()
+        self.assertEqual((1, 0), self._get_usages()['volumes'])
+
+    def test_usage_created_once(self):
+        db.quota_usage_reserve(self.context, self.project.id,
+                               {'volumes': 1}, {'volumes': 10},
+                               utils.utcnow())
+        session = get_session()
+        self.assertRaises(Exception,
+                          session.execute,
+                          models.QuotaUsage.__table__.insert().values(
+                                project_id=self.project.id,
+                                resource='volumes', in_use=0, reserved=0,
+                                deleted=False))
+        session = get_session()
+        self.assertEqual(1, session.query(models.QuotaUsage).
+                                 filter_by(project_id=self.project.id).
+                                 filter_by(resource='volumes').
+                                 count())
+
+    def test_sync_usages(self):
+        self._create_instance(cores=2)
+        self._create_volume(size=10)
+        session = get_session()
+        session.query(models.QuotaUsage).\
+                filter_by(resource='cores').\
+                update({'in_use': 5})
+        session.query(models.QuotaUsage).\
+                filter_by(resource='volumes').\
+                delete()
+        self.assertNotEqual(None,
+                            quota.reserve_volumes(self.context, 1, 5))
+        admin_context = context.get_admin_context()
+        self.assertEqual(
+                sorted([(self.project.id, 'cores', 5, 2),
+                        (self.project.id, 'volumes', 0, 1)]),
+                sorted(quota.sync_usages(admin_context)))
+        self.assertEqual((10, 5), self._get_usages()['gigabytes'])
+
+        utils.set_time_override(utils.utcnow())
+        try:
+            utils.advance_time_seconds(FLAGS.quota_reservation_expire + 1)
+            self.assertEqual([], quota.sync_usages(admin_context))
+        finally:
+            utils.clear_time_override()
+        self.assertEqual((10, 0), self._get_usages()['gigabytes'])
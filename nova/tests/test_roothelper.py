@@ -0,0 +1,114 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the root helper and utils.execute running commands with it."""
+
+import os
+import shutil
+import tempfile
+
+from eventlet import greenthread
+
+from nova import exception
+from nova import flags
+from nova import roothelper
+from nova import test
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+
+
+class RootHelperTestCase(test.TestCase):
+    def setUp(self):
+        super(RootHelperTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'root-helper.sock')
+        self.server = roothelper.RootHelperServer(path,
+                                                  commands=['echo', 'cat',
+                                                            'false', 'env',
+                                                            'sleep'])
+        self.listener = self.server.listen()
+        self.thread = greenthread.spawn(self.server.serve, self.listener)
+        self.flags(root_helper_socket=path)
+        self.sudo_cmds = []
+
+        def fake_execute_subprocess(cmd, process_input=None, addl_env=None):
+            self.sudo_cmds.append(cmd)
+            return 0, ('sudo', '')
+
+        self.stubs.Set(utils, '_execute_subprocess', fake_execute_subprocess)
+
+    def tearDown(self):
+        self.thread.kill()
+        self.listener.close()
+        shutil.rmtree(self.tmpdir)
+        super(RootHelperTestCase, self).tearDown()
+
+    def test_execute_runs_sudo_commands_with_helper(self):
+        self.assertEqual(('hello\n', ''),
+                         utils.execute('sudo', 'echo', 'hello'))
+        self.assertEqual(('\xff\x00', ''),
+                         utils.execute('sudo', 'cat',
+                                       process_input='\xff\x00'))
+        self.assertEqual([], self.sudo_cmds)
+        stats = roothelper.get_client().get_stats()
+        self.assertEqual(1, stats['echo']['count'])
+        self.assertEqual(1, stats['cat']['count'])
+
+    def test_execute_raises_on_failed_command(self):
+        self.assertRaises(exception.ProcessExecutionError,
+                          utils.execute, 'sudo', 'false')
+
+    def test_commands_not_allowed_run_with_sudo(self):
+        self.assertEqual(('sudo', ''), utils.execute('sudo', 'ls'))
+        self.assertEqual(('sudo', ''), utils.execute('sudo', 'ls'))
+        self.assertEqual([['sudo', 'ls'], ['sudo', 'ls']], self.sudo_cmds)
+        self.assertEqual(set(['ls']), roothelper.get_client().not_allowed)
+
+    def test_commands_run_with_sudo_without_helper(self):
+        client = roothelper.RootHelperClient(os.path.join(self.tmpdir,
+                                                          'missing'))
+        self.stubs.Set(roothelper, 'get_client', lambda: client)
+        self.assertEqual(('sudo', ''), utils.execute('sudo', 'echo'))
+        self.assertEqual([['sudo', 'echo']], self.sudo_cmds)
+
+    def test_commands_with_paths_run_with_sudo(self):
+        self.assertEqual(('sudo', ''), utils.execute('sudo', '/bin/echo'))
+        self.assertEqual([['sudo', '/bin/echo']], self.sudo_cmds)
+        self.assertEqual({'id': None, 'error': 'not_allowed'},
+                         self.server.process({'cmd': ['/tmp/echo']}))
+
+    def test_commands_run_with_allowed_environment(self):
+        stdout, _err = utils.execute('sudo', 'env',
+                                     addl_env={'FLAGFILE': 'nova.conf',
+                                               'LD_PRELOAD': 'evil.so',
+                                               'PATH': '/tmp'})
+        env = dict(line.split('=', 1) for line in stdout.splitlines())
+        self.assertEqual({'FLAGFILE': 'nova.conf',
+                          'PATH': ':'.join(FLAGS.root_helper_path)}, env)
+
+    def test_bad_request_gets_response(self):
+        client = roothelper.get_client()
+        response = client.submit({'input': None}).wait()
+        self.assertEqual('bad_request', response['error'])
+        self.assertRaises(exception.Error, client.execute, [])
+
+    def test_execute_times_out(self):
+        self.flags(root_helper_timeout=0.1)
+        self.assertRaises(roothelper.RootHelperTimeout,
+                          roothelper.get_client().execute, ['sleep', '0.5'])
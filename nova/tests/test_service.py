@@ -99,6 +99,7 @@ class ServiceTestCase(test.TestCase):
     def setUp(self):
         super(ServiceTestCase, self).setUp()
         self.mox.StubOutWithMock(service, 'db')
+        self.mox.StubOutWithMock(db, 'service_heartbeat')
 
     def test_create(self):
         host = 'foo'
@@ -193,10 +194,7 @@ class ServiceTestCase(test.TestCase):
                                       binary).AndRaise(exception.NotFound())
         service.db.service_create(mox.IgnoreArg(),
                                   service_create).AndReturn(service_ref)
-        service.db.service_get(mox.IgnoreArg(),
-                               service_ref['id']).AndReturn(service_ref)
-        service.db.service_update(mox.IgnoreArg(), service_ref['id'],
-                                  mox.ContainsKeyValue('report_count', 1))
+        db.service_heartbeat(mox.IgnoreArg(), service_ref['id'])
 
         self.mox.ReplayAll()
         serv = service.Service(host,
@@ -227,8 +225,8 @@ class ServiceTestCase(test.TestCase):
                                       binary).AndRaise(exception.NotFound())
         service.db.service_create(mox.IgnoreArg(),
                                   service_create).AndReturn(service_ref)
-        service.db.service_get(mox.IgnoreArg(),
-                               mox.IgnoreArg()).AndRaise(Exception())
+        db.service_heartbeat(mox.IgnoreArg(),
+                             mox.IgnoreArg()).AndRaise(Exception())
 
         self.mox.ReplayAll()
         serv = service.Service(host,
@@ -260,10 +258,7 @@ class ServiceTestCase(test.TestCase):
                                       binary).AndRaise(exception.NotFound())
         service.db.service_create(mox.IgnoreArg(),
                                   service_create).AndReturn(service_ref)
-        service.db.service_get(mox.IgnoreArg(),
-                               service_ref['id']).AndReturn(service_ref)
-        service.db.service_update(mox.IgnoreArg(), service_ref['id'],
-                                  mox.ContainsKeyValue('report_count', 1))
+        db.service_heartbeat(mox.IgnoreArg(), service_ref['id'])
 
         self.mox.ReplayAll()
         serv = service.Service(host,
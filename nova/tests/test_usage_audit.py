@@ -0,0 +1,118 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the instance usage audit."""
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+from nova import context
+from nova import db
+from nova import test
+from nova.compute import usage_audit
+from nova.notifier import api as notifier_api
+from nova.notifier import test_notifier
+
+
+class UsageAuditTestCase(test.TestCase):
+    def setUp(self):
+        super(UsageAuditTestCase, self).setUp()
+        self.flags(notification_driver='nova.notifier.test_notifier')
+        test_notifier.NOTIFICATIONS = []
+        self.context = context.get_admin_context()
+        self.tmpdir = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.tmpdir, 'checkpoint')
+        self.begin = datetime.datetime(2011, 8, 1)
+        self.end = datetime.datetime(2011, 9, 1)
+        self.instance_type = db.instance_type_get_by_name(self.context,
+                                                          'm1.tiny')
+        launched = self.begin - datetime.timedelta(days=1)
+        self.ids = [self._create_instance(launched_at=launched)
+                    for i in xrange(5)]
+        # Launched during the period and terminated during the period
+        self._create_instance(launched_at=self.begin)
+        self._create_instance(launched_at=launched,
+                              terminated_at=self.end)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(UsageAuditTestCase, self).tearDown()
+
+    def _create_instance(self, **kwargs):
+        values = {'instance_type_id': self.instance_type['id'],
+                  'project_id': 'fake',
+                  'user_id': 'fake',
+                  'image_ref': '1'}
+        values.update(kwargs)
+        return db.instance_create(self.context, values)['id']
+
+    def _audit(self):
+        return usage_audit.UsageAudit(self.begin, self.end, batch_size=2,
+                                      checkpoint_path=self.checkpoint_path)
+
+    def _sent_ids(self):
+        return [msg['payload']['instance_id']
+                for msg in test_notifier.NOTIFICATIONS]
+
+    def test_run_sends_usage_in_batches(self):
+        batches = []
+        orig_notify_many = notifier_api.notify_many
+
+        def fake_notify_many(*args):
+            batches.append(len(args[3]))
+            return orig_notify_many(*args)
+
+        self.stubs.Set(notifier_api, 'notify_many', fake_notify_many)
+        self.assertEqual(self._audit().run(self.context), 5)
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertEqual(self._sent_ids(), self.ids)
+        payload = test_notifier.NOTIFICATIONS[0]['payload']
+        self.assertEqual(payload['instance_type'], 'm1.tiny')
+        self.assertEqual(payload['audit_period_begining'], str(self.begin))
+        self.assertEqual(test_notifier.NOTIFICATIONS[0]['event_type'],
+                         'compute.instance.exists')
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_run_resumes_from_checkpoint(self):
+        orig_notify_many = notifier_api.notify_many
+        self.calls = 0
+
+        def failing_notify_many(*args):
+            self.calls += 1
+            if self.calls == 2:
+                raise IOError()
+            return orig_notify_many(*args)
+
+        self.stubs.Set(notifier_api, 'notify_many', failing_notify_many)
+        self.assertRaises(IOError, self._audit().run, self.context)
+        with open(self.checkpoint_path) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)['marker'],
+                             self.ids[1])
+
+        self.stubs.Set(notifier_api, 'notify_many', orig_notify_many)
+        self.assertEqual(self._audit().run(self.context), 3)
+        self.assertEqual(self._sent_ids(), self.ids)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_run_ignores_checkpoint_of_other_period(self):
+        with open(self.checkpoint_path, 'w') as checkpoint_file:
+            json.dump({'begin': 'then', 'end': 'later',
+                       'marker': self.ids[3]}, checkpoint_file)
+        self.assertEqual(self._audit().run(self.context), 5)
@@ -306,3 +306,59 @@ class IsUUIDLikeTestCase(test.TestCase):
     def test_non_uuid_string_passed(self):
         val = 'foo-fooo'
         self.assertUUIDLike(val, False)
+
+
+class LRUCacheTestCase(test.TestCase):
+    def tearDown(self):
+        utils.clear_time_override()
+        super(LRUCacheTestCase, self).tearDown()
+
+    def test_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expires_entries(self):
+        utils.set_time_override()
+        cache = utils.LRUCache(10, ttl=30)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=60)
+        utils.advance_time_seconds(45)
+        self.assertFalse('a' in cache)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_delete_and_clear(self):
+        cache = utils.LRUCache(10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.delete('a')
+        cache.delete('missing')
+        self.assertEqual(cache.get('a'), None)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('b'), None)
+
+    def test_hit_rate(self):
+        cache = utils.LRUCache(10)
+        self.assertEqual(cache.hit_rate, 0.0)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hit_rate, 0.75)
+
+    def test_zero_size_disables_cache(self):
+        cache = utils.LRUCache(0)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
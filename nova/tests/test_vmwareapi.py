@@ -30,6 +30,7 @@ from nova.tests.vmwareapi import db_fakes
 from nova.tests.vmwareapi import stubs
 from nova.virt import vmwareapi_conn
 from nova.virt.vmwareapi import fake as vmwareapi_fake
+from nova.virt.vmwareapi import vm_cache as vm_cache_module
 
 
 FLAGS = flags.FLAGS
@@ -245,6 +246,138 @@ class VMWareAPIVMTestCase(test.TestCase):
         self.assertEquals(self.conn.destroy(self.instance, self.network_info),
                           None)
 
+    def _count_vm_listings(self):
+        """Records the RetrieveProperties calls that list every VM."""
+        listings = []
+        orig_retrieve = vmwareapi_fake.FakeVim._retrieve_properties
+
+        def fake_retrieve(vim, method, *args, **kwargs):
+            if kwargs.get("specSet")[0].objectSet[0].obj == "RootFolder":
+                listings.append(method)
+            return orig_retrieve(vim, method, *args, **kwargs)
+
+        self.stubs.Set(vmwareapi_fake.FakeVim, "_retrieve_properties",
+                       fake_retrieve)
+        return listings
+
+    def test_lookups_use_vm_cache(self):
+        self._create_vm()
+        listings = self._count_vm_listings()
+        for i in xrange(3):
+            info = self.conn.get_info(1)
+            self._check_vm_info(info, power_state.RUNNING)
+        self.conn.suspend(self.instance, self.dummy_callback_handler)
+        info = self.conn.get_info(1)
+        self._check_vm_info(info, power_state.PAUSED)
+        self.assertEquals(len(listings), 0)
+
+    def test_vm_cache_expires(self):
+        utils.set_time_override()
+        try:
+            self._create_vm()
+            listings = self._count_vm_listings()
+            utils.advance_time_seconds(FLAGS.vmwareapi_vm_cache_ttl)
+            self.conn.get_info(1)
+            self.conn.get_info(1)
+            self.assertEquals(len(listings), 1)
+        finally:
+            utils.clear_time_override()
+
+    def test_get_info_uses_update_feed(self):
+        self._create_vm()
+        vm_cache = self.conn._vmops._vm_cache
+        vm_cache.wait_for_updates()
+        self.assertTrue(vm_cache.live)
+        retrievals = []
+        self.stubs.Set(vmwareapi_fake.FakeVim, "_retrieve_properties",
+                       lambda *args, **kwargs: retrievals.append(args))
+        info = self.conn.get_info(1)
+        self._check_vm_info(info, power_state.RUNNING)
+
+        vm = vmwareapi_fake._get_objects("VirtualMachine")[0]
+        vm.set("runtime.powerState", "suspended")
+        vm_cache.wait_for_updates()
+        info = self.conn.get_info(1)
+        self._check_vm_info(info, power_state.PAUSED)
+        self.assertEquals(len(retrievals), 0)
+
+    def test_update_feed_tracks_vms(self):
+        vm_cache = self.conn._vmops._vm_cache
+        vm_cache.wait_for_updates()
+        listings = self._count_vm_listings()
+        ds = vmwareapi_fake._get_objects("Datastore")[0]
+        vm = vmwareapi_fake.VirtualMachine(name="vm-1", ds=ds)
+        vmwareapi_fake._create_object("VirtualMachine", vm)
+        vm_cache.wait_for_updates()
+        self.assertEquals(self.conn.list_instances(), ["vm-1"])
+
+        vm.set("name", "vm-2")
+        vm_cache.wait_for_updates()
+        self.assertEquals(self.conn.list_instances(), ["vm-2"])
+        self.assertEquals(vm_cache.get_vm_ref("vm-2"), vm.obj)
+
+        del vmwareapi_fake._db_content["VirtualMachine"][vm.obj]
+        vm_cache.wait_for_updates()
+        self.assertEquals(self.conn.list_instances(), [])
+        self.assertEquals(len(listings), 0)
+
+    def test_update_feed_failure_falls_back_to_refresh(self):
+        vm_cache = self.conn._vmops._vm_cache
+        vm_cache.wait_for_updates()
+        self.assertTrue(vm_cache.live)
+
+        def fake_wait_for_updates(*args, **kwargs):
+            raise Exception("no WaitForUpdatesEx")
+
+        def fake_sleep(seconds):
+            raise StopIteration()
+
+        self.stubs.Set(vmwareapi_fake.FakeVim, "_wait_for_updates",
+                       fake_wait_for_updates)
+        self.stubs.Set(vm_cache_module.greenthread, "sleep", fake_sleep)
+        self.assertRaises(StopIteration, vm_cache._run_feed)
+        self.assertFalse(vm_cache.live)
+        listings = self._count_vm_listings()
+        self.conn.list_instances()
+        self.assertEquals(len(listings), 1)
+
+    def test_update_feed_restart_destroys_filter(self):
+        vm_cache = self.conn._vmops._vm_cache
+        vm_cache.wait_for_updates()
+        destroyed = []
+        destroy_filter = vmwareapi_fake.FakeVim._destroy_filter
+
+        def fake_destroy_filter(vim, method, *args, **kwargs):
+            destroyed.append(args)
+            return destroy_filter(vim, method, *args, **kwargs)
+
+        self.stubs.Set(vmwareapi_fake.FakeVim, "_destroy_filter",
+                       fake_destroy_filter)
+        vm_cache._version = None
+        vm_cache.wait_for_updates()
+        self.assertEquals(destroyed, [("PropFilter",)])
+        self.assertTrue(vm_cache.live)
+
+        def failing_destroy_filter(*args, **kwargs):
+            raise Exception("session expired")
+
+        self.stubs.Set(vmwareapi_fake.FakeVim, "_destroy_filter",
+                       failing_destroy_filter)
+        vm_cache._version = None
+        vm_cache.wait_for_updates()
+        self.assertTrue(vm_cache.live)
+
+    def test_get_info_without_properties(self):
+        self._create_vm()
+        vm_cache = self.conn._vmops._vm_cache
+        vm_cache.wait_for_updates()
+        self.stubs.Set(vm_cache, "get_properties",
+                       lambda vm_ref: {"name": "1"})
+        info = self.conn.get_info(1)
+        self.assertEquals(info["state"], None)
+        self.assertEquals(info["max_mem"], None)
+        self.assertEquals(info["num_cpu"], None)
+
     def test_pause(self):
         pass
 
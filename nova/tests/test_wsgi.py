@@ -18,9 +18,15 @@
 
 """Unit tests for `nova.wsgi`."""
 
+import os
 import os.path
+import signal
 import tempfile
+import time
+import urllib2
 
+import eventlet
+import routes
 import unittest
 
 import nova.exception
@@ -93,3 +99,110 @@ class TestWSGIServer(unittest.TestCase):
         self.assertNotEqual(0, server.port)
         server.stop()
         server.wait()
+
+    def test_workers(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [str(os.getpid())]
+
+        server = nova.wsgi.Server("test_workers", app, host="127.0.0.1",
+                                  workers=2)
+        server.worker_poll_interval = 0.1
+        server.start()
+        self.assertEqual(2, len(server._worker_pids))
+        url = 'http://127.0.0.1:%d/' % server.port
+        pid = int(urllib2.urlopen(url).read())
+        self.assertTrue(pid in server._worker_pids)
+
+        waiter = eventlet.spawn(server.wait)
+        os.kill(pid, signal.SIGKILL)
+        for i in xrange(50):
+            eventlet.sleep(0.1)
+            if (pid not in server._worker_pids and
+                len(server._worker_pids) == 2):
+                break
+        self.assertEqual(2, len(server._worker_pids))
+        self.assertFalse(pid in server._worker_pids)
+        pid = int(urllib2.urlopen(url).read())
+        self.assertTrue(pid in server._worker_pids)
+
+        server.stop()
+        waiter.wait()
+        self.assertEqual(set(), server._worker_pids)
+
+    def test_restart_backs_off_failing_workers(self):
+        server = nova.wsgi.Server("test_backoff", None, workers=2)
+        server._worker_started = {1: time.time(), 2: time.time(),
+                                  3: time.time(),
+                                  4: time.time() - server.worker_min_uptime}
+        self.assertEqual(1, server._schedule_restart(1))
+        self.assertEqual(2, server._schedule_restart(2))
+        self.assertEqual(4, server._schedule_restart(3))
+        self.assertEqual(0, server._schedule_restart(4))
+        server._restart_delay = server.worker_max_restart_delay
+        self.assertEqual(server.worker_max_restart_delay,
+                         server._schedule_restart(5))
+
+    def test_drain_is_bounded(self):
+        server = nova.wsgi.Server("test_drain", None)
+        server.worker_shutdown_timeout = 0.1
+        request = server._pool.spawn(eventlet.sleep, 10)
+        self.assertFalse(server._drain())
+        request.kill()
+        server._pool.spawn(eventlet.sleep, 0)
+        server.worker_shutdown_timeout = 10
+        self.assertTrue(server._drain())
+
+
+class TestIndexedMapper(unittest.TestCase):
+    """IndexedMapper matches URLs as routes.Mapper does."""
+
+    def _connect(self, mapper):
+        mapper.resource("server", "servers", controller="servers",
+                        collection={'detail': 'GET'},
+                        member={'action': 'POST'})
+        mapper.resource("meta", "meta", controller="metadata",
+                        parent_resource=dict(member_name='server',
+                                             collection_name='servers'))
+        mapper.connect("/", controller="versions", action="index")
+        mapper.connect("/limits/:(id)", controller="limits",
+                       action="show", conditions={"method": ["GET"]})
+        mapper.connect("/:(project_id)/images", controller="images",
+                       action="index")
+        mapper.connect("/images:(suffix)", controller="images",
+                       action="suffix")
+
+    def test_matches_like_mapper(self):
+        mapper = routes.Mapper()
+        indexed = nova.wsgi.IndexedMapper()
+        self._connect(mapper)
+        self._connect(indexed)
+        urls = ['/', '/servers', '/servers.json', '/servers/detail',
+                '/servers/1', '/servers/1.xml', '/servers/1/action',
+                '/servers/1/meta', '/servers/1/meta/key.json', '/limits/1',
+                '/p1/images', '/images.json', '/imagesfoo', '/missing',
+                '/servers/1/missing']
+
+        def match(mapper, url, environ=None):
+            result = mapper.routematch(url, environ)
+            return result and (result[0], result[1].routepath)
+
+        for url in urls:
+            self.assertEqual(match(mapper, url), match(indexed, url))
+            for method in ['GET', 'POST', 'PUT', 'DELETE', 'HEAD']:
+                environ = {'REQUEST_METHOD': method}
+                self.assertEqual(match(mapper, url, environ),
+                                 match(indexed, url, environ))
+
+    def test_merge_keeps_conditions(self):
+        mapper = routes.Mapper()
+        mapper.connect("/limits", controller="limits", action="index",
+                       conditions={"method": ["GET"]})
+        mapper.connect("/limits", controller="limits", action="create",
+                       conditions={"method": ["POST"]})
+        indexed = nova.wsgi.IndexedMapper()
+        indexed.connect("/extensions", controller="extensions",
+                        action="index")
+        indexed.merge(mapper)
+        match = indexed.routematch('/limits', {'REQUEST_METHOD': 'POST'})
+        self.assertEqual('create', match[0]['action'])
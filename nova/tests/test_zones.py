@@ -28,6 +28,7 @@ from nova import test
 from nova import rpc
 from nova import utils
 from nova.auth import manager as auth_manager
+from nova.scheduler import api
 from nova.scheduler import zone_manager
 
 FLAGS = flags.FLAGS
@@ -166,6 +167,23 @@ class ZoneManagerTestCase(test.TestCase):
         self.assertEquals(len(zm.zone_states), 1)
         self.assertEquals(zm.zone_states[2].username, 'user2')
 
+    def test_zone_state_to_dict_includes_calls(self):
+        self.stubs.Set(api, '_zone_stats', {})
+        zone_state = zone_manager.ZoneState()
+        zone_state.update_credentials(FakeZone(id=2,
+                       api_url='http://foo.com', username='user2',
+                       password='pass2'))
+        stats = api.get_zone_stats(2)
+        stats.record_call(0.2)
+        for i in xrange(FLAGS.zone_timeouts_to_skip):
+            stats.record_timeout()
+
+        zone = zone_state.to_dict()
+        self.assertFalse(zone['is_active'])
+        self.assertEquals(zone['calls']['calls'],
+                          FLAGS.zone_timeouts_to_skip + 1)
+        self.assertEquals(zone['calls']['latency']['0.5'], 1)
+
     def test_poll_zone(self):
         self.mox.StubOutWithMock(zone_manager, '_call_novaclient')
         zone_manager._call_novaclient(mox.IgnoreArg()).AndReturn(
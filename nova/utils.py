@@ -46,6 +46,7 @@ from eventlet.green import subprocess
 from nova import exception
 from nova import flags
 from nova import log as logging
+from nova import roothelper
 from nova import version
 
 
@@ -140,23 +141,14 @@ def execute(*cmd, **kwargs):
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            env = os.environ.copy()
-            if addl_env:
-                env.update(addl_env)
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   env=env)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
+            helper_result = _execute_with_root_helper(cmd, process_input,
+                                                      addl_env)
+            if helper_result is not None:
+                _returncode, result = helper_result
             else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                _returncode, result = _execute_subprocess(cmd,
+                                                          process_input,
+                                                          addl_env)
             if _returncode:
                 LOG.debug(_('Result was %s') % _returncode)
                 if type(check_exit_code) == types.IntType \
@@ -182,6 +174,48 @@ def execute(*cmd, **kwargs):
             greenthread.sleep(0)
 
 
+def _execute_subprocess(cmd, process_input=None, addl_env=None):
+    LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+    env = os.environ.copy()
+    if addl_env:
+        env.update(addl_env)
+    _PIPE = subprocess.PIPE  # pylint: disable=E1101
+    obj = subprocess.Popen(cmd,
+                           stdin=_PIPE,
+                           stdout=_PIPE,
+                           stderr=_PIPE,
+                           env=env)
+    result = None
+    if process_input is not None:
+        result = obj.communicate(process_input)
+    else:
+        result = obj.communicate()
+    obj.stdin.close()  # pylint: disable=E1101
+    return obj.returncode, result  # pylint: disable=E1101
+
+
+def _execute_with_root_helper(cmd, process_input=None, addl_env=None):
+    """Runs a sudo command with the root helper, if it is configured.
+
+    Returns (exit_code, (stdout, stderr)), or None if the command has to
+    be run with sudo.
+    """
+    if cmd[0] != 'sudo' or len(cmd) < 2:
+        return None
+    client = roothelper.get_client()
+    if client is None or cmd[1] in client.not_allowed:
+        return None
+    LOG.debug(_('Running cmd (root helper): %s'), ' '.join(cmd[1:]))
+    try:
+        return client.execute(cmd[1:], process_input, addl_env)
+    except roothelper.CommandNotAllowed:
+        return None
+    except socket.error, e:
+        LOG.warn(_('Root helper unavailable, running %(cmd)s with sudo: '
+                   '%(e)s') % {'cmd': cmd[1], 'e': e})
+        return None
+
+
 def ssh_execute(ssh, cmd, process_input=None,
                 addl_env=None, check_exit_code=True):
     LOG.debug(_('Running cmd (SSH): %s'), ' '.join(cmd))
@@ -558,7 +592,7 @@ class _NoopContextManager(object):
         pass
 
 
-def synchronized(name, external=False):
+def synchronized(name, external=False, lock_path=None):
     """Synchronization decorator.
 
     Decorating a method like so:
@@ -584,6 +618,9 @@ def synchronized(name, external=False):
     a method decorated with @synchronized('mylock', external=True), only one
     of them will execute at a time.
 
+    External locks are files in lock_path, FLAGS.lock_path by default; pass
+    a directory shared by several hosts to lock across those hosts.
+
     """
 
     def wrap(f):
@@ -603,7 +640,8 @@ def synchronized(name, external=False):
                     LOG.debug(_('Attempting to grab file lock "%(lock)s" for '
                                 'method "%(method)s"...' %
                                 {'lock': name, 'method': f.__name__}))
-                    lock_file_path = os.path.join(FLAGS.lock_path,
+                    lock_file_path = os.path.join(lock_path or
+                                                  FLAGS.lock_path,
                                                   'nova-%s.lock' % name)
                     lock = lockfile.FileLock(lock_file_path)
                 else:
@@ -622,6 +660,93 @@ def synchronized(name, external=False):
     return wrap
 
 
+class LRUCache(object):
+    """A size bounded, least recently used cache with optional expiry.
+
+    Entries older than ttl seconds (or the ttl given to set) are treated as
+    missing.  Lookups are counted in hits and misses so that callers can
+    report how effective the cache is.
+
+    """
+
+    _PREV, _NEXT, _KEY, _VALUE, _EXPIRES = range(5)
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        link = self._links.get(key)
+        return link is not None and not self._expired(link)
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that were answered from the cache."""
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def get(self, key, default=None):
+        link = self._links.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+        if self._expired(link):
+            self._unlink(link)
+            self.misses += 1
+            return default
+        self._unlink(link)
+        self._link_first(link)
+        self.hits += 1
+        return link[self._VALUE]
+
+    def set(self, key, value, ttl=None):
+        if not self.max_size:
+            return
+        if key in self._links:
+            self._unlink(self._links[key])
+        ttl = ttl if ttl is not None else self.ttl
+        expires = utcnow_ts() + ttl if ttl is not None else None
+        self._link_first([None, None, key, value, expires])
+        while len(self._links) > self.max_size:
+            self._unlink(self._root[self._PREV])
+
+    def delete(self, key):
+        link = self._links.get(key)
+        if link is not None:
+            self._unlink(link)
+
+    def clear(self):
+        self._links.clear()
+        self._root[:] = [self._root, self._root, None, None, None]
+
+    def _expired(self, link):
+        expires = link[self._EXPIRES]
+        return expires is not None and utcnow_ts() >= expires
+
+    def _link_first(self, link):
+        first = self._root[self._NEXT]
+        link[self._PREV] = self._root
+        link[self._NEXT] = first
+        first[self._PREV] = link
+        self._root[self._NEXT] = link
+        self._links[link[self._KEY]] = link
+
+    def _unlink(self, link):
+        link[self._PREV][self._NEXT] = link[self._NEXT]
+        link[self._NEXT][self._PREV] = link[self._PREV]
+        del self._links[link[self._KEY]]
+
+
 def get_from_path(items, path):
     """Returns a list of items matching the specified path.
 
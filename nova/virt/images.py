@@ -21,7 +21,11 @@
 Handling of VM disk images.
 """
 
+import hashlib
+import os
+
 from nova import context
+from nova import exception
 from nova import flags
 from nova.image import glance as glance_image_service
 import nova.image
@@ -33,7 +37,24 @@ FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.virt.images')
 
 
+class _ChecksumWriter(object):
+    """Writes image data to a file while computing its md5 checksum."""
+
+    def __init__(self, image_file):
+        self.image_file = image_file
+        self.md5 = hashlib.md5()
+
+    def write(self, data):
+        self.md5.update(data)
+        self.image_file.write(data)
+
+
 def fetch(image_href, path, _user, _project):
+    """Downloads an image to path.
+
+    If the image service reports a checksum for the image, the data is
+    verified against it and the file is removed on mismatch.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -41,5 +62,13 @@ def fetch(image_href, path, _user, _project):
     (image_service, image_id) = nova.image.get_image_service(image_href)
     with open(path, "wb") as image_file:
         elevated = context.get_admin_context()
-        metadata = image_service.get(elevated, image_id, image_file)
+        writer = _ChecksumWriter(image_file)
+        metadata = image_service.get(elevated, image_id, writer)
+    expected = metadata.get('checksum')
+    actual = writer.md5.hexdigest()
+    if expected and expected != actual:
+        os.unlink(path)
+        raise exception.ImageChecksumMismatch(image_id=image_id,
+                                              expected=expected,
+                                              actual=actual)
     return metadata
@@ -44,7 +44,6 @@ import random
 import re
 import shutil
 import subprocess
-import sys
 import tempfile
 import time
 import uuid
@@ -68,12 +67,15 @@ from nova.compute import power_state
 from nova.virt import disk
 from nova.virt import driver
 from nova.virt import images
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import netutils
+from nova.virt.libvirt import resources
 
 
 libvirt = None
 libxml2 = None
 Template = None
+_template_classes = {}
 
 
 LOG = logging.getLogger('nova.virt.libvirt_conn')
@@ -153,6 +155,24 @@ def _late_load_cheetah():
         Template = t.Template
 
 
+def _get_template(path):
+    """Returns the Cheetah class compiled from the template file path.
+
+    Each template is compiled once per process and compiled again only
+    when the file changes.
+    """
+    _late_load_cheetah()
+    stat = os.stat(path)
+    version = (stat.st_mtime, stat.st_size)
+    cached = _template_classes.get(path)
+    if cached is None or cached[0] != version:
+        with open(path) as template_file:
+            source = template_file.read()
+        cached = (version, Template.compile(source=source))
+        _template_classes[path] = cached
+    return cached[1]
+
+
 def _strip_dev(mount_path):
         return re.sub(r'^/dev/', '', mount_path)
 
@@ -163,14 +183,14 @@ class LibvirtConnection(driver.ComputeDriver):
         super(LibvirtConnection, self).__init__()
         self.libvirt_uri = self.get_uri()
 
-        self.libvirt_xml = open(FLAGS.libvirt_xml_template).read()
-        self.cpuinfo_xml = open(FLAGS.cpuinfo_xml_template).read()
         self._wrapped_conn = None
         self.read_only = read_only
 
         fw_class = utils.import_class(FLAGS.firewall_driver)
         self.firewall_driver = fw_class(get_connection=self._get_connection)
         self.vif_driver = utils.import_object(FLAGS.libvirt_vif_driver)
+        self._resources = resources.HostResourceTracker(lambda: self._conn)
+        self._host_stats = {}
 
     def init_host(self, host):
         # Adopt existing VM's running here
@@ -195,6 +215,26 @@ class LibvirtConnection(driver.ComputeDriver):
             self.firewall_driver.prepare_instance_filter(instance)
             self.firewall_driver.apply_instance_filter(instance)
 
+        if FLAGS.image_cache_prefetch:
+            greenthread.spawn(self._prefetch_images)
+
+    def _prefetch_images(self):
+        """Fetches the images in image_cache_prefetch into the base cache.
+
+        Images are cached the way _create_image caches root disks that are
+        extended to minimum_root_size.
+        """
+        cache = imagecache.ImageCache()
+        for image_id in FLAGS.image_cache_prefetch:
+            fname = hashlib.sha1(image_id).hexdigest()
+            LOG.info(_('Prefetching image %s'), image_id)
+            try:
+                cache.fetch(fname, self._fetch_image, image_id=image_id,
+                            user=None, project=None,
+                            size=FLAGS.minimum_root_size)
+            except Exception:
+                LOG.exception(_('Failed to prefetch image %s'), image_id)
+
     def _get_connection(self):
         if not self._wrapped_conn or not self._test_connection():
             LOG.debug(_('Connecting to libvirt: %s'), self.libvirt_uri)
@@ -314,6 +354,8 @@ class LibvirtConnection(driver.ComputeDriver):
             for (network, mapping) in network_info:
                 self.vif_driver.unplug(instance, network, mapping)
 
+        self._resources.remove(instance_name)
+
         def _wait_for_destroy():
             """Called at an interval until the VM is gone."""
             instance_name = instance['name']
@@ -492,6 +534,7 @@ class LibvirtConnection(driver.ComputeDriver):
         self.firewall_driver.setup_basic_filtering(instance)
         self.firewall_driver.prepare_instance_filter(instance)
         self._create_new_domain(xml)
+        self._track_resources(instance)
         self.firewall_driver.apply_instance_filter(instance)
 
         def _wait_for_reboot():
@@ -555,6 +598,7 @@ class LibvirtConnection(driver.ComputeDriver):
                          'ramdisk_id': FLAGS.rescue_ramdisk_id}
         self._create_image(instance, xml, '.rescue', rescue_images)
         self._create_new_domain(xml)
+        self._track_resources(instance)
 
         def _wait_for_rescue():
             """Called at an interval until the VM is running again."""
@@ -601,6 +645,7 @@ class LibvirtConnection(driver.ComputeDriver):
         self._create_image(instance, xml, network_info=network_info,
                            block_device_mapping=block_device_mapping)
         domain = self._create_new_domain(xml)
+        self._track_resources(instance)
         LOG.debug(_("instance %s: is running"), instance['name'])
         self.firewall_driver.apply_instance_filter(instance)
 
@@ -628,6 +673,11 @@ class LibvirtConnection(driver.ComputeDriver):
         timer = utils.LoopingCall(_wait_for_boot)
         return timer.start(interval=0.5, now=True)
 
+    def _track_resources(self, instance):
+        """Records the vcpus and memory of the domain of instance."""
+        self._resources.add(instance['name'], instance['vcpus'],
+                            instance['memory_mb'])
+
     def _flush_xen_console(self, virsh_output):
         LOG.info(_('virsh said: %r'), virsh_output)
         virsh_output = virsh_output[0].strip()
@@ -748,20 +798,13 @@ class LibvirtConnection(driver.ComputeDriver):
         to be unique to a given image.
 
         If cow is True, it will make a CoW image instead of a copy.
+
+        The base image is managed by imagecache.ImageCache and stays
+        referenced for as long as target exists.
         """
         if not os.path.exists(target):
-            base_dir = os.path.join(FLAGS.instances_path, '_base')
-            if not os.path.exists(base_dir):
-                os.mkdir(base_dir)
-            base = os.path.join(base_dir, fname)
-
-            @utils.synchronized(fname)
-            def call_if_not_exists(base, fn, *args, **kwargs):
-                if not os.path.exists(base):
-                    fn(target=base, *args, **kwargs)
-
-            call_if_not_exists(base, fn, *args, **kwargs)
-
+            base = imagecache.ImageCache().fetch(fname, fn, target,
+                                                 *args, **kwargs)
             if cow:
                 utils.execute('qemu-img', 'create', '-f', 'qcow2', '-o',
                               'cluster_size=2M,backing_file=%s' % base,
@@ -879,7 +922,6 @@ class LibvirtConnection(driver.ComputeDriver):
         net = None
 
         nets = []
-        ifc_template = open(FLAGS.injected_network_template).read()
         ifc_num = -1
         have_injected_networks = False
         admin_context = context.get_admin_context()
@@ -911,9 +953,9 @@ class LibvirtConnection(driver.ComputeDriver):
             nets.append(net_info)
 
         if have_injected_networks:
-            net = str(Template(ifc_template,
-                               searchList=[{'interfaces': nets,
-                                            'use_ipv6': FLAGS.use_ipv6}]))
+            ifc_template = _get_template(FLAGS.injected_network_template)
+            net = str(ifc_template(searchList=[{'interfaces': nets,
+                                                'use_ipv6': FLAGS.use_ipv6}]))
 
         if key or net:
             inst_name = inst['name']
@@ -1024,11 +1066,11 @@ class LibvirtConnection(driver.ComputeDriver):
     def to_xml(self, instance, rescue=False, network_info=None,
                block_device_mapping=None):
         block_device_mapping = block_device_mapping or []
-        # TODO(termie): cache?
         LOG.debug(_('instance %s: starting toXML method'), instance['name'])
         xml_info = self._prepare_xml_info(instance, rescue, network_info,
                                           block_device_mapping)
-        xml = str(Template(self.libvirt_xml, searchList=[xml_info]))
+        template = _get_template(FLAGS.libvirt_xml_template)
+        xml = str(template(searchList=[xml_info]))
         LOG.debug(_('instance %s: finished toXML method'), instance['name'])
         return xml
 
@@ -1195,13 +1237,7 @@ class LibvirtConnection(driver.ComputeDriver):
 
         """
 
-        if sys.platform.upper() != 'LINUX2':
-            return 0
-
-        meminfo = open('/proc/meminfo').read().split()
-        idx = meminfo.index('MemTotal:')
-        # transforming kb to mb.
-        return int(meminfo[idx + 1]) / 1024
+        return self._resources.get_memory_mb_total()
 
     def get_local_gb_total(self):
         """Get the total hdd size(GB) of physical computer.
@@ -1223,11 +1259,7 @@ class LibvirtConnection(driver.ComputeDriver):
 
         """
 
-        total = 0
-        for dom_id in self._conn.listDomainsID():
-            dom = self._conn.lookupByID(dom_id)
-            total += len(dom.vcpus()[1])
-        return total
+        return self._resources.get_vcpu_used()
 
     def get_memory_mb_used(self):
         """Get the free memory size(MB) of physical computer.
@@ -1236,15 +1268,7 @@ class LibvirtConnection(driver.ComputeDriver):
 
         """
 
-        if sys.platform.upper() != 'LINUX2':
-            return 0
-
-        m = open('/proc/meminfo').read().split()
-        idx1 = m.index('MemFree:')
-        idx2 = m.index('Buffers:')
-        idx3 = m.index('Cached:')
-        avail = (int(m[idx1 + 1]) + int(m[idx2 + 1]) + int(m[idx3 + 1])) / 1024
-        return  self.get_memory_mb_total() - avail
+        return self._resources.get_memory_mb_used()
 
     def get_local_gb_used(self):
         """Get the free hdd size(GB) of physical computer.
@@ -1432,7 +1456,8 @@ class LibvirtConnection(driver.ComputeDriver):
 
         LOG.info(_('Instance launched has CPU info:\n%s') % cpu_info)
         dic = utils.loads(cpu_info)
-        xml = str(Template(self.cpuinfo_xml, searchList=dic))
+        template = _get_template(FLAGS.cpuinfo_xml_template)
+        xml = str(template(searchList=dic))
         LOG.info(_('to xml...\n:%s ' % xml))
 
         u = "http://libvirt.org/html/libvirt-libvirt.html#virCPUCompareResult"
@@ -1568,6 +1593,7 @@ class LibvirtConnection(driver.ComputeDriver):
                 self.get_info(instance_ref.name)['state']
             except exception.NotFound:
                 timer.stop()
+                self._resources.remove(instance_ref.name)
                 post_method(ctxt, instance_ref, dest)
 
         timer.f = wait_for_live_migration
@@ -1579,12 +1605,36 @@ class LibvirtConnection(driver.ComputeDriver):
                                                network_info=network_info)
 
     def update_host_status(self):
-        """See xenapi_conn.py implementation."""
-        pass
+        """Updates the host stats from the recorded domain resources.
+
+        Memory and disk are reported in bytes, as by xenapi_conn.py.
+
+        """
+        mb = 1024 * 1024
+        memory_total = self.get_memory_mb_total()
+        hddinfo = os.statvfs(FLAGS.instances_path)
+        disk_total = hddinfo.f_frsize * hddinfo.f_blocks
+        disk_available = hddinfo.f_frsize * hddinfo.f_bavail
+        self._host_stats = {
+            'vcpus': self.get_vcpu_total(),
+            'vcpus_used': self.get_vcpu_used(),
+            'host_memory_total': memory_total * mb,
+            'host_memory_free': (memory_total -
+                                 self.get_memory_mb_used()) * mb,
+            'disk_total': disk_total,
+            'disk_used': disk_total - disk_available,
+            'disk_available': disk_available,
+            'hypervisor_type': self.get_hypervisor_type(),
+            'hypervisor_version': self.get_hypervisor_version()}
+        return self._host_stats
 
     def get_host_stats(self, refresh=False):
-        """See xenapi_conn.py implementation."""
-        pass
+        """Return the current state of the host. If 'refresh' is
+        True, run the update first.
+        """
+        if refresh or not self._host_stats:
+            self.update_host_status()
+        return self._host_stats
 
     def set_host_enabled(self, host, enabled):
         """Sets the specified host's ability to accept new instances."""
@@ -0,0 +1,195 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Management of the base images shared by libvirt instances.
+
+Base images live in instances_path/_base.  Next to each base image an
+``<fname>.info`` file records the disks created from it and when it was
+last used.  Those references are what keeps an image from being evicted
+once the cache grows past image_cache_max_size_gb; a reference goes away
+when the disk it names is deleted.
+
+Fetching an image and updating its info file take an external lock per
+image, held in a file of _base/.locks, so compute hosts sharing
+instances_path fetch each image once.
+"""
+
+import json
+import os
+import tempfile
+
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+flags.DECLARE('instances_path', 'nova.compute.manager')
+flags.DEFINE_integer('image_cache_max_size_gb', 0,
+                     'Size of the base image cache in GB, unused images are '
+                     'evicted least recently used first. 0 disables eviction')
+flags.DEFINE_integer('image_cache_min_age', 3600,
+                     'Seconds an unused base image is kept after it was '
+                     'last used')
+flags.DEFINE_list('image_cache_prefetch', [],
+                  'Image ids to fetch into the base image cache when the '
+                  'compute service starts')
+
+LOG = logging.getLogger('nova.virt.libvirt.imagecache')
+
+
+class ImageCache(object):
+    """Fetches, reference counts and evicts base images."""
+
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or os.path.join(FLAGS.instances_path,
+                                                 '_base')
+
+    def path(self, fname):
+        return os.path.join(self.base_dir, fname)
+
+    def _lock_path(self):
+        return os.path.join(self.base_dir, '.locks')
+
+    def _info_path(self, fname):
+        return self.path(fname) + '.info'
+
+    def _read_info(self, fname):
+        try:
+            with open(self._info_path(fname)) as info_file:
+                return json.load(info_file)
+        except (IOError, ValueError):
+            return {'users': [], 'last_used': 0}
+
+    def _write_info(self, fname, info):
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.base_dir,
+                                          prefix='.%s' % fname)
+        with os.fdopen(fd, 'w') as info_file:
+            json.dump(info, info_file)
+        os.rename(tmp_path, self._info_path(fname))
+
+    def fetch(self, fname, fn, referrer=None, *args, **kwargs):
+        """Returns the path of base image fname, creating it if needed.
+
+        fn is called with a target kwarg to create the image.  It writes
+        to a temporary name which is renamed once complete, so a partial
+        image is never used.
+
+        referrer is the path of the disk being created from the image,
+        which holds a reference to it until that disk is deleted.
+        """
+        if not os.path.exists(self._lock_path()):
+            try:
+                os.makedirs(self._lock_path())
+            except OSError:
+                # Another worker may have just created it
+                if not os.path.isdir(self._lock_path()):
+                    raise
+        base = self.path(fname)
+
+        @utils.synchronized(fname, external=True, lock_path=self._lock_path())
+        def fetch_and_reference():
+            if not os.path.exists(base):
+                (fd, partial) = tempfile.mkstemp(dir=self.base_dir,
+                                                 prefix='.%s' % fname)
+                os.close(fd)
+                try:
+                    fn(target=partial, *args, **kwargs)
+                    os.rename(partial, base)
+                finally:
+                    if os.path.exists(partial):
+                        os.unlink(partial)
+            info = self._read_info(fname)
+            if referrer and referrer not in info['users']:
+                info['users'].append(referrer)
+            info['last_used'] = utils.utcnow_ts()
+            self._write_info(fname, info)
+
+        fetch_and_reference()
+        if FLAGS.image_cache_max_size_gb:
+            self.evict(FLAGS.image_cache_max_size_gb * 1024 ** 3)
+        return base
+
+    def _live_users(self, info):
+        return [user for user in info['users'] if os.path.exists(user)]
+
+    def _disk_usage(self, path):
+        # Local disks are sparse, so count the blocks in use rather than
+        # the apparent size
+        try:
+            return os.stat(path).st_blocks * 512
+        except OSError:
+            return 0
+
+    def _base_images(self):
+        """Returns the names of the base images in the cache."""
+        try:
+            names = os.listdir(self.base_dir)
+        except OSError:
+            return []
+        return [name for name in names
+                if not name.startswith('.') and
+                   not name.endswith('.info') and
+                   not name.endswith('.part')]
+
+    def evict(self, max_size):
+        """Removes unused base images until the cache fits in max_size.
+
+        Only images with an info file are considered, images cached before
+        references were recorded are never removed.  Images used within
+        image_cache_min_age seconds are kept too, as the disk referencing
+        them may still be being created.
+        """
+        names = self._base_images()
+        total = sum(self._disk_usage(self.path(name)) for name in names)
+        if total <= max_size:
+            return
+        candidates = []
+        min_last_used = utils.utcnow_ts() - FLAGS.image_cache_min_age
+        for name in names:
+            if not os.path.exists(self._info_path(name)):
+                continue
+            info = self._read_info(name)
+            if info['last_used'] > min_last_used:
+                continue
+            if not self._live_users(info):
+                candidates.append((info['last_used'], name))
+        for _last_used, name in sorted(candidates):
+            if total <= max_size:
+                break
+            total -= self._remove_if_unused(name)
+
+    def _remove_if_unused(self, fname):
+        """Removes base image fname unless it gained a user.
+
+        Returns the number of bytes freed.
+        """
+        @utils.synchronized(fname, external=True, lock_path=self._lock_path())
+        def remove():
+            info = self._read_info(fname)
+            min_last_used = utils.utcnow_ts() - FLAGS.image_cache_min_age
+            if info['last_used'] > min_last_used or self._live_users(info):
+                return 0
+            base = self.path(fname)
+            freed = self._disk_usage(base)
+            LOG.info(_('Evicting unused base image %s'), base)
+            for path in (base, self._info_path(fname)):
+                if os.path.exists(path):
+                    os.unlink(path)
+            return freed
+
+        return remove()
@@ -29,6 +29,7 @@ from nova import exception
 from nova import flags
 from nova import ipv6
 from nova import utils
+from nova.network import api as network_api
 
 
 FLAGS = flags.FLAGS
@@ -52,9 +53,10 @@ def get_ip_version(cidr):
 def get_network_info(instance):
     # TODO(tr3buchet): this function needs to go away! network info
     #                  MUST be passed down from compute
-    # TODO(adiantum) If we will keep this function
-    # we should cache network_info
     admin_context = context.get_admin_context()
+    network_info = network_api.get_cached_nw_info(admin_context, instance)
+    if network_info is not None:
+        return network_info
 
     try:
         fixed_ips = db.fixed_ip_get_by_instance(admin_context, instance['id'])
@@ -0,0 +1,135 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Accounting of the vcpus and memory used on a libvirt host.
+
+The vcpus and memory given to each domain are recorded as domains are
+created and destroyed, so the totals reported by the periodic tasks do not
+have to look every domain up.  The records are reconciled with the domains
+libvirt knows of, and the host memory usage read from /proc/meminfo, once
+every libvirt_resource_reconcile_interval seconds.  Between reconciliations
+the memory in use is the usage read then, adjusted by the memory given to
+or taken from domains since.
+"""
+
+import sys
+
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('libvirt_resource_reconcile_interval', 600,
+                     'Seconds between reconciliations of the vcpus and '
+                     'memory recorded for the domains with libvirt')
+
+LOG = logging.getLogger('nova.virt.libvirt.resources')
+
+
+def read_meminfo():
+    """Returns the fields of /proc/meminfo in MB, keyed by name."""
+    meminfo = {}
+    with open('/proc/meminfo') as meminfo_file:
+        for line in meminfo_file:
+            fields = line.split()
+            if len(fields) >= 2:
+                # transforming kb to mb.
+                meminfo[fields[0].rstrip(':')] = int(fields[1]) / 1024
+    return meminfo
+
+
+class HostResourceTracker(object):
+    """Vcpus and memory given to the domains running on the host."""
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+        self._domains = {}
+        self._reconciled_at = None
+        self._memory_mb_total = None
+        self._host_memory_mb_used = 0
+        self._reconciled_memory_mb = 0
+
+    def _is_linux(self):
+        return sys.platform.upper() == 'LINUX2'
+
+    def add(self, name, vcpus, memory_mb):
+        """Records the vcpus and memory given to domain name."""
+        self._domains[name] = (vcpus or 0, memory_mb or 0)
+
+    def remove(self, name):
+        """Forgets domain name, which has left the host."""
+        self._domains.pop(name, None)
+
+    def _allocated(self):
+        vcpus = 0
+        memory_mb = 0
+        for (domain_vcpus, domain_memory_mb) in self._domains.itervalues():
+            vcpus += domain_vcpus
+            memory_mb += domain_memory_mb
+        return vcpus, memory_mb
+
+    def reconcile(self):
+        """Reads the domains and the host memory usage again."""
+        conn = self._get_connection()
+        domains = {}
+        for dom_id in conn.listDomainsID():
+            dom = conn.lookupByID(dom_id)
+            (_state, max_mem, _mem, num_cpu, _cpu_time) = dom.info()
+            # max_mem is in kb
+            domains[dom.name()] = (num_cpu, max_mem / 1024)
+        self._domains = domains
+
+        if self._is_linux():
+            meminfo = read_meminfo()
+            self._memory_mb_total = meminfo['MemTotal']
+            self._host_memory_mb_used = (meminfo['MemTotal'] -
+                                         meminfo['MemFree'] -
+                                         meminfo['Buffers'] -
+                                         meminfo['Cached'])
+        else:
+            self._memory_mb_total = 0
+            self._host_memory_mb_used = 0
+        self._reconciled_memory_mb = self._allocated()[1]
+        self._reconciled_at = utils.utcnow_ts()
+        LOG.debug(_('Reconciled the resources of %d domains'), len(domains))
+
+    def _reconcile_if_stale(self):
+        if (self._reconciled_at is None or
+            utils.utcnow_ts() - self._reconciled_at >=
+            FLAGS.libvirt_resource_reconcile_interval):
+            self.reconcile()
+
+    def get_vcpu_used(self):
+        self._reconcile_if_stale()
+        return self._allocated()[0]
+
+    def get_memory_mb_total(self):
+        if self._memory_mb_total is None:
+            if self._is_linux():
+                self._memory_mb_total = read_meminfo()['MemTotal']
+            else:
+                self._memory_mb_total = 0
+        return self._memory_mb_total
+
+    def get_memory_mb_used(self):
+        self._reconcile_if_stale()
+        if not self._is_linux():
+            return 0
+        used = (self._host_memory_mb_used + self._allocated()[1] -
+                self._reconciled_memory_mb)
+        return min(max(used, 0), self.get_memory_mb_total())
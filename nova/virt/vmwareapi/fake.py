@@ -476,6 +476,9 @@ class FakeVim(object):
         service_content.rootFolder = "RootFolder"
         service_content.sessionManager = "SessionManager"
         self._service_content = service_content
+        self._filter = None
+        self._filter_version = 0
+        self._filter_contents = {}
 
     def get_service_content(self):
         return self._service_content
@@ -651,6 +654,68 @@ class FakeVim(object):
                 continue
         return lst_ret_objs
 
+    def _create_filter(self, method, *args, **kwargs):
+        """Creates the property filter watched by WaitForUpdatesEx."""
+        spec = kwargs.get("spec")
+        self._filter = (spec.propSet[0].type, spec.propSet[0].pathSet)
+        self._filter_contents = {}
+        return "PropFilter"
+
+    def _destroy_filter(self, method, *args, **kwargs):
+        """Destroys the property filter."""
+        if self._filter is None:
+            raise exception.Error(_("No property filter has been created"))
+        self._filter = None
+
+    def _wait_for_updates(self, method, *args, **kwargs):
+        """
+        Returns the changes to the filtered objects since the version
+        specified, or None if there are none.
+        """
+        if self._filter is None:
+            raise exception.Error(_("No property filter has been created"))
+        if not kwargs.get("version"):
+            self._filter_contents = {}
+        type, properties = self._filter
+        contents = {}
+        for mdo_ref, mdo in _db_content[type].iteritems():
+            contents[mdo_ref] = dict((prop, mdo.get(prop))
+                                     for prop in properties)
+        object_updates = []
+        for mdo_ref, props in contents.iteritems():
+            old_props = self._filter_contents.get(mdo_ref)
+            if old_props == props:
+                continue
+            object_update = DataObject()
+            object_update.obj = mdo_ref
+            object_update.kind = old_props is None and "enter" or "modify"
+            object_update.changeSet = []
+            for name, val in props.iteritems():
+                if old_props is None or old_props.get(name) != val:
+                    change = DataObject()
+                    change.name = name
+                    change.op = "assign"
+                    change.val = val
+                    object_update.changeSet.append(change)
+            object_updates.append(object_update)
+        for mdo_ref in self._filter_contents:
+            if mdo_ref not in contents:
+                object_update = DataObject()
+                object_update.obj = mdo_ref
+                object_update.kind = "leave"
+                object_updates.append(object_update)
+        self._filter_contents = contents
+        if not object_updates:
+            return None
+        self._filter_version += 1
+        filter_update = DataObject()
+        filter_update.filter = "PropFilter"
+        filter_update.objectSet = object_updates
+        update_set = DataObject()
+        update_set.version = str(self._filter_version)
+        update_set.filterSet = [filter_update]
+        return update_set
+
     def _add_port_group(self, method, *args, **kwargs):
         """Adds a port group to the host system."""
         host_mdo = \
@@ -713,6 +778,15 @@ class FakeVim(object):
         elif attr_name == "RetrieveProperties":
             return lambda *args, **kwargs: self._retrieve_properties(
                                                 attr_name, *args, **kwargs)
+        elif attr_name == "CreateFilter":
+            return lambda *args, **kwargs: self._create_filter(attr_name,
+                                                *args, **kwargs)
+        elif attr_name == "DestroyPropertyFilter":
+            return lambda *args, **kwargs: self._destroy_filter(attr_name,
+                                                *args, **kwargs)
+        elif attr_name == "WaitForUpdatesEx":
+            return lambda *args, **kwargs: self._wait_for_updates(
+                                                attr_name, *args, **kwargs)
         elif attr_name == "AcquireCloneTicket":
             return lambda *args, **kwargs: self._just_return()
         elif attr_name == "AddPortGroup":
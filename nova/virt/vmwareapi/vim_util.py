@@ -215,3 +215,37 @@ def get_properties_for_a_collection_of_objects(vim, type,
                                             lst_obj_specs, [prop_spec])
     return vim.RetrieveProperties(vim.get_service_content().propertyCollector,
                                    specSet=[prop_filter_spec])
+
+
+def create_filter(vim, type, properties_to_collect):
+    """
+    Creates a property filter on the property collector for the objects
+    of the type specified, to watch with wait_for_updates.
+    """
+    client_factory = vim.client.factory
+    object_spec = build_object_spec(client_factory,
+                        vim.get_service_content().rootFolder,
+                        [build_recursive_traversal_spec(client_factory)])
+    property_spec = build_property_spec(client_factory, type=type,
+                                properties_to_collect=properties_to_collect)
+    property_filter_spec = build_property_filter_spec(client_factory,
+                                [property_spec],
+                                [object_spec])
+    return vim.CreateFilter(vim.get_service_content().propertyCollector,
+                            spec=property_filter_spec, partialUpdates=False)
+
+
+def destroy_filter(vim, property_filter):
+    """Destroys a property filter made by create_filter."""
+    return vim.DestroyPropertyFilter(property_filter)
+
+
+def wait_for_updates(vim, version, max_wait):
+    """
+    Waits up to max_wait seconds for changes to the objects watched by the
+    filters of the property collector. Returns None if nothing changed.
+    """
+    wait_options = vim.client.factory.create('ns0:WaitOptions')
+    wait_options.maxWaitSeconds = max_wait
+    return vim.WaitForUpdatesEx(vim.get_service_content().propertyCollector,
+                                version=version, options=wait_options)
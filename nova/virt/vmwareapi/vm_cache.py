@@ -0,0 +1,192 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache of the VMs registered with the ESX host.
+
+Looking a VM up by name means retrieving the names of every VM on the
+host, so the references and a few properties of the VMs are kept here.
+The cache is filled by a full retrieval and kept current by a property
+collector filter whose changes are read with WaitForUpdatesEx.  While
+that update feed is not running the cache is refreshed once it is older
+than vmwareapi_vm_cache_ttl seconds.
+"""
+
+from eventlet import greenthread
+
+from nova import flags
+from nova import log as logging
+from nova import utils
+from nova.virt.vmwareapi import vim_util
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('vmwareapi_vm_cache_ttl', 60,
+                     'Seconds the VM cache is used without the update feed '
+                     'before it is refreshed, also the longest wait for '
+                     'updates. Used only if connection_type is vmwareapi')
+flags.DEFINE_boolean('vmwareapi_vm_update_feed', True,
+                     'Keep the VM cache current with WaitForUpdatesEx. '
+                     'Used only if connection_type is vmwareapi')
+
+LOG = logging.getLogger("nova.virt.vmwareapi.vm_cache")
+
+CACHED_PROPERTIES = ["name", "runtime.connectionState",
+                     "runtime.powerState", "summary.config.numCpu",
+                     "summary.config.memorySizeMB"]
+
+
+class VMRefCache(object):
+    """References and property snapshots of the VMs, indexed by name."""
+
+    def __init__(self, session):
+        self._session = session
+        self._props = {}
+        self._refs = {}
+        self._refreshed_at = None
+        self._version = None
+        self._filter = None
+        self._feed = None
+        self.live = False
+
+    def _is_fresh(self):
+        if self.live:
+            return True
+        return (self._refreshed_at is not None and
+                utils.utcnow_ts() - self._refreshed_at <
+                FLAGS.vmwareapi_vm_cache_ttl)
+
+    def refresh(self):
+        """Retrieves the properties of all the VMs on the host."""
+        vms = self._session._call_method(vim_util, "get_objects",
+                     "VirtualMachine", CACHED_PROPERTIES)
+        self._props = {}
+        self._refs = {}
+        for vm in vms:
+            self._props[vm.obj] = dict((prop.name, prop.val)
+                                       for prop in vm.propSet)
+            self._refs[self._props[vm.obj].get("name")] = vm.obj
+        self._refreshed_at = utils.utcnow_ts()
+
+    def get_vm_ref(self, vm_name):
+        """
+        Returns the reference of the VM with the name specified, or None.
+        A name that is not cached causes a refresh, as the VM may have been
+        created since the cache was filled.
+        """
+        if self._is_fresh():
+            vm_ref = self._refs.get(vm_name)
+            if vm_ref is not None:
+                return vm_ref
+        self.refresh()
+        return self._refs.get(vm_name)
+
+    def get_properties(self, vm_ref):
+        """Returns a copy of the cached properties of the VM."""
+        return dict(self._props.get(vm_ref, {}))
+
+    def list_properties(self):
+        """
+        Returns the properties of all the VMs, retrieving them again unless
+        the update feed is running.
+        """
+        if not self.live:
+            self.refresh()
+        return [dict(props) for props in self._props.values()]
+
+    def remove(self, vm_ref):
+        """Drops a VM that has been unregistered."""
+        props = self._props.pop(vm_ref, {})
+        if self._refs.get(props.get("name")) == vm_ref:
+            del self._refs[props["name"]]
+
+    def start(self):
+        """Starts keeping the cache current with the update feed."""
+        if self._feed is None:
+            self._feed = greenthread.spawn(self._run_feed)
+
+    def _run_feed(self):
+        while True:
+            try:
+                self.wait_for_updates()
+            except Exception, excep:
+                # Older hosts do not have WaitForUpdatesEx and the filter
+                # goes with the session, so start over after a while and
+                # refresh the cache on demand until then.
+                LOG.warn(_("VM update feed failed, refreshing the VM cache "
+                           "every %(ttl)s seconds until it is restarted: "
+                           "%(excep)s") %
+                         {'ttl': FLAGS.vmwareapi_vm_cache_ttl,
+                          'excep': excep})
+                self.live = False
+                self._version = None
+                greenthread.sleep(FLAGS.vmwareapi_vm_cache_ttl)
+
+    def wait_for_updates(self):
+        """Waits for changes from the update feed and applies them."""
+        if self._version is None:
+            self._destroy_filter()
+            self._filter = self._session._call_method(vim_util,
+                                "create_filter", "VirtualMachine",
+                                CACHED_PROPERTIES)
+            self._version = ""
+        update_set = self._session._call_method(vim_util,
+                            "wait_for_updates", self._version,
+                            FLAGS.vmwareapi_vm_cache_ttl)
+        if update_set is not None:
+            self._apply_updates(update_set)
+        self.live = True
+
+    def _destroy_filter(self):
+        """
+        Destroys the filter of a failed update feed, if the session it was
+        created in still has it, so that filters do not pile up on the
+        property collector.
+        """
+        if self._filter is None:
+            return
+        try:
+            self._session._call_method(vim_util, "destroy_filter",
+                                       self._filter)
+        except Exception, excep:
+            LOG.debug(_("Could not destroy the VM property filter: %s"),
+                      excep)
+        self._filter = None
+
+    def _apply_updates(self, update_set):
+        if not self._version:
+            # The first update set holds every VM
+            self._props = {}
+            self._refs = {}
+        for filter_update in update_set.filterSet:
+            for object_update in filter_update.objectSet:
+                vm_ref = object_update.obj
+                if object_update.kind == "leave":
+                    self.remove(vm_ref)
+                    continue
+                props = self._props.setdefault(vm_ref, {})
+                old_name = props.get("name")
+                for change in getattr(object_update, "changeSet", []):
+                    if change.op == "remove":
+                        props.pop(change.name, None)
+                    else:
+                        props[change.name] = getattr(change, "val", None)
+                if old_name != props.get("name"):
+                    if self._refs.get(old_name) == vm_ref:
+                        del self._refs[old_name]
+                    self._refs[props.get("name")] = vm_ref
+        self._version = update_set.version
+        self._refreshed_at = utils.utcnow_ts()
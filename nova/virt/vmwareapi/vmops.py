@@ -34,6 +34,7 @@ from nova import log as logging
 from nova import utils
 from nova.compute import power_state
 from nova.virt.vmwareapi import vim_util
+from nova.virt.vmwareapi import vm_cache
 from nova.virt.vmwareapi import vm_util
 from nova.virt.vmwareapi import vmware_images
 from nova.virt.vmwareapi import network_utils
@@ -58,6 +59,12 @@ class VMWareVMOps(object):
         """Initializer."""
         self._session = session
         self._vif_driver = utils.import_object(FLAGS.vmware_vif_driver)
+        self._vm_cache = vm_cache.VMRefCache(session)
+
+    def init_host(self, host):
+        """Starts keeping the VM cache current."""
+        if FLAGS.vmwareapi_vm_update_feed:
+            self._vm_cache.start()
 
     def _wait_with_callback(self, instance_id, task, callback):
         """Waits for the task to finish and does a callback after."""
@@ -71,18 +78,10 @@ class VMWareVMOps(object):
     def list_instances(self):
         """Lists the VM instances that are registered with the ESX host."""
         LOG.debug(_("Getting list of instances"))
-        vms = self._session._call_method(vim_util, "get_objects",
-                     "VirtualMachine",
-                     ["name", "runtime.connectionState"])
         lst_vm_names = []
-        for vm in vms:
-            vm_name = None
-            conn_state = None
-            for prop in vm.propSet:
-                if prop.name == "name":
-                    vm_name = prop.val
-                elif prop.name == "runtime.connectionState":
-                    conn_state = prop.val
+        for props in self._vm_cache.list_properties():
+            vm_name = props.get("name")
+            conn_state = props.get("runtime.connectionState")
             # Ignoring the oprhaned or inaccessible VMs
             if conn_state not in ["orphaned", "inaccessible"]:
                 lst_vm_names.append(vm_name)
@@ -568,6 +567,7 @@ class VMWareVMOps(object):
                 LOG.debug(_("Unregistering the VM %s") % instance.name)
                 self._session._call_method(self._session._get_vim(),
                         "UnregisterVM", vm_ref)
+                self._vm_cache.remove(vm_ref)
                 LOG.debug(_("Unregistered the VM %s") % instance.name)
             except Exception, excep:
                 LOG.warn(_("In vmwareapi:vmops:destroy, got this exception"
@@ -664,21 +664,26 @@ class VMWareVMOps(object):
         lst_properties = ["summary.config.numCpu",
                     "summary.config.memorySizeMB",
                     "runtime.powerState"]
-        vm_props = self._session._call_method(vim_util,
-                    "get_object_properties", None, vm_ref, "VirtualMachine",
-                    lst_properties)
+        if self._vm_cache.live:
+            props = self._vm_cache.get_properties(vm_ref)
+        else:
+            vm_props = self._session._call_method(vim_util,
+                        "get_object_properties", None, vm_ref,
+                        "VirtualMachine", lst_properties)
+            props = {}
+            for elem in vm_props:
+                for prop in elem.propSet:
+                    props[prop.name] = prop.val
         max_mem = None
         pwr_state = None
         num_cpu = None
-        for elem in vm_props:
-            for prop in elem.propSet:
-                if prop.name == "summary.config.numCpu":
-                    num_cpu = int(prop.val)
-                elif prop.name == "summary.config.memorySizeMB":
-                    # In MB, but we want in KB
-                    max_mem = int(prop.val) * 1024
-                elif prop.name == "runtime.powerState":
-                    pwr_state = VMWARE_POWER_STATES[prop.val]
+        if props.get("summary.config.numCpu") is not None:
+            num_cpu = int(props["summary.config.numCpu"])
+        if props.get("summary.config.memorySizeMB") is not None:
+            # In MB, but we want in KB
+            max_mem = int(props["summary.config.memorySizeMB"]) * 1024
+        if props.get("runtime.powerState") is not None:
+            pwr_state = VMWARE_POWER_STATES[props["runtime.powerState"]]
 
         return {'state': pwr_state,
                 'max_mem': max_mem,
@@ -798,12 +803,7 @@ class VMWareVMOps(object):
 
     def _get_vm_ref_from_the_name(self, vm_name):
         """Get reference to the VM with the name specified."""
-        vms = self._session._call_method(vim_util, "get_objects",
-                    "VirtualMachine", ["name"])
-        for vm in vms:
-            if vm.propSet[0].val == vm_name:
-                return vm.obj
-        return None
+        return self._vm_cache.get_vm_ref(vm_name)
 
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
@@ -117,8 +117,7 @@ class VMWareESXConnection(driver.ComputeDriver):
 
     def init_host(self, host):
         """Do the initialization that needs to be done."""
-        # FIXME(sateesh): implement this
-        pass
+        self._vmops.init_host(host)
 
     def list_instances(self):
         """List VM instances."""
@@ -50,7 +50,10 @@ class API(base.Base):
             if not size:
                 size = snapshot['volume_size']
 
-        if quota.allowed_volumes(context, 1, size) < 1:
+        reservations = None
+        if quota.allowed_volumes(context, 1, size) >= 1:
+            reservations = quota.reserve_volumes(context, 1, size)
+        if reservations is None:
             pid = context.project_id
             LOG.warn(_("Quota exceeded for %(pid)s, tried to create"
                     " %(size)sG volume") % locals())
@@ -68,7 +71,10 @@ class API(base.Base):
             'display_name': name,
             'display_description': description}
 
-        volume = self.db.volume_create(context, options)
+        try:
+            volume = self.db.volume_create(context, options)
+        finally:
+            quota.release(context, reservations)
         rpc.cast(context,
                  FLAGS.scheduler_topic,
                  {"method": "create_volume",
@@ -19,14 +19,20 @@
 
 """Utility methods for working with WSGI servers."""
 
+import errno
 import os
+import re
+import signal
 import sys
+import time
 
 from xml.dom import minidom
 
 import eventlet
+import eventlet.hubs
 import eventlet.wsgi
 import greenlet
+import routes
 import routes.middleware
 import webob.dec
 import webob.exc
@@ -46,12 +52,28 @@ FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.wsgi')
 
 
+def _raise_system_exit(signo, frame):
+    raise SystemExit()
+
+
 class Server(object):
     """Server class to manage a WSGI server, serving a WSGI application."""
 
     default_pool_size = 1000
 
-    def __init__(self, name, app, host=None, port=None, pool_size=None):
+    # Seconds between checks that the worker processes are running
+    worker_poll_interval = 1
+
+    # Seconds a stopping worker waits for the requests it is handling
+    worker_shutdown_timeout = 30
+
+    # Workers exiting sooner than this many seconds after they were started
+    # are restarted after a delay doubling up to worker_max_restart_delay
+    worker_min_uptime = 10
+    worker_max_restart_delay = 60
+
+    def __init__(self, name, app, host=None, port=None, pool_size=None,
+                 workers=None):
         """Initialize, but do not start, a WSGI server.
 
         :param name: Pretty name for logging.
@@ -59,6 +81,9 @@ class Server(object):
         :param host: IP address to serve the application.
         :param port: Port number to server the application.
         :param pool_size: Maximum number of eventlets to spawn concurrently.
+        :param workers: Number of worker processes serving the application,
+                        by default the application is served by this
+                        process.
         :returns: None
 
         """
@@ -66,9 +91,15 @@ class Server(object):
         self.app = app
         self.host = host or "0.0.0.0"
         self.port = port or 0
+        self.workers = workers or 1
         self._server = None
         self._tcp_server = None
         self._socket = None
+        self._worker_pids = set()
+        self._worker_started = {}
+        self._restart_times = []
+        self._restart_delay = 0
+        self._stopping = False
         self._pool = eventlet.GreenPool(pool_size or self.default_pool_size)
         self._logger = logging.getLogger("eventlet.wsgi.server")
         self._wsgi_logger = logging.WritableLogger(self._logger)
@@ -87,26 +118,162 @@ class Server(object):
     def start(self, backlog=128):
         """Start serving a WSGI application.
 
+        With several workers, the socket is bound here and shared by worker
+        processes forked to serve it, each with its own pool of eventlets.
+
         :param backlog: Maximum number of queued connections.
         :returns: None
 
         """
         self._socket = eventlet.listen((self.host, self.port), backlog=backlog)
-        self._server = eventlet.spawn(self._start)
         (self.host, self.port) = self._socket.getsockname()
+        if self.workers > 1:
+            for i in xrange(self.workers):
+                self._start_worker()
+        else:
+            self._server = eventlet.spawn(self._start)
         LOG.info(_("Started %(name)s on %(host)s:%(port)s") % self.__dict__)
 
+    def _start_worker(self):
+        """Fork a worker process serving the socket."""
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        LOG.info(_("Started %(name)s worker %(pid)d") %
+                 {'name': self.name, 'pid': pid})
+        self._worker_pids.add(pid)
+        self._worker_started[pid] = time.time()
+
+    def _drain(self):
+        """Wait for the requests being handled to complete.
+
+        :returns: False if they did not within worker_shutdown_timeout.
+
+        """
+        with eventlet.Timeout(self.worker_shutdown_timeout, False):
+            self._pool.waitall()
+            return True
+        return False
+
+    def _run_worker(self):
+        """Serve the socket until SIGTERM, then exit this worker process.
+
+        Requests being handled when SIGTERM is received are given
+        worker_shutdown_timeout seconds to complete.
+
+        """
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, _raise_system_exit)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # The hub of the parent is not shared with its workers
+            eventlet.hubs.use_hub()
+            self._worker_pids = set()
+            self._server = eventlet.spawn(self._start)
+            try:
+                self._server.wait()
+            except SystemExit:
+                self._server.kill()
+                if not self._drain():
+                    LOG.warn(_("%s worker stopped with requests still "
+                               "running"), self.name)
+        except BaseException:
+            LOG.exception(_("%s worker failed"), self.name)
+            status = 1
+        os._exit(status)
+
+    def _reap_workers(self):
+        """Return the pid and status of each worker that has exited."""
+        exited = []
+        for pid in list(self._worker_pids):
+            try:
+                reaped, status = os.waitpid(pid, os.WNOHANG)
+            except OSError, e:
+                if e.errno != errno.ECHILD:
+                    raise
+                reaped, status = pid, 0
+            if reaped:
+                self._worker_pids.remove(pid)
+                exited.append((pid, status))
+        return exited
+
+    def _schedule_restart(self, pid):
+        """Return the seconds to wait before replacing an exited worker.
+
+        Workers which keep exiting right after they are started, for
+        instance because the application fails to load, are restarted with
+        an increasing delay rather than every worker_poll_interval.
+
+        """
+        started = self._worker_started.pop(pid, None)
+        if (started is not None and
+            time.time() - started >= self.worker_min_uptime):
+            self._restart_delay = 0
+        else:
+            self._restart_delay = min(self.worker_max_restart_delay,
+                                      max(self.worker_poll_interval,
+                                          self._restart_delay * 2))
+        self._restart_times.append(time.time() + self._restart_delay)
+        return self._restart_delay
+
+    def _restart_workers(self):
+        """Start the workers whose restart is due."""
+        now = time.time()
+        due = [t for t in self._restart_times if t <= now]
+        self._restart_times = [t for t in self._restart_times if t > now]
+        for t in due:
+            self._start_worker()
+
+    def _supervise(self):
+        """Restart exited workers until they are all stopped.
+
+        SIGTERM stops the workers.
+
+        """
+        old_handler = signal.signal(signal.SIGTERM, _raise_system_exit)
+        try:
+            while self._worker_pids or self._restart_times:
+                try:
+                    eventlet.sleep(self.worker_poll_interval)
+                    for pid, status in self._reap_workers():
+                        if self._stopping:
+                            continue
+                        delay = self._schedule_restart(pid)
+                        LOG.warn(_("%(name)s worker %(pid)d exited with "
+                                   "status %(status)d, restarting in "
+                                   "%(delay)s seconds") %
+                                 {'name': self.name, 'pid': pid,
+                                  'status': status, 'delay': delay})
+                    if not self._stopping:
+                        self._restart_workers()
+                except SystemExit:
+                    self.stop()
+        finally:
+            signal.signal(signal.SIGTERM, old_handler)
+            self._socket.close()
+
     def stop(self):
         """Stop this server.
 
         This is not a very nice action, as currently the method by which a
-        server is stopped is by killing it's eventlet.
+        server is stopped is by killing it's eventlet.  Worker processes
+        are sent SIGTERM and finish the requests they are handling.
 
         :returns: None
 
         """
         LOG.info(_("Stopping WSGI server."))
-        self._server.kill()
+        if self.workers > 1:
+            self._stopping = True
+            self._restart_times = []
+            for pid in self._worker_pids:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError, e:
+                    if e.errno != errno.ESRCH:
+                        raise
+        else:
+            self._server.kill()
         if self._tcp_server is not None:
             LOG.info(_("Stopping raw TCP server."))
             self._tcp_server.kill()
@@ -127,6 +294,9 @@ class Server(object):
         :returns: None
 
         """
+        if self.workers > 1:
+            self._supervise()
+            return
         try:
             self._server.wait()
         except greenlet.GreenletExit:
@@ -310,6 +480,115 @@ class Debug(Middleware):
         print
 
 
+def _path_key(path):
+    """The first segment of path, up to its first '/' or '.'."""
+    return re.split('[/.]', path.lstrip('/'), 1)[0]
+
+
+class IndexedMapper(routes.Mapper):
+    """Mapper matching a URL only against the routes that can match it.
+
+    The routes are indexed by the static text their path starts with, up to
+    its first '/' or '.', and by the request methods they are limited to.
+    Routes whose first path segment is not static are matched against every
+    URL.  The routes are still tried in the order they were connected.
+
+    """
+
+    def create_regs(self, *args, **kwargs):
+        super(IndexedMapper, self).create_regs(*args, **kwargs)
+        self._build_index()
+
+    def merge(self, mapper):
+        """Appends the routes of mapper to the routes of this mapper.
+
+        Unlike extend(), which connects copies of the routes without their
+        conditions, the routes themselves are added.
+
+        """
+        for route in mapper.matchlist:
+            self.matchlist.append(route)
+            self.maxkeys.setdefault(route.maxkeys, []).append(route)
+        self._created_regs = False
+        self._created_gens = False
+
+    @staticmethod
+    def _route_key(route):
+        """The key of the URLs route can match, or None for any URL."""
+        if not route.routelist or not isinstance(route.routelist[0], str):
+            return None
+        start = route.routelist[0]
+        if not start.startswith('/'):
+            return None
+        start = start.lstrip('/')
+        if len(route.routelist) > 1 and not re.search('[/.]', start):
+            return None
+        return _path_key(start)
+
+    @staticmethod
+    def allows(route, method):
+        """Whether route can match requests made with method."""
+        methods = route.conditions and route.conditions.get('method')
+        return not methods or method in methods
+
+    def _build_index(self):
+        keyed = {}
+        unkeyed = []
+        methods = set()
+        for position, route in enumerate(self.matchlist):
+            if route.static:
+                continue
+            key = self._route_key(route)
+            if key is None:
+                unkeyed.append((position, route))
+            else:
+                keyed.setdefault(key, []).append((position, route))
+            if route.conditions:
+                methods.update(route.conditions.get('method') or [])
+
+        routes_by_key = {None: [route for position, route in unkeyed]}
+        for key, key_routes in keyed.iteritems():
+            routes_by_key[key] = [route for position, route
+                                  in sorted(key_routes + unkeyed)]
+        routes_by_method = {}
+        for key, key_routes in routes_by_key.iteritems():
+            for method in methods:
+                routes_by_method[(method, key)] = [
+                        route for route in key_routes
+                        if self.allows(route, method)]
+        self._routes_by_key = routes_by_key
+        self._routes_by_method = routes_by_method
+
+    def _candidates(self, url, environ):
+        key = _path_key(url)
+        if key not in self._routes_by_key:
+            key = None
+        if not environ:
+            return self._routes_by_key[key]
+        method = environ['REQUEST_METHOD']
+        candidates = self._routes_by_method.get((method, key))
+        if candidates is None:
+            candidates = [route for route in self._routes_by_key[key]
+                          if self.allows(route, method)]
+        return candidates
+
+    def _match(self, url, environ):
+        if (not self._created_regs or self.always_scan or self.prefix or
+            self.debug):
+            return super(IndexedMapper, self)._match(url, environ)
+
+        environ = environ or self.environ
+        if not re.match(self._master_regexp, url):
+            return (None, None, [])
+
+        for route in self._candidates(url, environ):
+            match = route.match(url, environ, self.sub_domains,
+                                self.sub_domains_ignore, self.domain_match)
+            if isinstance(match, dict) or match:
+                return (match, route, [])
+        return (None, None, [])
+
+
 class Router(object):
     """WSGI middleware that maps incoming requests to WSGI apps."""
 
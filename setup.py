@@ -129,6 +129,7 @@ setup(name='nova',
                'bin/nova-manage',
                'bin/nova-network',
                'bin/nova-objectstore',
+               'bin/nova-root-helper',
                'bin/nova-scheduler',
                'bin/nova-spoolsentry',
                'bin/stack',